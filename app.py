@@ -2,21 +2,38 @@ from flask import Flask, render_template, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
+import hmac
 import os
 from dotenv import load_dotenv
 from sqlalchemy import inspect, text
 from urllib.parse import quote_plus
 
 # 导入扩展和模型
-from extensions import db, init_extensions
-from models import User, EmotionDiary, EmotionAnalysis, GameState, GameProgress
-from routes import auth_bp, diary_bp, upload_bp
+from extensions import cache, db, init_extensions
+from models import User, EmotionDiary, EmotionAnalysis, GameState, GameProgress, AnalysisJob, LLMCacheEntry, DiarySearchTerm, UserDailyStat, StoredImage
+from routes import auth_bp, diary_bp, upload_bp, analysis_bp, stats_bp, game_bp
+from services.analysis_queue import analysis_queue
+from services.http_client import provider_http
+from services.circuit_breaker import provider_chain
+from services.llm_cache import llm_cache
+from services.search_index import search_index
+from services.stats_rollup import stats_rollup
+from services.snapshot_cache import snapshot_cache
+from services.recent_feed import recent_feed
+from services.image_store import image_store
+from services.image_variants import image_variants
+from services.upload_sessions import upload_sessions
+from services.upload_gc import upload_gc
+from services.json_provider import FastJSONProvider, engine_json_options
+from commands import register_commands
 
 # 加载环境变量
 load_dotenv()
 
 # 创建Flask应用
 app = Flask(__name__)
+# JSON 响应优先使用 orjson / ujson（JSON_PROVIDER 控制）
+app.json = FastJSONProvider(app)
 
 # 基础配置
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
@@ -57,13 +74,50 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_recycle': 3600,
     'pool_pre_ping': True  # 添加连接检查
 }
+# JSON 列用 orjson 解析（已安装时）
+app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(engine_json_options())
+
+# 上传限制：MAX_CONTENT_LENGTH 限制整个请求体（含批量导入），
+# 图片单独受 MAX_UPLOAD_SIZE 限制，接收中的文件放在 UPLOAD_TMP_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+app.config['MAX_UPLOAD_SIZE'] = int(os.getenv('MAX_UPLOAD_SIZE', 5 * 1024 * 1024))
+app.config['UPLOAD_TMP_FOLDER'] = os.getenv('UPLOAD_TMP_FOLDER', 'tmp/uploads')
 
 # 初始化扩展
 init_extensions(app)
 
+# AI分析任务队列（ANALYSIS_WORKERS=0 时只入队，由 flask analysis-worker 单独消费）
+analysis_queue.init_app(app)
+llm_cache.init_app(app)
+search_index.init_app(app)
+stats_rollup.init_app(app)
+snapshot_cache.init_app(app)
+recent_feed.init_app(app)
+image_store.init_app(app)
+image_variants.init_app(app)
+upload_sessions.init_app(app)
+upload_gc.init_app(app)
+register_commands(app)
+
 
 def ensure_schema_updates():
     """Ensure critical schema patches are applied when migrations haven't run."""
+    # 后续新增的表，未执行迁移时自动创建
+    new_tables = [
+        AnalysisJob.__table__,
+        LLMCacheEntry.__table__,
+        DiarySearchTerm.__table__,
+        UserDailyStat.__table__,
+        StoredImage.__table__
+    ]
+
+    # 新建后需要用已有数据回填的表
+    backfills = {
+        DiarySearchTerm.__tablename__: search_index.rebuild,
+        UserDailyStat.__tablename__: stats_rollup.rebuild,
+        StoredImage.__tablename__: image_store.rebuild
+    }
+
     schema_updates = {
         'users': {
             'reset_token': 'VARCHAR(255)',
@@ -71,10 +125,14 @@ def ensure_schema_updates():
         },
         'emotion_diaries': {
             'trigger_event': 'TEXT',
-            'images': 'JSON'
+            'images': 'JSON',
+            'import_key': 'VARCHAR(40)'
         },
         'emotion_analysis': {
             'analysis_payload': 'JSON'
+        },
+        'stored_images': {
+            'variants': 'JSON'
         }
     }
 
@@ -83,6 +141,19 @@ def ensure_schema_updates():
             inspector = inspect(db.engine)
             existing_tables = set(inspector.get_table_names())
 
+            for table in new_tables:
+                # 依赖的表尚不存在时交给 db.create_all() 统一创建
+                referred_tables = {fk.column.table.name for fk in table.foreign_keys}
+                if table.name not in existing_tables and referred_tables <= existing_tables:
+                    table.create(bind=db.engine)
+                    existing_tables.add(table.name)
+                    # 回填依赖日记表，全新数据库无需回填
+                    if table.name in backfills and 'emotion_diaries' in existing_tables:
+                        try:
+                            backfills[table.name]()
+                        except Exception as backfill_error:
+                            app.logger.warning(f"Backfill {table.name} failed: {backfill_error}")
+
             engine_name = db.engine.url.get_backend_name()
 
             for table_name, columns in schema_updates.items():
@@ -108,16 +179,63 @@ def ensure_schema_updates():
                         connection.execute(
                             text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type_sql}')
                         )
+
+            ensure_indexes(inspector, existing_tables)
+
+            if 'emotion_diaries' in existing_tables:
+                search_index.ensure_native_index()
     except Exception as schema_error:
         app.logger.warning(f"Schema check failed: {schema_error}")
 
 
+def ensure_indexes(inspector, existing_tables):
+    """补建模型中声明、但旧库中缺少的索引（按名称判断）"""
+    indexed_tables = [
+        EmotionDiary.__table__,
+        EmotionAnalysis.__table__,
+        GameState.__table__,
+        GameProgress.__table__
+    ]
+
+    for table in indexed_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_names = {index['name'] for index in inspector.get_indexes(table.name)}
+        existing_names |= {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+
+        for index in table.indexes:
+            if index.name in existing_names:
+                continue
+
+            if index.unique:
+                # 已有重复数据时不能建唯一索引，提示人工清理后重启
+                columns = ', '.join(column.name for column in index.columns)
+                with db.engine.connect() as connection:
+                    duplicate = connection.execute(text(
+                        f'SELECT {columns} FROM {table.name} GROUP BY {columns} HAVING COUNT(*) > 1 LIMIT 1'
+                    )).first()
+                if duplicate is not None:
+                    app.logger.warning(
+                        f"Skip unique index {index.name}: duplicate {columns} in {table.name}, e.g. {tuple(duplicate)}"
+                    )
+                    continue
+
+            try:
+                index.create(bind=db.engine)
+            except Exception as index_error:
+                app.logger.warning(f"Create index {index.name} failed: {index_error}")
+
+
 ensure_schema_updates()
 
 # 注册蓝图
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(diary_bp, url_prefix='/api/diary')
 app.register_blueprint(upload_bp, url_prefix='/api')
+app.register_blueprint(analysis_bp, url_prefix='/api/analysis')
+app.register_blueprint(stats_bp, url_prefix='/api/stats')
+app.register_blueprint(game_bp, url_prefix='/api/game')
 
 # 主页路由
 @app.route('/')
@@ -148,6 +266,34 @@ def health_check():
         'version': '1.0.0'
     })
 
+def ops_authorized():
+    """运维接口：请求头 X-Ops-Token 与 OPS_TOKEN 一致时才返回内部细节（未配置 OPS_TOKEN 时一律不返回）"""
+    token = os.getenv('OPS_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Ops-Token', ''), token)
+
+# 大模型服务商连接池使用情况（当前进程）
+@app.route('/api/health/http-pool')
+def http_pool_stats():
+    if not ops_authorized():
+        return jsonify({'status': 'healthy'})
+    return jsonify(provider_http.stats())
+
+# 大模型服务商熔断状态（当前进程）；公开时只返回是否有服务商熔断
+@app.route('/api/health/providers')
+def provider_breaker_stats():
+    stats = provider_chain.stats()
+    if not ops_authorized():
+        degraded = any(provider['state'] != 'closed' for provider in stats['providers'].values())
+        return jsonify({'status': 'degraded' if degraded else 'healthy'})
+    return jsonify(stats)
+
+
+@app.route('/api/health/cache')
+def shared_cache_stats():
+    if not ops_authorized():
+        return jsonify({'status': 'healthy'})
+    return jsonify({'backend': cache.backend_name, 'prefix': cache.prefix})
+
 
 # 页面路由（不需要JWT验证，前端JavaScript会检查登录状态）
 @app.route('/profile')
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+列表接口序列化基准：
+- ORM 路径：查询模型对象 -> to_dict() -> 标准库 JSON
+- 投影路径：按列查询 -> row_to_dict() -> 标准库 JSON
+- 投影 + 加速：同上，JSON 列用 orjson 解析，响应用 FastJSONProvider 编码
+每条路径使用独立的内存 SQLite，只统计查询 + 序列化的 CPU 时间，不经过 HTTP。
+运行: python bench_serialization.py [--rows 2000] [--repeat 20]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from extensions import db
+from models import EmotionAnalysis, EmotionDiary
+from services.json_provider import FastJSONProvider, engine_json_options
+from services.serializers import (
+    ANALYSIS_COLUMNS, DIARY_COLUMNS, analysis_row_to_dict, diary_row_to_dict
+)
+
+TABLES = ['users', 'emotion_diaries', 'emotion_analysis']
+
+
+def create_app(engine_options=None):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options or {}
+    db.init_app(app)
+    return app
+
+
+def seed(rows):
+    db.metadata.create_all(db.engine, tables=[db.metadata.tables[name] for name in TABLES])
+    db.session.execute(db.metadata.tables['users'].insert().values(
+        id=1, username='bench', email='bench@example.com', password_hash='x'
+    ))
+
+    base = datetime(2024, 1, 1)
+    diaries = []
+    analyses = []
+    for index in range(1, rows + 1):
+        created_at = base + timedelta(minutes=index)
+        diaries.append({
+            'id': index,
+            'user_id': 1,
+            'content': '今天和朋友去公园散步，心情慢慢好了起来。' * 5,
+            'emotion_tags': ['calm', 'happy'],
+            'emotion_score': {'calm': 0.6, 'happy': 0.4},
+            'trigger_event': '散步',
+            'images': [],
+            'created_at': created_at,
+            'updated_at': created_at,
+            'analysis_status': 'completed'
+        })
+        analyses.append({
+            'diary_id': index,
+            'overall_emotion': 'calm',
+            'emotion_intensity': 0.6,
+            'emotion_dimensions': {'valence': 0.7, 'arousal': 0.3},
+            'key_words': ['公园', '朋友', '散步'],
+            'confidence_score': 0.9,
+            'analyzed_at': created_at,
+            'ai_model_version': 'bench',
+            'analysis_payload': {'summary': '情绪平稳'}
+        })
+    db.session.execute(EmotionDiary.__table__.insert(), diaries)
+    db.session.execute(EmotionAnalysis.__table__.insert(), analyses)
+    db.session.commit()
+
+
+def orm_path(provider):
+    diaries = EmotionDiary.query.filter_by(user_id=1).order_by(EmotionDiary.created_at.desc()).all()
+    analyses = db.session.query(EmotionAnalysis).join(
+        EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id
+    ).filter(EmotionDiary.user_id == 1).all()
+    body = provider.dumps({
+        'diaries': [diary.to_dict() for diary in diaries],
+        'analyses': [analysis.to_dict() for analysis in analyses]
+    })
+    db.session.expunge_all()
+    return len(body)
+
+
+def projected_path(provider):
+    diaries = db.session.query(*DIARY_COLUMNS).filter(
+        EmotionDiary.user_id == 1
+    ).order_by(EmotionDiary.created_at.desc()).all()
+    analyses = db.session.query(*ANALYSIS_COLUMNS).join(
+        EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id
+    ).filter(EmotionDiary.user_id == 1).all()
+    body = provider.dumps_bytes({
+        'diaries': [diary_row_to_dict(row) for row in diaries],
+        'analyses': [analysis_row_to_dict(row) for row in analyses]
+    })
+    return len(body)
+
+
+def measure(func, provider, repeat):
+    func(provider)  # 预热
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(provider)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    def run(path, engine_options, make_provider):
+        app = create_app(engine_options)
+        with app.app_context():
+            seed(args.rows)
+            return measure(path, make_provider(app), args.repeat)
+
+    orm = run(orm_path, {}, DefaultJSONProvider)
+    projected_stdlib = run(projected_path, {}, lambda app: FastJSONProvider(app, backend='stdlib'))
+    fast_backend = FastJSONProvider(Flask(__name__)).backend
+    projected = run(projected_path, engine_json_options(), FastJSONProvider)
+
+    print(f'{args.rows} 篇日记 + {args.rows} 条分析，{args.repeat} 次取中位数')
+    print(f'ORM + to_dict + 标准库 JSON : {orm * 1000:8.1f} ms')
+    print(f'列投影 + 标准库 JSON        : {projected_stdlib * 1000:8.1f} ms  ({orm / projected_stdlib:.1f}x)')
+    print(f'列投影 + {fast_backend:<18} : {projected * 1000:8.1f} ms  ({orm / projected:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
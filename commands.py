@@ -0,0 +1,114 @@
+"""
+Flask 命令行命令
+使用方式: flask --app app <command>
+"""
+import os
+import socket
+import time
+
+import click
+
+
+def register_commands(app):
+    """注册所有命令行命令"""
+
+    @app.cli.command('analysis-worker')
+    @click.option('--once', is_flag=True, help='队列清空后立即退出')
+    def analysis_worker(once):
+        """独立进程消费AI分析任务队列"""
+        from services.analysis_queue import analysis_queue
+
+        worker_id = f'{socket.gethostname()}:{os.getpid()}:cli'
+        click.echo(f'Analysis worker started: {worker_id}')
+
+        while True:
+            processed = analysis_queue.run_once(worker_id)
+            if not processed:
+                if once:
+                    break
+                time.sleep(analysis_queue.poll_interval)
+
+    @app.cli.command('llm-cache-purge')
+    def llm_cache_purge():
+        """删除已过期的大模型响应缓存（LLM_CACHE_BACKEND=db）"""
+        from services.llm_cache import llm_cache
+
+        click.echo(f'Purged {llm_cache.purge_expired()} expired cache entries')
+
+    @app.cli.command('search-reindex')
+    def search_reindex():
+        """重建日记全文检索索引"""
+        from services.search_index import search_index
+
+        total = search_index.rebuild()
+        click.echo(f'Reindexed {total} diaries')
+
+    @app.cli.command('stats-rebuild')
+    @click.option('--user-id', type=int, default=None, help='只重建指定用户')
+    def stats_rebuild(user_id):
+        """从日记和分析结果重建 user_daily_stats 汇总表"""
+        from services.stats_rollup import stats_rollup
+
+        rows = stats_rollup.rebuild(user_id)
+        click.echo(f'Rebuilt {rows} daily stat rows')
+
+    @app.cli.command('image-refs-rebuild')
+    def image_refs_rebuild():
+        """按日记的 images 重新计算 stored_images 引用计数"""
+        from services.image_store import image_store
+
+        total = image_store.rebuild()
+        click.echo(f'Recounted references for {total} images')
+
+    @app.cli.command('upload-sessions-sweep')
+    def upload_sessions_sweep():
+        """删除过期的分块上传会话和遗留的临时文件"""
+        from services.upload_sessions import upload_sessions
+
+        removed, reclaimed = upload_sessions.sweep()
+        click.echo(f'Removed {removed} expired upload sessions, reclaimed {reclaimed} bytes')
+
+    @app.cli.command('image-variants')
+    @click.option('--all', 'regenerate', is_flag=True, help='重新生成已有缩略图的图片')
+    def image_variants_command(regenerate):
+        """为已上传的图片生成缩略图和 WebP 变体"""
+        from extensions import db
+        from models import StoredImage
+        from services.image_variants import image_variants, variant_formats
+
+        if not image_variants.available:
+            raise click.ClickException('Pillow is not installed')
+
+        query = db.session.query(StoredImage.path)
+        if not regenerate:
+            query = query.filter(StoredImage.variants.is_(None))
+        paths = [path for (path,) in query if variant_formats(path)]
+
+        generated = failed = 0
+        for path in paths:
+            try:
+                image_variants.generate(path)
+                generated += 1
+            except Exception as e:
+                failed += 1
+                click.echo(f'{path}: {e}', err=True)
+        click.echo(f'Generated variants for {generated} images, {failed} failed')
+
+    @app.cli.command('uploads-gc')
+    @click.option('--grace-hours', type=float, default=None, help='只删除早于该小时数的文件（默认 UPLOAD_GC_GRACE_HOURS）')
+    @click.option('--dry-run', is_flag=True, help='只统计，不删除')
+    def uploads_gc(grace_hours, dry_run):
+        """删除 static/uploads 中没有被任何日记引用的图片"""
+        from services.upload_gc import upload_gc
+
+        grace_seconds = None if grace_hours is None else int(grace_hours * 3600)
+        report = upload_gc.run_exclusive(grace_seconds=grace_seconds, dry_run=dry_run)
+        if report is None:
+            raise click.ClickException('Another garbage collection is running')
+
+        action = 'Would delete' if dry_run else 'Deleted'
+        click.echo(
+            f"Scanned {report['scanned']} files: {action} {report['deleted']} "
+            f"({report['reclaimed_bytes']} bytes), kept {report['referenced']} referenced "
+            f"and {report['recent']} within the grace period, {report['errors']} errors"
+        )
@@ -3,15 +3,19 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 
+from services.shared_cache import SharedCache
+
 # 初始化扩展实例
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 cors = CORS()
+cache = SharedCache()
 
 def init_extensions(app):
     """初始化所有扩展"""
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
-    cors.init_app(app)
\ No newline at end of file
+    cors.init_app(app)
+    cache.init_app(app)
\ No newline at end of file
@@ -36,6 +36,12 @@ class User(db.Model):
 class EmotionDiary(db.Model):
     """情绪日记模型"""
     __tablename__ = 'emotion_diaries'
+    __table_args__ = (
+        # 按用户查询并按时间倒序/范围过滤
+        db.Index('ix_emotion_diaries_user_id_created_at', 'user_id', db.text('created_at DESC')),
+        # 首页最新日记流（不按用户过滤）
+        db.Index('ix_emotion_diaries_created_at', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -47,6 +53,7 @@ class EmotionDiary(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     analysis_status = db.Column(db.String(20), default='pending')
+    import_key = db.Column(db.String(40), nullable=True, index=True)  # 批量导入时的行标识，MySQL 用它取回新日记的 ID
 
     # 关联
     analysis = db.relationship('EmotionAnalysis', backref='diary', lazy=True, uselist=False, cascade='all, delete-orphan')
@@ -69,6 +76,11 @@ class EmotionDiary(db.Model):
 class EmotionAnalysis(db.Model):
     """情绪分析结果模型"""
     __tablename__ = 'emotion_analysis'
+    __table_args__ = (
+        # 每篇日记只保留一条分析结果
+        db.Index('uq_emotion_analysis_diary_id', 'diary_id', unique=True),
+        db.Index('ix_emotion_analysis_analyzed_at', 'analyzed_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     diary_id = db.Column(db.Integer, db.ForeignKey('emotion_diaries.id'), nullable=False)
@@ -98,6 +110,10 @@ class EmotionAnalysis(db.Model):
 class GameState(db.Model):
     """游戏状态模型"""
     __tablename__ = 'game_states'
+    __table_args__ = (
+        # 每个用户一条游戏状态
+        db.Index('uq_game_states_user_id', 'user_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -123,6 +139,9 @@ class GameState(db.Model):
 class GameProgress(db.Model):
     """游戏进度模型"""
     __tablename__ = 'game_progress'
+    __table_args__ = (
+        db.Index('ix_game_progress_user_id_challenge_completed', 'user_id', 'challenge_completed'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -145,4 +164,82 @@ class GameProgress(db.Model):
             'alternative_thoughts': self.alternative_thoughts,
             'game_rewards': self.game_rewards,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
-        }
\ No newline at end of file
+        }
+
+class AnalysisJob(db.Model):
+    """AI分析任务队列模型"""
+    __tablename__ = 'analysis_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    diary_id = db.Column(db.Integer, db.ForeignKey('emotion_diaries.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued/running/completed/failed
+    payload = db.Column(db.JSON, default={})  # 分析参数（情绪、触发事件、强度）
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    worker_id = db.Column(db.String(64), nullable=True)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'diary_id': self.diary_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'result': self.result,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class LLMCacheEntry(db.Model):
+    """大模型响应缓存（数据库后端）"""
+    __tablename__ = 'llm_response_cache'
+
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256(model, system, prompt, temperature, max_tokens)
+    value = db.Column(db.Text, nullable=False)  # JSON序列化后的响应
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+class DiarySearchTerm(db.Model):
+    """日记全文检索倒排索引（汉字串和英文单词按 2/3 字符切分的 n-gram 词项）"""
+    __tablename__ = 'diary_search_terms'
+    __table_args__ = (
+        db.Index('ix_diary_search_terms_user_id_term', 'user_id', 'term'),
+    )
+
+    diary_id = db.Column(db.Integer, db.ForeignKey('emotion_diaries.id', ondelete='CASCADE'), primary_key=True)
+    term = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    tf = db.Column(db.Integer, default=1)  # 词项在日记中出现的次数
+
+class UserDailyStat(db.Model):
+    """按用户、日期（UTC）、情绪汇总的统计，随日记和分析结果的写入增量维护"""
+    __tablename__ = 'user_daily_stats'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    emotion = db.Column(db.String(50), primary_key=True, default='')  # '' 行只记录日记数
+    diary_count = db.Column(db.Integer, default=0, nullable=False)  # 当天写的日记数（emotion 为 '' 的行）
+    tag_count = db.Column(db.Integer, default=0, nullable=False)  # 当天带有该情绪标签的日记数
+    analysis_count = db.Column(db.Integer, default=0, nullable=False)  # 当天分析结果为该情绪的数量
+    intensity_sum = db.Column(db.Float, default=0.0, nullable=False)
+    intensity_count = db.Column(db.Integer, default=0, nullable=False)
+
+class StoredImage(db.Model):
+    """static/uploads 下的图片及引用计数（按内容寻址：ab/<sha256>.<ext>）"""
+    __tablename__ = 'stored_images'
+
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), unique=True, nullable=False)  # 相对 static/uploads 的路径
+    sha256 = db.Column(db.String(64), index=True, nullable=True)  # 旧的按时间戳命名的文件为空
+    size = db.Column(db.Integer, nullable=True)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)  # images 中包含该图片的日记数
+    variants = db.Column(db.JSON, nullable=True)  # 已生成的缩略图 {'thumb': {'webp': 路径, 'jpg': 路径}, 'medium': {...}}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
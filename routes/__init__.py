@@ -1,8 +1,11 @@
 # 路由模块初始化
 # 导入路由处理器和蓝图
-from . import auth, diary, upload
+from . import auth, diary, upload, analysis, stats, game
 
 # 导出蓝图
 auth_bp = auth.bp
 diary_bp = diary.bp
-upload_bp = upload.bp
\ No newline at end of file
+upload_bp = upload.bp
+analysis_bp = analysis.bp
+stats_bp = stats.bp
+game_bp = game.bp
\ No newline at end of file
@@ -1,14 +1,21 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import EmotionAnalysis, EmotionDiary, db
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 import json
 import os
 import re
-import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 from dotenv import load_dotenv
+from services.llm_cache import llm_cache, make_cache_key
+from services.http_client import provider_http
+from services.circuit_breaker import provider_chain
+from services.analysis_events import format_sse
+from services.pagination import clamp_limit, keyset_paginate
+from services.serializers import ANALYSIS_COLUMNS, analysis_row_to_dict
+from services.snapshot_cache import snapshot_cache
 
 # 加载环境变量（确保在standalone测试时也能工作）
 load_dotenv()
@@ -83,16 +90,22 @@ class EmotionAnalysisService:
                 'stream': False
             }
 
-            response = requests.post(
+            # 相同请求直接返回缓存结果
+            cache_key = make_cache_key(f'coze:{self.coze_bot_id}', None, payload['query'])
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            response = provider_http.post(
                 f'{self.coze_base_url}/v1/chat/completions',
                 headers=headers,
-                json=payload,
-                timeout=30
+                json=payload
             )
 
             if response.status_code == 200:
-                result = response.json()
-                return self.parse_coze_response(result)
+                result = self.parse_coze_response(response.json())
+                llm_cache.set(cache_key, result)
+                return result
             else:
                 print(f"COZE API调用失败: {response.status_code}")
                 return None
@@ -151,16 +164,22 @@ class EmotionAnalysisService:
                 }
             }
 
-            response = requests.post(
+            messages = payload['input']['messages']
+            cache_key = make_cache_key(self.qwen_model, messages[0]['content'], messages[1]['content'])
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            response = provider_http.post(
                 'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generate',
                 headers=headers,
-                json=payload,
-                timeout=30
+                json=payload
             )
 
             if response.status_code == 200:
-                result = response.json()
-                return self.parse_qwen_response(result)
+                result = self.parse_qwen_response(response.json())
+                llm_cache.set(cache_key, result)
+                return result
             else:
                 print(f"QWEN API调用失败: {response.status_code}")
                 return None
@@ -169,6 +188,49 @@ class EmotionAnalysisService:
             print(f"QWEN API调用异常: {str(e)}")
             return None
 
+    def analyze_emotion(self, text):
+        """
+        依次尝试 COZE、QWEN，最后用本地规则兜底
+        熔断中的服务商直接跳过，远程调用总耗时受 PROVIDER_CHAIN_DEADLINE 限制
+        返回: (分析结果, 服务商名称)
+        """
+        providers = []
+        if self.coze_api_key and self.coze_bot_id:
+            providers.append(('coze', lambda: self.analyze_with_coze(text)))
+        if self.qwen_api_key:
+            providers.append(('qwen', lambda: self.analyze_with_qwen(text)))
+
+        return provider_chain.call(
+            providers,
+            fallback=('fallback', lambda: self.parse_text_emotion(text))
+        )
+
+    def analyze_emotion_many(self, texts, max_workers=None):
+        """
+        并发分析多段文本，texts 为 {键: 文本}
+        按完成顺序产出 (键, 分析结果, 服务商名称)；每个服务商的并发数由 provider_chain 限制
+        """
+        if not texts:
+            return
+
+        max_workers = max_workers or int(os.getenv('BATCH_ANALYSIS_WORKERS', 8))
+        app = current_app._get_current_object()
+
+        def run(text):
+            with app.app_context():
+                return self.analyze_emotion(text)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(texts))) as executor:
+            futures = {executor.submit(run, text): key for key, text in texts.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    analysis_result, provider = future.result()
+                except Exception as e:
+                    print(f"[错误] 批量分析失败 key={key}: {e}", file=sys.stderr)
+                    analysis_result, provider = None, None
+                yield key, analysis_result, provider
+
     def parse_coze_response(self, response_data):
         """解析COZE API响应"""
         try:
@@ -390,13 +452,7 @@ class EmotionAnalysisService:
             return self._fallback_dual_analysis(emotions, trigger_event, intensity, content)
 
         # 准备两个Prompt
-        if get_user_friendly_prompt and get_game_data_prompt:
-            prompt_user = get_user_friendly_prompt(emotions, trigger_event, intensity, content)
-            prompt_game = get_game_data_prompt(emotions, trigger_event, intensity, content)
-        else:
-            # 如果Prompt模块加载失败，使用内置Prompt
-            prompt_user = self._get_default_user_prompt(emotions, trigger_event, intensity, content)
-            prompt_game = self._get_default_game_prompt(emotions, trigger_event, intensity, content)
+        prompt_user, prompt_game = self._build_dual_prompts(emotions, trigger_event, intensity, content)
 
         # 使用线程池并行调用
         with ThreadPoolExecutor(max_workers=2) as executor:
@@ -448,6 +504,51 @@ class EmotionAnalysisService:
 
         return user_message, game_data
 
+    def _build_dual_prompts(self, emotions, trigger_event, intensity, content):
+        """生成用户友好版和游戏数据版两个Prompt"""
+        if get_user_friendly_prompt and get_game_data_prompt:
+            prompt_user = get_user_friendly_prompt(emotions, trigger_event, intensity, content)
+            prompt_game = get_game_data_prompt(emotions, trigger_event, intensity, content)
+        else:
+            # 如果Prompt模块加载失败，使用内置Prompt
+            prompt_user = self._get_default_user_prompt(emotions, trigger_event, intensity, content)
+            prompt_game = self._get_default_game_prompt(emotions, trigger_event, intensity, content)
+        return prompt_user, prompt_game
+
+    def _stream_chatglm_single(self, prompt, max_tokens=1500, temperature=0.8):
+        """流式ChatGLM调用，逐段产出文本（与 _call_chatglm_single 共用缓存）"""
+        system_prompt = get_system_prompt() if get_system_prompt else "你是一位专业的CBT分析师。"
+
+        cache_key = make_cache_key(self.zhipu_model, system_prompt, prompt, temperature, max_tokens)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        response = self.zhipu_client.chat.completions.create(
+            model=self.zhipu_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+
+        parts = []
+        for chunk in response:
+            if not getattr(chunk, 'choices', None):
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+        content = ''.join(parts)
+        if content:
+            llm_cache.set(cache_key, content)
+
     def _call_chatglm_single(self, prompt, max_tokens=2000, temperature=0.7):
         """单次ChatGLM调用"""
         try:
@@ -455,6 +556,14 @@ class EmotionAnalysisService:
 
             # 判断调用类型（根据参数）
             call_type = "用户友好版" if max_tokens == 1500 else "游戏数据版" if max_tokens == 4000 else f"未知({max_tokens})"
+
+            # 日记内容未变时（例如编辑后重新分析）直接复用上次的响应
+            cache_key = make_cache_key(self.zhipu_model, system_prompt, prompt, temperature, max_tokens)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                print(f"[调试] {call_type}命中缓存", file=sys.stderr)
+                return cached
+
             print(f"[调试] 开始{call_type}调用ChatGLM，模型: {self.zhipu_model}, max_tokens: {max_tokens}, temp: {temperature}", file=sys.stderr)
 
             response = self.zhipu_client.chat.completions.create(
@@ -472,6 +581,7 @@ class EmotionAnalysisService:
             print(f"[调试] {call_type}响应长度: {len(content) if content else 0} 字符", file=sys.stderr)
             if content:
                 print(f"[调试] {call_type}响应前100字符: {content[:100]}...", file=sys.stderr)
+                llm_cache.set(cache_key, content)
 
             return content
 
@@ -639,27 +749,7 @@ class EmotionAnalysisService:
             )
 
             # 构建返回结果（兼容前端期望的格式）
-            analysis_result = {
-                # Part 1: 给用户看的温暖消息
-                "user_message": user_message,
-
-                # Part 2: 游戏数值（从game_data提取）
-                "overall_emotion": game_data['emotion_analysis']['primary_emotion'],
-                "emotion_intensity": game_data['emotion_analysis']['emotion_intensity'],
-                "cognitive_distortions": game_data.get('cbt_insights', {}).get('cognitive_distortions', []),
-                "suggestions": self._extract_suggestions_from_user_message(user_message),
-                "recommended_game": game_data.get('recommendations', {}).get('suggested_game', '基础情绪管理'),
-
-                # Part 3: 游戏数值（新增）
-                "game_values": game_data['game_values'],
-                "emotion_analysis": game_data['emotion_analysis'],
-                "challenges": game_data.get('challenges', []),
-                "recommendations": game_data.get('recommendations', {}),
-
-                # 元数据
-                "ai_model_version": f"chatglm-{self.zhipu_model}",
-                "analysis_timestamp": datetime.utcnow().isoformat()
-            }
+            analysis_result = self._build_cbt_result(user_message, game_data)
 
             # 保存到数据库
             self._save_analysis_result(diary_id, analysis_result)
@@ -690,6 +780,82 @@ class EmotionAnalysisService:
                 "analysis_timestamp": datetime.utcnow().isoformat()
             }
 
+    def analyze_cbt_content_stream(self, diary_id, content, emotions, trigger_event, intensity):
+        """
+        流式CBT分析：用户友好消息逐段产出，游戏数值在后台线程并行生成
+        依次产出 ('delta', 文本片段)，最后产出 ('result', 完整分析结果)
+        """
+        emotions = emotions or []
+        trigger_event = trigger_event or ''
+
+        if not self.zhipu_client:
+            user_message, game_data = self._fallback_dual_analysis(emotions, trigger_event, intensity, content)
+            yield ('delta', user_message)
+        else:
+            prompt_user, prompt_game = self._build_dual_prompts(emotions, trigger_event, intensity, content)
+
+            executor = ThreadPoolExecutor(max_workers=1)
+            future_game = executor.submit(
+                self._call_chatglm_single,
+                prompt_game,
+                max_tokens=4000,
+                temperature=0.3
+            )
+
+            try:
+                parts = []
+                try:
+                    for delta in self._stream_chatglm_single(prompt_user, max_tokens=1500, temperature=0.8):
+                        parts.append(delta)
+                        yield ('delta', delta)
+                except Exception as e:
+                    print(f"[错误] 用户友好版流式调用失败: {e}", file=sys.stderr)
+                    if not parts:
+                        fallback_message = "抱歉，AI分析暂时不可用，但你的日记已经安全保存了。"
+                        parts.append(fallback_message)
+                        yield ('delta', fallback_message)
+                user_message = ''.join(parts)
+
+                try:
+                    game_data = self._parse_game_data_json(future_game.result())
+                except Exception as e:
+                    print(f"[错误] 游戏数据版调用失败: {e}", file=sys.stderr)
+                    game_data = None
+            finally:
+                # 客户端提前断开时不阻塞，后台调用完成后自然结束
+                executor.shutdown(wait=False)
+
+            if not game_data:
+                game_data = self._fallback_game_data(emotions, trigger_event, intensity, content)
+
+        analysis_result = self._build_cbt_result(user_message, game_data)
+        self._save_analysis_result(diary_id, analysis_result)
+        yield ('result', analysis_result)
+
+    def _build_cbt_result(self, user_message, game_data):
+        """把用户消息和游戏数值组装为前端期望的分析结果"""
+        return {
+            # Part 1: 给用户看的温暖消息
+            "user_message": user_message,
+
+            # Part 2: 游戏数值（从game_data提取）
+            "overall_emotion": game_data['emotion_analysis']['primary_emotion'],
+            "emotion_intensity": game_data['emotion_analysis']['emotion_intensity'],
+            "cognitive_distortions": game_data.get('cbt_insights', {}).get('cognitive_distortions', []),
+            "suggestions": self._extract_suggestions_from_user_message(user_message),
+            "recommended_game": game_data.get('recommendations', {}).get('suggested_game', '基础情绪管理'),
+
+            # Part 3: 游戏数值（新增）
+            "game_values": game_data['game_values'],
+            "emotion_analysis": game_data['emotion_analysis'],
+            "challenges": game_data.get('challenges', []),
+            "recommendations": game_data.get('recommendations', {}),
+
+            # 元数据
+            "ai_model_version": f"chatglm-{self.zhipu_model}",
+            "analysis_timestamp": datetime.utcnow().isoformat()
+        }
+
     def _extract_suggestions_from_user_message(self, user_message):
         """从用户消息中提取建议列表"""
         # 简单的正则提取（假设消息中有编号列表）
@@ -744,11 +910,10 @@ class EmotionAnalysisService:
             }
         }
 
-        response = requests.post(
+        response = provider_http.post(
             'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation',
             headers=headers,
-            json=payload,
-            timeout=30
+            json=payload
         )
 
         if response.status_code == 200:
@@ -779,11 +944,10 @@ class EmotionAnalysisService:
             'stream': False
         }
 
-        response = requests.post(
+        response = provider_http.post(
             f'{self.coze_base_url}/v1/chat/completions',
             headers=headers,
-            json=payload,
-            timeout=30
+            json=payload
         )
 
         if response.status_code == 200:
@@ -850,13 +1014,20 @@ class EmotionAnalysisService:
             return None
 
         user_prompt = self._build_traditional_cbt_prompt(payload)
+        system_prompt = "你是资深CBT治疗师兼模拟经营游戏设计师，请输出结构化JSON，语言保持中文。"
+
+        cache_key = make_cache_key(self.zhipu_model, system_prompt, user_prompt, 0.6, 2048)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
             response = self.zhipu_client.chat.completions.create(
                 model=self.zhipu_model,
                 messages=[
                     {
                         "role": "system",
-                        "content": "你是资深CBT治疗师兼模拟经营游戏设计师，请输出结构化JSON，语言保持中文。"
+                        "content": system_prompt
                     },
                     {"role": "user", "content": user_prompt}
                 ],
@@ -882,7 +1053,9 @@ class EmotionAnalysisService:
         else:
             parsed_text = content
 
-        return self._parse_json_response(parsed_text)
+        result = self._parse_json_response(parsed_text)
+        llm_cache.set(cache_key, result)
+        return result
 
     def _parse_json_response(self, raw_text):
         if not raw_text:
@@ -1133,22 +1306,8 @@ def analyze_diary(diary_id):
         # 进行情绪分析
         text_content = diary.content
 
-        # 尝试使用COZE API
-        coze_result = emotion_service.analyze_with_coze(text_content)
-
-        # 如果COZE失败，使用QWEN
-        if coze_result:
-            analysis_result = coze_result
-            ai_model_version = 'coze'
-        else:
-            qwen_result = emotion_service.analyze_with_qwen(text_content)
-            if qwen_result:
-                analysis_result = qwen_result
-                ai_model_version = 'qwen'
-            else:
-                # 如果都失败，使用备用分析
-                analysis_result = emotion_service.parse_text_emotion(text_content)
-                ai_model_version = 'fallback'
+        # COZE -> QWEN -> 本地规则，熔断的服务商会被跳过
+        analysis_result, ai_model_version = emotion_service.analyze_emotion(text_content)
 
         if not analysis_result:
             return jsonify({'error': 'Failed to analyze emotion'}), 500
@@ -1192,7 +1351,11 @@ def analyze_diary(diary_id):
 @bp.route('/batch', methods=['POST'])
 @jwt_required()
 def batch_analyze():
-    """批量分析日记"""
+    """
+    批量分析日记
+    一次查询取出日记和已有分析，远程调用并发执行（每个服务商有并发上限），最后一次性写入
+    请求头 Accept: text/event-stream 或参数 ?stream=1 时逐条推送 progress 事件
+    """
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
@@ -1201,37 +1364,66 @@ def batch_analyze():
         if not diary_ids:
             return jsonify({'error': 'No diary IDs provided'}), 400
 
-        results = []
-        for diary_id in diary_ids:
-            # 验证日记所有权
-            diary = EmotionDiary.query.filter_by(id=diary_id, user_id=user_id).first()
-            if not diary:
-                results.append({'diary_id': diary_id, 'status': 'not_found'})
-                continue
+        # 去重并保持顺序
+        diary_ids = list(dict.fromkeys(diary_ids))
 
-            # 检查是否已有分析结果
-            existing_analysis = EmotionAnalysis.query.filter_by(diary_id=diary_id).first()
-            if existing_analysis:
-                results.append({
+        diaries = {
+            diary.id: diary
+            for diary in EmotionDiary.query.filter(
+                EmotionDiary.id.in_(diary_ids),
+                EmotionDiary.user_id == user_id
+            ).all()
+        }
+        existing = {
+            analysis.diary_id: analysis
+            for analysis in EmotionAnalysis.query.filter(
+                EmotionAnalysis.diary_id.in_(list(diaries))
+            ).all()
+        } if diaries else {}
+
+        results = {}
+        texts = {}
+        for diary_id in diary_ids:
+            if diary_id not in diaries:
+                results[diary_id] = {'diary_id': diary_id, 'status': 'not_found'}
+            elif diary_id in existing:
+                results[diary_id] = {
                     'diary_id': diary_id,
                     'status': 'already_analyzed',
-                    'analysis': existing_analysis.to_dict()
-                })
-                continue
-
-            # 进行情绪分析（简化版，实际项目中可以优化为异步处理）
-            text_content = diary.content
-            analysis_result = emotion_service.analyze_with_coze(text_content)
-
-            if not analysis_result:
-                analysis_result = emotion_service.analyze_with_qwen(text_content)
-
-            if not analysis_result:
-                analysis_result = emotion_service.parse_text_emotion(text_content)
+                    'analysis': existing[diary_id].to_dict()
+                }
+            else:
+                # 工作线程只拿到纯文本，不共享 ORM 对象
+                texts[diary_id] = diaries[diary_id].content
+
+        stream = request.args.get('stream') in ('1', 'true') or \
+            request.accept_mimetypes.best == 'text/event-stream'
+
+        def run_batch():
+            total = len(diary_ids)
+            completed = len(results)
+            analyzed = {}
+
+            for diary_id, analysis_result, provider in emotion_service.analyze_emotion_many(texts):
+                completed += 1
+                if analysis_result:
+                    analyzed[diary_id] = analysis_result
+                    status = 'analyzed'
+                else:
+                    results[diary_id] = {'diary_id': diary_id, 'status': 'analysis_failed'}
+                    status = 'analysis_failed'
+                yield {
+                    'diary_id': diary_id,
+                    'status': status,
+                    'provider': provider,
+                    'completed': completed,
+                    'total': total
+                }
 
-            if analysis_result:
-                # 创建分析记录
-                analysis = EmotionAnalysis(
+            # 一次性写入所有分析记录
+            analyses = []
+            for diary_id, analysis_result in analyzed.items():
+                analyses.append(EmotionAnalysis(
                     diary_id=diary_id,
                     overall_emotion=analysis_result.get('overall_emotion', 'neutral'),
                     emotion_intensity=analysis_result.get('emotion_intensity', 0.5),
@@ -1239,11 +1431,10 @@ def batch_analyze():
                     key_words=analysis_result.get('key_words', []),
                     confidence_score=analysis_result.get('confidence_score', 0.5),
                     ai_model_version='batch_analysis'
-                )
-
-                db.session.add(analysis)
+                ))
 
                 # 更新日记状态
+                diary = diaries[diary_id]
                 diary.analysis_status = 'completed'
                 diary.emotion_score = {
                     'overall_emotion': analysis_result.get('overall_emotion', 'neutral'),
@@ -1251,19 +1442,43 @@ def batch_analyze():
                     'confidence_score': analysis_result.get('confidence_score', 0.5)
                 }
 
-                results.append({
-                    'diary_id': diary_id,
+            db.session.add_all(analyses)
+            db.session.commit()
+
+            for analysis in analyses:
+                results[analysis.diary_id] = {
+                    'diary_id': analysis.diary_id,
                     'status': 'analyzed',
                     'analysis': analysis.to_dict()
-                })
-            else:
-                results.append({'diary_id': diary_id, 'status': 'analysis_failed'})
+                }
 
-        db.session.commit()
+        def ordered_results():
+            return [results[diary_id] for diary_id in diary_ids]
+
+        if stream:
+            def generate():
+                try:
+                    for progress in run_batch():
+                        yield format_sse('progress', progress)
+                    yield format_sse('done', {
+                        'message': 'Batch analysis completed',
+                        'results': ordered_results()
+                    })
+                except Exception as e:
+                    db.session.rollback()
+                    yield format_sse('error', {'error': f'Batch analysis failed: {str(e)}'})
+
+            response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+
+        progress = list(run_batch())
 
         return jsonify({
             'message': 'Batch analysis completed',
-            'results': results
+            'results': ordered_results(),
+            'progress': progress
         }), 200
 
     except Exception as e:
@@ -1272,18 +1487,20 @@ def batch_analyze():
 
 @bp.route('/<int:diary_id>', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('analysis')
 def get_analysis(diary_id):
     """获取日记的情绪分析结果"""
     try:
         user_id = get_jwt_identity()
 
-        # 验证日记所有权
-        diary = EmotionDiary.query.filter_by(id=diary_id, user_id=user_id).first()
+        # 验证日记所有权，分析结果通过 JOIN 一起取出
+        diary = EmotionDiary.query.options(
+            joinedload(EmotionDiary.analysis)
+        ).filter_by(id=diary_id, user_id=user_id).first()
         if not diary:
             return jsonify({'error': 'Diary not found'}), 404
 
-        # 获取分析结果
-        analysis = EmotionAnalysis.query.filter_by(diary_id=diary_id).first()
+        analysis = diary.analysis
 
         if not analysis:
             return jsonify({'error': 'Analysis not found'}), 404
@@ -1297,6 +1514,7 @@ def get_analysis(diary_id):
 
 @bp.route('/history', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('analysis-history', vary=('page', 'limit', 'cursor', 'include_total'))
 def get_analysis_history():
     """获取用户的情绪分析历史"""
     try:
@@ -1307,24 +1525,49 @@ def get_analysis_history():
         # 限制每页数量
         limit = min(limit, 100)
 
-        # 查询用户的分析历史
-        query = db.session.query(EmotionAnalysis, EmotionDiary).join(
+        # 只读列表按列查询，跳过 ORM 对象的构造
+        query = db.session.query(*ANALYSIS_COLUMNS, EmotionDiary.content).join(
             EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id
         ).filter(
             EmotionDiary.user_id == user_id
-        ).order_by(EmotionAnalysis.analyzed_at.desc())
+        )
 
-        # 分页
-        results = query.paginate(page=page, per_page=limit, error_out=False)
+        def serialize(row):
+            analysis_data = analysis_row_to_dict(row)
+            analysis_data['diary_content'] = row.content[:100] + '...' if len(row.content) > 100 else row.content
+            return analysis_data
+
+        # 游标模式：?cursor=（首页为空）按 (analyzed_at, id) 继续取，不做 OFFSET 和 COUNT
+        if 'cursor' in request.args:
+            try:
+                rows, next_cursor = keyset_paginate(
+                    query,
+                    EmotionAnalysis.analyzed_at,
+                    EmotionAnalysis.id,
+                    cursor=request.args.get('cursor'),
+                    limit=limit
+                )
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
 
-        analysis_list = []
-        for analysis, diary in results.items:
-            analysis_data = analysis.to_dict()
-            analysis_data['diary_content'] = diary.content[:100] + '...' if len(diary.content) > 100 else diary.content
-            analysis_list.append(analysis_data)
+            pagination = {
+                'per_page': clamp_limit(limit),
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
+            if request.args.get('include_total') in ('1', 'true'):
+                pagination['total'] = query.count()
+
+            return jsonify({
+                'analysis_history': [serialize(row) for row in rows],
+                'pagination': pagination
+            }), 200
+
+        # 分页
+        results = query.order_by(EmotionAnalysis.analyzed_at.desc()).paginate(page=page, per_page=limit, error_out=False)
 
         return jsonify({
-            'analysis_history': analysis_list,
+            'analysis_history': [serialize(row) for row in results.items],
             'pagination': {
                 'page': results.page,
                 'pages': results.pages,
@@ -1,10 +1,39 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import EmotionDiary, db, User
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.orm import joinedload, selectinload
+from models import EmotionDiary, EmotionAnalysis, AnalysisJob, db, User
+from services.analysis_queue import analysis_queue
+from services.diary_export import EXPORT_FORMATS, diary_exporter
+from services.diary_import import IMPORT_FORMATS, diary_importer
+from services.analysis_events import analysis_events, format_sse
+from services.pagination import clamp_limit, keyset_paginate
+from services.recent_feed import recent_feed
+from services.search_index import MAX_PER_PAGE, search_index
+from services.serializers import DIARY_COLUMNS, diary_row_to_dict
+from services.snapshot_cache import snapshot_cache
+from services.stats_rollup import stats_rollup
 from datetime import datetime, timedelta
+import os
+import queue
+import time
 
 bp = Blueprint('diary', __name__)
 
+# 列表接口可选的关联数据及其加载方式
+INCLUDE_LOADERS = {
+    'analysis': selectinload(EmotionDiary.analysis),
+    'game_progress': selectinload(EmotionDiary.game_progress)
+}
+
+def _diary_with_includes(diary, includes):
+    diary_data = diary.to_dict()
+    if 'analysis' in includes:
+        diary_data['analysis'] = diary.analysis.to_dict() if diary.analysis else None
+    if 'game_progress' in includes:
+        diary_data['game_progress'] = [progress.to_dict() for progress in diary.game_progress]
+    return diary_data
+
 @bp.route('/', methods=['GET'])
 @jwt_required()
 def get_diaries():
@@ -17,19 +46,49 @@ def get_diaries():
         # 限制每页数量
         limit = min(limit, 50)
 
-        # 查询用户的日记
-        query = EmotionDiary.query.filter_by(user_id=user_id).order_by(EmotionDiary.created_at.desc())
+        # ?include=analysis,game_progress：加载模型，整页关联数据各用一条 IN 查询批量加载
+        # 不需要关联数据时按列查询，跳过 ORM 对象的构造
+        includes = [name for name in request.args.get('include', '').split(',') if name in INCLUDE_LOADERS]
+        if includes:
+            query = EmotionDiary.query.filter_by(user_id=user_id).options(
+                *[INCLUDE_LOADERS[name] for name in includes]
+            )
+            serialize = lambda diary: _diary_with_includes(diary, includes)
+        else:
+            query = db.session.query(*DIARY_COLUMNS).filter(EmotionDiary.user_id == user_id)
+            serialize = diary_row_to_dict
 
-        # Flask-SQLAlchemy 3.x 需要通过 db.paginate 获取分页结果
-        diaries = db.paginate(
-            query,
-            page=page,
-            per_page=limit,
-            error_out=False
-        )
+        # 游标模式：?cursor=（首页为空）按 (created_at, id) 继续取，不做 OFFSET 和 COUNT
+        if 'cursor' in request.args:
+            try:
+                diaries, next_cursor = keyset_paginate(
+                    query,
+                    EmotionDiary.created_at,
+                    EmotionDiary.id,
+                    cursor=request.args.get('cursor'),
+                    limit=limit
+                )
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+            pagination = {
+                'per_page': clamp_limit(limit),
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }
+            if request.args.get('include_total') in ('1', 'true'):
+                pagination['total'] = query.count()
+
+            return jsonify({
+                'diaries': [serialize(diary) for diary in diaries],
+                'pagination': pagination
+            }), 200
+
+        # 查询用户的日记（与分析历史一样使用 Query.paginate：db.paginate 只返回每行第一列，不能用于按列查询）
+        diaries = query.order_by(EmotionDiary.created_at.desc()).paginate(page=page, per_page=limit, error_out=False)
 
         return jsonify({
-            'diaries': [diary.to_dict() for diary in diaries.items],
+            'diaries': [serialize(diary) for diary in diaries.items],
             'pagination': {
                 'page': diaries.page,
                 'pages': diaries.pages,
@@ -45,27 +104,44 @@ def get_diaries():
 
 @bp.route('/recent', methods=['GET'])
 def get_recent_diaries():
-    """获取最新的日记（公开，用于首页展示）"""
+    """获取最新的日记（公开，用于首页展示；读取预生成的匿名日记流）"""
     try:
-        # 获取最近10条日记（匿名显示）
-        diaries = EmotionDiary.query.order_by(EmotionDiary.created_at.desc()).limit(10).all()
-
-        # 匿名化处理，不显示用户敏感信息
-        result = []
-        for diary in diaries:
-            diary_data = diary.to_dict()
-            # 移除内容中的敏感信息，只显示前100个字符
-            if len(diary_data['content']) > 100:
-                diary_data['content'] = diary_data['content'][:100] + '...'
-            result.append(diary_data)
+        etag, body = recent_feed.get()
 
-        return jsonify({
-            'diaries': result
-        }), 200
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={recent_feed.max_age}'
+        return response.make_conditional(request)
 
     except Exception as e:
         return jsonify({'error': f'Failed to get recent diaries: {str(e)}'}), 500
 
+@bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_diaries():
+    """流式导出用户的全部日记及分析结果（?format=ndjson|csv|json）"""
+    try:
+        user_id = get_jwt_identity()
+        export_format = request.args.get('format', 'ndjson').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format, use one of: {", ".join(EXPORT_FORMATS)}'}), 400
+
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        filename = f'diary-export-{datetime.utcnow().strftime("%Y%m%d")}.{extension}'
+
+        return Response(
+            stream_with_context(diary_exporter.export(user_id, export_format)),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'Cache-Control': 'no-store',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to export diaries: {str(e)}'}), 500
+
 @bp.route('/', methods=['POST'])
 @jwt_required()
 def create_diary():
@@ -106,20 +182,67 @@ def create_diary():
         db.session.rollback()
         return jsonify({'error': f'Failed to create diary: {str(e)}'}), 500
 
+@bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_diaries():
+    """
+    批量导入日记
+    请求体为 NDJSON（Content-Type: application/x-ndjson），或 multipart 上传 file 字段（.ndjson / .csv）
+    ?analyze=1 为导入的日记创建AI分析任务
+    """
+    try:
+        user_id = get_jwt_identity()
+        analyze = request.args.get('analyze') in ('1', 'true')
+
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                return jsonify({'error': 'No file provided'}), 400
+            stream = upload.stream
+            guessed = 'csv' if upload.filename.lower().endswith('.csv') else 'ndjson'
+        else:
+            stream = request.stream
+            guessed = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+
+        import_format = request.args.get('format', guessed).lower()
+        if import_format not in IMPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format, use one of: {", ".join(IMPORT_FORMATS)}'}), 400
+
+        summary = diary_importer.run(
+            user_id,
+            diary_importer.read_entries(stream, import_format),
+            analyze=analyze
+        )
+
+        if summary['error']:
+            return jsonify({'error': f'Import failed: {summary["error"]}', 'summary': summary}), 500
+
+        return jsonify({
+            'message': 'Import finished',
+            'summary': summary
+        }), 201 if summary['imported'] else 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to import diaries: {str(e)}'}), 500
+
 @bp.route('/<int:diary_id>', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('diary-detail')
 def get_diary(diary_id):
     """获取单篇日记详情"""
     try:
         user_id = get_jwt_identity()
 
-        # 查询日记
-        diary = EmotionDiary.query.filter_by(id=diary_id, user_id=user_id).first()
+        # 查询日记，分析结果通过 JOIN 一起取出
+        diary = EmotionDiary.query.options(
+            joinedload(EmotionDiary.analysis)
+        ).filter_by(id=diary_id, user_id=user_id).first()
 
         if not diary:
             return jsonify({'error': 'Diary not found'}), 404
 
-        # 获取关联的分析结果
+        # 关联的分析结果
         diary_data = diary.to_dict()
         if diary.analysis:
             diary_data['analysis'] = diary.analysis.to_dict()
@@ -191,8 +314,11 @@ def delete_diary(diary_id):
     try:
         user_id = get_jwt_identity()
 
-        # 查询日记
-        diary = EmotionDiary.query.filter_by(id=diary_id, user_id=user_id).first()
+        # 查询日记，级联删除用到的分析结果和游戏进度一并加载
+        diary = EmotionDiary.query.options(
+            joinedload(EmotionDiary.analysis),
+            selectinload(EmotionDiary.game_progress)
+        ).filter_by(id=diary_id, user_id=user_id).first()
 
         if not diary:
             return jsonify({'error': 'Diary not found'}), 404
@@ -209,32 +335,74 @@ def delete_diary(diary_id):
         db.session.rollback()
         return jsonify({'error': f'Failed to delete diary: {str(e)}'}), 500
 
+# 在 SQL 中展开 JSON 标签数组的写法，按数据库区分
+TAG_UNNEST_SQL = {
+    'sqlite': 'emotion_diaries AS d, json_each(d.emotion_tags) AS t',
+    'mysql': "emotion_diaries AS d, JSON_TABLE(d.emotion_tags, '$[*]' COLUMNS (value VARCHAR(100) PATH '$')) AS t"
+}
+
+def _diary_tag_stats(user_id, since):
+    """返回 (日记总数, since 之后的数量, {标签: 次数})，只查询一次数据库"""
+    unnest = TAG_UNNEST_SQL.get(db.engine.url.get_backend_name())
+
+    if unnest is None:
+        # 其他数据库：只取标签列在 Python 中计数
+        rows = db.session.query(EmotionDiary.created_at, EmotionDiary.emotion_tags).filter(
+            EmotionDiary.user_id == user_id
+        ).all()
+        emotion_stats = {}
+        for _, tags in rows:
+            for tag in tags or []:
+                emotion_stats[tag] = emotion_stats.get(tag, 0) + 1
+        recent = sum(1 for created_at, _ in rows if created_at and created_at >= since)
+        return len(rows), recent, emotion_stats
+
+    statement = text(f"""
+        SELECT 'total' AS kind, NULL AS tag, COUNT(*) AS count
+        FROM emotion_diaries WHERE user_id = :user_id
+        UNION ALL
+        SELECT 'recent', NULL, COUNT(*)
+        FROM emotion_diaries WHERE user_id = :user_id AND created_at >= :since
+        UNION ALL
+        SELECT 'tag', t.value, COUNT(*)
+        FROM {unnest}
+        WHERE d.user_id = :user_id
+        GROUP BY t.value
+    """).bindparams(
+        bindparam('user_id', int(user_id)),
+        bindparam('since', since, type_=db.DateTime)
+    )
+
+    total = recent = 0
+    emotion_stats = {}
+    for kind, tag, count in db.session.execute(statement):
+        if kind == 'total':
+            total = count
+        elif kind == 'recent':
+            recent = count
+        elif tag is not None:
+            emotion_stats[tag] = count
+
+    return total, recent, emotion_stats
+
 @bp.route('/stats', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('diary-stats')
 def get_diary_stats():
     """获取日记统计信息"""
     try:
         user_id = get_jwt_identity()
 
-        # 计算统计信息
-        total_diaries = EmotionDiary.query.filter_by(user_id=user_id).count()
-
-        # 最近7天的日记数量
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        recent_diaries = EmotionDiary.query.filter(
-            EmotionDiary.user_id == user_id,
-            EmotionDiary.created_at >= seven_days_ago
-        ).count()
-
-        # 按情绪标签统计
-        all_diaries = EmotionDiary.query.filter_by(user_id=user_id).all()
-        emotion_stats = {}
-
-        for diary in all_diaries:
-            for tag in diary.emotion_tags:
-                if tag not in emotion_stats:
-                    emotion_stats[tag] = 0
-                emotion_stats[tag] += 1
+        # 总数、最近7天数量和情绪标签统计在一次查询中完成
+        if stats_rollup.available():
+            # 读取每日汇总（最近7天按 UTC 自然日计，含今天）
+            totals = stats_rollup.totals(user_id, (datetime.utcnow() - timedelta(days=6)).date())
+            total_diaries = totals['total_diaries']
+            recent_diaries = totals['recent_diaries']
+            emotion_stats = totals['tags']
+        else:
+            seven_days_ago = datetime.utcnow() - timedelta(days=7)
+            total_diaries, recent_diaries, emotion_stats = _diary_tag_stats(user_id, seven_days_ago)
 
         user = db.session.get(User, user_id)
         weeks_since_signup = 1
@@ -265,13 +433,12 @@ def search_diaries():
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
 
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PER_PAGE))
+
         # 基础查询
         query = EmotionDiary.query.filter_by(user_id=user_id)
 
-        # 关键词搜索
-        if keyword:
-            query = query.filter(EmotionDiary.content.contains(keyword))
-
         # 情绪标签筛选
         if emotion_tag:
             query = query.filter(EmotionDiary.emotion_tags.contains([emotion_tag]))
@@ -291,12 +458,27 @@ def search_diaries():
             except ValueError:
                 pass
 
-        # 执行查询
-        diaries = query.order_by(EmotionDiary.created_at.desc()).all()
+        # 关键词检索（倒排索引/数据库全文索引，按相关度排序）
+        if keyword:
+            diaries, total = search_index.search(query, user_id, keyword, page=page, per_page=limit)
+        else:
+            total = query.count()
+            diaries = query.order_by(EmotionDiary.created_at.desc()) \
+                .offset((page - 1) * limit).limit(limit).all()
+
+        pages = (total + limit - 1) // limit if limit else 0
 
         return jsonify({
             'diaries': [diary.to_dict() for diary in diaries],
-            'total': len(diaries)
+            'total': total,
+            'pagination': {
+                'page': page,
+                'pages': pages,
+                'per_page': limit,
+                'total': total,
+                'has_prev': page > 1,
+                'has_next': page < pages
+            }
         }), 200
 
     except Exception as e:
@@ -305,10 +487,10 @@ def search_diaries():
 @bp.route('/<int:diary_id>/ai-analyze', methods=['POST'])
 @jwt_required()
 def analyze_diary_with_ai(diary_id):
-    """使用AI分析日记的CBT内容"""
+    """提交AI分析任务（异步执行，立即返回任务ID）"""
     try:
         user_id = get_jwt_identity()
-        data = request.get_json() or {}
+        data = request.get_json(silent=True) or {}
 
         # 查询日记
         diary = EmotionDiary.query.filter_by(id=diary_id, user_id=user_id).first()
@@ -316,56 +498,247 @@ def analyze_diary_with_ai(diary_id):
         if not diary:
             return jsonify({'error': 'Diary not found'}), 404
 
-        # 导入分析服务
+        # 已有排队或执行中的任务时直接返回，避免重复计费
+        active_job = AnalysisJob.query.filter(
+            AnalysisJob.diary_id == diary.id,
+            AnalysisJob.status.in_(['queued', 'running'])
+        ).order_by(AnalysisJob.id.desc()).first()
+
+        if not active_job:
+            # 分析参数，未提供的字段由工作线程从日记中读取
+            payload = {
+                key: data[key]
+                for key in ('emotions', 'trigger_event', 'intensity')
+                if data.get(key) is not None
+            }
+            active_job = analysis_queue.enqueue(diary, payload)
+            db.session.commit()
+            analysis_events.publish(diary.id, 'queued', job_id=active_job.id)
+            analysis_queue.notify()
+
+        return jsonify({
+            'message': 'Analysis queued',
+            'job_id': active_job.id,
+            'status': active_job.status,
+            'job': active_job.to_dict()
+        }), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to analyze diary: {str(e)}'}), 500
+
+def _finish_stream_job(job_id, status, **values):
+    """
+    结束流式分析占用的任务，只有任务仍是本请求的 running 状态时才更新并返回 True
+    （任务超时后可能已被队列重新认领，此时不再改动日记状态）
+    """
+    claimed = db.session.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == job_id, AnalysisJob.status == 'running')
+        .values(status=status, finished_at=datetime.utcnow(), **values)
+    ).rowcount
+    db.session.commit()
+    return bool(claimed)
+
+def _fail_stream_analysis(diary_id, job_id, error):
+    """流式分析未完成：把本请求的任务和日记标记为失败并通知订阅者（可重新提交分析）"""
+    db.session.rollback()
+    if not _finish_stream_job(job_id, 'failed', error=error):
+        return
+    diary = db.session.get(EmotionDiary, diary_id)
+    if diary and diary.analysis_status == 'running':
+        diary.analysis_status = 'failed'
+        db.session.commit()
+    analysis_events.publish(diary_id, 'failed', job_id=job_id, error=error)
+
+@bp.route('/<int:diary_id>/ai-analyze/stream', methods=['POST'])
+@jwt_required()
+def stream_diary_analysis(diary_id):
+    """
+    流式AI分析：以 SSE 逐段返回用户友好消息，游戏数值在后台并行生成
+    与 /ai-analyze 共用任务表：已有排队或执行中的任务时返回 409（客户端改为等待该任务），
+    否则创建一条 running 任务占住这篇日记，队列不会重复调用大模型
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+
+    diary = EmotionDiary.query.filter_by(id=diary_id, user_id=user_id).first()
+    if not diary:
+        return jsonify({'error': 'Diary not found'}), 404
+
+    active_job = AnalysisJob.query.filter(
+        AnalysisJob.diary_id == diary.id,
+        AnalysisJob.status.in_(['queued', 'running'])
+    ).order_by(AnalysisJob.id.desc()).first()
+    if active_job:
+        return jsonify({
+            'error': 'Analysis already in progress',
+            'job_id': active_job.id,
+            'status': active_job.status,
+            'job': active_job.to_dict()
+        }), 409
+
+    from routes.analysis import emotion_service
+
+    analysis_params = {
+        'diary_id': diary.id,
+        'content': diary.content,
+        'emotions': data.get('emotions', diary.emotion_tags),
+        'trigger_event': data.get('trigger_event', diary.trigger_event),
+        'intensity': data.get('intensity', diary.emotion_score.get('intensity') if diary.emotion_score else 5)
+    }
+
+    # 进程崩溃时这条任务超时后会被队列重新放回，由工作线程补做分析
+    now = datetime.utcnow()
+    job = AnalysisJob(
+        diary_id=diary.id,
+        user_id=diary.user_id,
+        status='running',
+        payload={key: analysis_params[key] for key in ('emotions', 'trigger_event', 'intensity')},
+        attempts=1,
+        worker_id=f'stream:{os.getpid()}',
+        run_after=now,
+        started_at=now
+    )
+    db.session.add(job)
+    diary.analysis_status = 'running'
+    db.session.commit()
+    job_id = job.id
+    analysis_events.publish(diary_id, 'running', job_id=job_id)
+
+    def generate():
+        # 客户端中途断开时 Werkzeug 关闭生成器（在 yield 处抛出 GeneratorExit），
+        # 此时分析结果尚未保存，需要在 finally 中结束 running 状态
+        finished = False
         try:
-            from routes.analysis import EmotionAnalysisService
-            analysis_service = EmotionAnalysisService()
-        except ImportError:
-            return jsonify({'error': 'Analysis service not available'}), 500
-
-        # 准备分析数据
-        analysis_data = {
-            'content': diary.content,
-            'emotion_tags': data.get('emotions', diary.emotion_tags),
-            'trigger_event': data.get('trigger_event', diary.trigger_event),
-            'intensity': data.get('intensity', diary.emotion_score.get('intensity') if diary.emotion_score else 5)
+            for kind, value in emotion_service.analyze_cbt_content_stream(**analysis_params):
+                if kind == 'delta':
+                    yield format_sse('delta', {'text': value})
+                    continue
+
+                _finish_stream_job(job_id, 'completed', result=value, error=None)
+                diary = db.session.get(EmotionDiary, diary_id)
+                if diary:
+                    diary.analysis_status = 'completed'
+                    db.session.commit()
+                finished = True
+                analysis = EmotionAnalysis.query.filter_by(diary_id=diary_id).first()
+                analysis_events.publish(
+                    diary_id,
+                    'completed',
+                    job_id=job_id,
+                    analysis=analysis.to_dict() if analysis else None
+                )
+                yield format_sse('result', {'analysis': value})
+
+        except Exception as e:
+            _fail_stream_analysis(diary_id, job_id, str(e))
+            finished = True
+            yield format_sse('error', {'error': 'AI analysis failed', 'message': str(e)})
+
+        finally:
+            if not finished:
+                _fail_stream_analysis(diary_id, job_id, '连接已断开，分析未完成')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
         }
+    )
 
-        # 调用AI分析（CBT专用prompt）
-        try:
-            analysis_result = analysis_service.analyze_cbt_content(
-                diary_id=diary.id,
-                content=analysis_data['content'],
-                emotions=analysis_data['emotion_tags'],
-                trigger_event=analysis_data['trigger_event'],
-                intensity=analysis_data['intensity']
-            )
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_analysis_job(job_id):
+    """查询AI分析任务状态"""
+    try:
+        user_id = get_jwt_identity()
 
-            # 更新日记状态
-            diary.analysis_status = 'completed'
-            db.session.commit()
+        job = AnalysisJob.query.filter_by(id=job_id, user_id=user_id).first()
 
-            return jsonify({
-                'message': 'Analysis completed successfully',
-                'analysis': analysis_result
-            }), 200
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
 
-        except Exception as analysis_error:
-            # AI分析失败，返回友好错误
-            return jsonify({
-                'error': 'AI analysis failed',
-                'message': str(analysis_error),
-                'fallback': {
-                    'overall_emotion': analysis_data['emotion_tags'][0] if analysis_data['emotion_tags'] else '未知',
-                    'emotion_intensity': analysis_data['intensity'] / 10.0,
-                    'suggestions': [
-                        '尝试识别引发这种情绪的具体想法',
-                        '思考这些想法是否有事实依据',
-                        '寻找更平衡的视角看待问题'
-                    ]
-                }
-            }), 200
+        return jsonify({
+            'job': job.to_dict()
+        }), 200
 
     except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Failed to analyze diary: {str(e)}'}), 500
+        return jsonify({'error': f'Failed to get analysis job: {str(e)}'}), 500
+
+# SSE 连接参数：探测间隔内没有事件时只查询状态列并发送心跳
+SSE_PROBE_INTERVAL = int(os.getenv('ANALYSIS_SSE_PROBE_INTERVAL', 15))
+SSE_MAX_DURATION = int(os.getenv('ANALYSIS_SSE_MAX_DURATION', 300))
+FINAL_ANALYSIS_STATUSES = ('completed', 'failed')
+
+def _analysis_state_event(diary_id, status):
+    """构造状态事件，已完成时附带分析结果"""
+    event = {'diary_id': diary_id, 'status': status}
+    if status == 'completed':
+        analysis = EmotionAnalysis.query.filter_by(diary_id=diary_id).first()
+        event['analysis'] = analysis.to_dict() if analysis else None
+    return event
+
+@bp.route('/<int:diary_id>/analysis/events', methods=['GET'])
+@jwt_required()
+def stream_analysis_events(diary_id):
+    """以 Server-Sent Events 推送日记分析状态变化"""
+    user_id = get_jwt_identity()
+
+    diary = EmotionDiary.query.filter_by(id=diary_id, user_id=user_id).first()
+    if not diary:
+        return jsonify({'error': 'Diary not found'}), 404
+
+    # 先订阅再读取当前状态，避免两者之间的状态变化被漏掉
+    subscription = analysis_events.subscribe(diary_id)
+    initial_event = _analysis_state_event(diary_id, diary.analysis_status)
+    db.session.close()
+
+    def generate():
+        try:
+            event = initial_event
+            yield f"retry: 3000\n{format_sse('status', event)}"
+            if event['status'] in FINAL_ANALYSIS_STATUSES:
+                return
+
+            status = event['status']
+            deadline = time.monotonic() + SSE_MAX_DURATION
+            while time.monotonic() < deadline:
+                try:
+                    event = subscription.get(timeout=SSE_PROBE_INTERVAL)
+                except queue.Empty:
+                    # 任务可能在其他进程中执行，只查询状态列兜底
+                    current_status = db.session.execute(
+                        select(EmotionDiary.analysis_status).where(EmotionDiary.id == diary_id)
+                    ).scalar()
+                    if current_status is None:
+                        # 日记已被删除
+                        db.session.close()
+                        return
+                    if current_status == status:
+                        db.session.close()
+                        yield ': keep-alive\n\n'
+                        continue
+                    event = _analysis_state_event(diary_id, current_status)
+                    db.session.close()
+
+                status = event['status']
+                yield format_sse('status', event)
+                if status in FINAL_ANALYSIS_STATUSES:
+                    return
+
+            # 到达最长连接时间，客户端会自动重连
+            yield format_sse('reconnect', {'diary_id': diary_id, 'status': status})
+        finally:
+            analysis_events.unsubscribe(diary_id, subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
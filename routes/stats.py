@@ -1,13 +1,112 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import EmotionDiary, EmotionAnalysis, db
+from sqlalchemy import func, literal_column, select, text
+from services.snapshot_cache import snapshot_cache
+from services.stats_rollup import DEFAULT_EMOTION, stats_rollup
 from datetime import datetime, timedelta
 import json
 
 bp = Blueprint('stats', __name__)
 
+def _local_day(column, tz_offset):
+    """把 UTC 时间列换算为本地日期的 SQL 表达式，不支持的数据库返回 None"""
+    engine_name = db.engine.url.get_backend_name()
+    if engine_name == 'sqlite':
+        return func.date(column, literal_column(f"'{int(tz_offset):+d} minutes'"))
+    if engine_name == 'mysql':
+        return func.date(func.date_add(column, text(f'INTERVAL {int(tz_offset)} MINUTE')))
+    if tz_offset == 0:
+        return func.date(column)
+    return None
+
+def _daily_emotion_trend(user_id, start_date, tz_offset=0):
+    """
+    按本地日期分组：每天的分析数、平均强度和出现最多的情绪
+    分组、平均值和众数都在一条 SQL 中计算，每天只返回一行
+    """
+    day = _local_day(EmotionAnalysis.analyzed_at, tz_offset)
+    filters = (
+        EmotionDiary.user_id == user_id,
+        EmotionAnalysis.analyzed_at >= start_date
+    )
+
+    if day is None:
+        # 其他数据库：只取三列在 Python 中分组
+        rows = db.session.query(
+            EmotionAnalysis.analyzed_at,
+            EmotionAnalysis.overall_emotion,
+            EmotionAnalysis.emotion_intensity
+        ).join(EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id).filter(*filters).all()
+
+        buckets = {}
+        for analyzed_at, emotion, intensity in rows:
+            local_day = (analyzed_at + timedelta(minutes=tz_offset)).date().isoformat()
+            bucket = buckets.setdefault(local_day, {'emotions': {}, 'sum': 0.0, 'n': 0, 'count': 0})
+            emotion = emotion or DEFAULT_EMOTION
+            bucket['emotions'][emotion] = bucket['emotions'].get(emotion, 0) + 1
+            bucket['count'] += 1
+            if intensity is not None:
+                bucket['sum'] += intensity
+                bucket['n'] += 1
+
+        return [
+            {
+                'date': local_day,
+                'emotion': max(bucket['emotions'].items(), key=lambda item: item[1])[0],
+                'intensity': round(bucket['sum'] / bucket['n'], 2) if bucket['n'] else 0,
+                'count': bucket['count']
+            }
+            for local_day, bucket in sorted(buckets.items())
+        ]
+
+    # 没有情绪的分析与汇总表一样计为 DEFAULT_EMOTION，两条路径的众数一致
+    emotion = func.coalesce(func.nullif(EmotionAnalysis.overall_emotion, ''), DEFAULT_EMOTION)
+    per_emotion = select(
+        day.label('day'),
+        emotion.label('emotion'),
+        func.count().label('count'),
+        func.sum(EmotionAnalysis.emotion_intensity).label('intensity_sum'),
+        func.count(EmotionAnalysis.emotion_intensity).label('intensity_count')
+    ).join(
+        EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id
+    ).where(*filters).group_by(day, emotion).subquery()
+
+    by_day = {'partition_by': per_emotion.c.day}
+    ranked = select(
+        per_emotion.c.day,
+        per_emotion.c.emotion,
+        func.row_number().over(
+            order_by=(per_emotion.c.count.desc(), per_emotion.c.emotion), **by_day
+        ).label('rank'),
+        func.sum(per_emotion.c.count).over(**by_day).label('day_count'),
+        func.sum(per_emotion.c.intensity_sum).over(**by_day).label('day_intensity_sum'),
+        func.sum(per_emotion.c.intensity_count).over(**by_day).label('day_intensity_count')
+    ).subquery()
+
+    rows = db.session.execute(
+        select(
+            ranked.c.day,
+            ranked.c.emotion,
+            ranked.c.day_count,
+            ranked.c.day_intensity_sum,
+            ranked.c.day_intensity_count
+        ).where(ranked.c.rank == 1).order_by(ranked.c.day)
+    ).all()
+
+    return [
+        {
+            'date': str(row.day)[:10],
+            'emotion': row.emotion,
+            'intensity': round(float(row.day_intensity_sum) / row.day_intensity_count, 2) if row.day_intensity_count else 0,
+            'count': int(row.day_count)
+        }
+        for row in rows
+    ]
+
 @bp.route('/emotion-trend', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('emotion-trend', vary=('days', 'tz_offset'))
 def get_emotion_trend():
     """获取情绪趋势统计"""
     try:
@@ -18,44 +117,16 @@ def get_emotion_trend():
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
 
-        # 查询日期范围内的分析结果
-        analyses = db.session.query(EmotionAnalysis, EmotionDiary).join(
-            EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id
-        ).filter(
-            EmotionDiary.user_id == user_id,
-            EmotionAnalysis.analyzed_at >= start_date
-        ).all()
+        # 用户本地时区相对 UTC 的分钟数（东八区为 480），按本地自然日分桶
+        tz_offset = request.args.get('tz_offset', 0, type=int)
+        if not -14 * 60 <= tz_offset <= 14 * 60:
+            return jsonify({'error': 'tz_offset must be between -840 and 840 minutes'}), 400
 
-        # 按日期分组统计
-        daily_emotions = {}
-        for analysis, diary in analyses:
-            date = analysis.analyzed_at.date().isoformat()
-            if date not in daily_emotions:
-                daily_emotions[date] = {
-                    'emotions': [],
-                    'intensities': [],
-                    'counts': 0
-                }
-
-            daily_emotions[date]['emotions'].append(analysis.overall_emotion)
-            daily_emotions[date]['intensities'].append(analysis.emotion_intensity)
-            daily_emotions[date]['counts'] += 1
-
-        # 计算每日平均情绪
-        trend_data = []
-        for date, data in daily_emotions.items():
-            avg_intensity = sum(data['intensities']) / len(data['intensities']) if data['intensities'] else 0
-            most_common_emotion = max(set(data['emotions']), key=data['emotions'].count) if data['emotions'] else 'neutral'
-
-            trend_data.append({
-                'date': date,
-                'emotion': most_common_emotion,
-                'intensity': round(avg_intensity, 2),
-                'count': data['counts']
-            })
-
-        # 按日期排序
-        trend_data.sort(key=lambda x: x['date'])
+        # UTC 自然日且有每日汇总时只读取 O(天数) 行；其他时区在数据库中按本地日期分组
+        if tz_offset == 0 and stats_rollup.available():
+            trend_data = stats_rollup.daily_trend(user_id, start_date.date())
+        else:
+            trend_data = _daily_emotion_trend(user_id, start_date, tz_offset)
 
         return jsonify({
             'trend_data': trend_data,
@@ -68,6 +139,7 @@ def get_emotion_trend():
 
 @bp.route('/game-progress', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('game-progress')
 def get_game_progress_stats():
     """获取游戏进度统计"""
     try:
@@ -107,6 +179,7 @@ def get_game_progress_stats():
 
 @bp.route('/cbt-improvement', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('cbt-improvement')
 def get_cbt_improvement():
     """获取CBT改善统计"""
     try:
@@ -167,54 +240,75 @@ def get_cbt_improvement():
     except Exception as e:
         return jsonify({'error': f'Failed to get CBT improvement stats: {str(e)}'}), 500
 
+def _dashboard_row(user_id):
+    """一条查询取出仪表板需要的全部数字：用户信息 + 各项计数的标量子查询"""
+    from models import User, GameState, UserDailyStat
+
+    if stats_rollup.available():
+        since_day = (datetime.utcnow() - timedelta(days=6)).date()
+        diary_rows = (UserDailyStat.user_id == user_id, UserDailyStat.emotion == '')
+        total_diaries = select(func.coalesce(func.sum(UserDailyStat.diary_count), 0)) \
+            .where(*diary_rows).scalar_subquery()
+        recent_diaries = select(func.coalesce(func.sum(UserDailyStat.diary_count), 0)) \
+            .where(*diary_rows, UserDailyStat.day >= since_day).scalar_subquery()
+        analysis_count = select(func.coalesce(func.sum(UserDailyStat.analysis_count), 0)) \
+            .where(UserDailyStat.user_id == user_id).scalar_subquery()
+    else:
+        seven_days_ago = datetime.utcnow() - timedelta(days=7)
+        total_diaries = select(func.count(EmotionDiary.id)) \
+            .where(EmotionDiary.user_id == user_id).scalar_subquery()
+        recent_diaries = select(func.count(EmotionDiary.id)) \
+            .where(EmotionDiary.user_id == user_id, EmotionDiary.created_at >= seven_days_ago).scalar_subquery()
+        analysis_count = select(func.count(EmotionAnalysis.id)) \
+            .join(EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id) \
+            .where(EmotionDiary.user_id == user_id).scalar_subquery()
+
+    current_level = select(GameState.current_level) \
+        .where(GameState.user_id == user_id).limit(1).scalar_subquery()
+
+    return db.session.execute(
+        select(
+            User.username,
+            User.created_at,
+            User.is_active,
+            total_diaries.label('total_diaries'),
+            recent_diaries.label('recent_diaries'),
+            analysis_count.label('analysis_count'),
+            current_level.label('current_level')
+        ).where(User.id == user_id)
+    ).first()
+
 @bp.route('/dashboard', methods=['GET'])
 @jwt_required()
+@snapshot_cache.cached('dashboard')
 def get_dashboard():
-    """获取仪表板综合数据"""
+    """获取仪表板综合数据（按用户缓存，支持 If-None-Match）"""
     try:
         user_id = get_jwt_identity()
 
-        # 获取各种统计数据
-        from models import User, GameState
-
-        # 用户基本信息
-        user = User.query.get(user_id)
-        account_age = (datetime.utcnow() - user.created_at).days
-
-        # 日记统计
-        total_diaries = EmotionDiary.query.filter_by(user_id=user_id).count()
-
-        # 最近7天的日记数量
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        recent_diaries = EmotionDiary.query.filter(
-            EmotionDiary.user_id == user_id,
-            EmotionDiary.created_at >= seven_days_ago
-        ).count()
-
-        # 游戏统计
-        game_state = GameState.query.filter_by(user_id=user_id).first()
-        current_level = game_state.current_level if game_state else 1
+        row = _dashboard_row(user_id)
+        if row is None:
+            return jsonify({'error': 'User not found'}), 404
 
-        # 分析统计
-        analysis_count = db.session.query(EmotionAnalysis).join(
-            EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id
-        ).filter(EmotionDiary.user_id == user_id).count()
+        account_age = (datetime.utcnow() - row.created_at).days
+        total_diaries = int(row.total_diaries or 0)
+        analysis_count = int(row.analysis_count or 0)
 
         # 构建仪表板数据
         dashboard_data = {
             'user_stats': {
-                'username': user.username,
+                'username': row.username,
                 'account_age_days': account_age,
-                'is_active': user.is_active
+                'is_active': row.is_active
             },
             'diary_stats': {
                 'total_diaries': total_diaries,
-                'recent_diaries_7d': recent_diaries,
+                'recent_diaries_7d': int(row.recent_diaries or 0),
                 'avg_diaries_per_week': round(total_diaries / max(1, account_age / 7), 1)
             },
             'game_stats': {
-                'current_level': current_level,
-                'game_active': bool(game_state)
+                'current_level': row.current_level or 1,
+                'game_active': row.current_level is not None
             },
             'analysis_stats': {
                 'total_analyses': analysis_count,
@@ -228,4 +322,4 @@ def get_dashboard():
         }), 200
 
     except Exception as e:
-        return jsonify({'error': f'Failed to get dashboard data: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Failed to get dashboard data: {str(e)}'}), 500
@@ -1,30 +1,60 @@
 """
 图片上传路由
 """
-from flask import Blueprint, request, jsonify, url_for
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 import os
-import uuid
-from datetime import datetime
+
+from extensions import db
+from services.image_store import CONTENT_PATH, SHA256_HEX, image_path, image_store
+from services.image_variants import image_variants
+from services.upload_sessions import UploadOffsetMismatch, UploadSessionNotFound, upload_sessions
+from services.upload_stream import UploadError, UploadTooLarge, receive_upload
 
 bp = Blueprint('upload', __name__)
 
-# 配置
-UPLOAD_FOLDER = 'static/uploads'
+# 配置（图片存放在 image_store.upload_folder，即 static/uploads）
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB，可用 MAX_UPLOAD_SIZE 覆盖
+UPLOAD_TMP_FOLDER = 'tmp/uploads'  # 接收中的临时文件，不在 static 下，不会被直接访问
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_file_size(file):
-    """获取文件大小"""
-    file.seek(0, 2)  # 移动到文件末尾
-    size = file.tell()
-    file.seek(0)  # 重置到开始
-    return size
+def max_upload_size():
+    """单个图片的大小上限，不超过整个请求的 MAX_CONTENT_LENGTH"""
+    size = current_app.config.get('MAX_UPLOAD_SIZE', MAX_FILE_SIZE)
+    max_content_length = current_app.config.get('MAX_CONTENT_LENGTH')
+    return min(size, max_content_length) if max_content_length else size
+
+def upload_tmp_path():
+    return os.path.join(os.getcwd(), current_app.config.get('UPLOAD_TMP_FOLDER', UPLOAD_TMP_FOLDER))
+
+def image_response(image, **extra):
+    return {
+        'image_url': image_store.url(image.path),
+        'filename': image.path,
+        'size': image.size,
+        'sha256': image.sha256,
+        'variants': image.variants,
+        **extra
+    }
+
+def save_upload(upload):
+    """保存已完整接收的上传，返回响应数据"""
+    # 扩展名已由 allowed_file 校验，只取扩展名，不使用原始文件名
+    file_ext = upload.filename.rsplit('.', 1)[1].lower()
+
+    # 按内容哈希存放，相同图片只保存一份（原子重命名，不会出现写了一半的文件）
+    image, deduplicated = image_store.store(upload, file_ext)
+
+    # 缩略图在后台进程池中生成，不等待
+    if not image.variants:
+        image_variants.submit(image.path)
+
+    return image_response(image, deduplicated=deduplicated)
 
 @bp.route('/upload/image', methods=['POST'])
 @jwt_required()
@@ -35,93 +65,235 @@ def upload_image():
     请求：
     - multipart/form-data
     - file: 图片文件
+    或
+    - 请求体为图片原始内容，文件名通过 ?filename= 或 X-Filename 头传递
+
+    请求体按块写入临时文件，超过大小限制时立即停止读取并返回 413；
+    文件按 SHA-256 存放，已有相同内容时直接返回已有的 URL
 
     响应：
     - image_url: 图片URL
+    - variants: 已生成的缩略图（后台生成，刚上传时为 null）
+    - deduplicated: 是否命中已上传的相同图片
     """
+    upload = None
     try:
-        # 检查是否有文件
-        if 'file' not in request.files:
-            return jsonify({'error': '没有文件'}), 400
+        try:
+            upload = receive_upload(
+                request, upload_tmp_path(), max_upload_size(), allowed=allowed_file
+            )
+        except UploadTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except UploadError as e:
+            return jsonify({'error': str(e)}), 400
 
-        file = request.files['file']
+        if upload.size == 0:
+            upload.discard()
+            return jsonify({'error': '文件为空'}), 400
 
-        # 检查文件名
-        if file.filename == '':
-            return jsonify({'error': '文件名为空'}), 400
+        return jsonify({'message': '上传成功', **save_upload(upload)}), 200
 
-        # 检查文件类型
-        if not allowed_file(file.filename):
+    except Exception as e:
+        db.session.rollback()
+        if upload is not None:
+            upload.discard()
+        return jsonify({'error': f'上传失败: {str(e)}'}), 500
+
+@bp.route('/upload/image/<sha256>', methods=['GET'])
+@jwt_required()
+def find_image(sha256):
+    """
+    按 SHA-256 查询当前用户的日记是否已引用相同图片
+
+    客户端上传前先计算哈希查询，命中时直接使用返回的 image_url，不再上传文件内容；
+    其他用户上传的图片不会命中（否则可以用哈希探测别人是否上传过某张图片），
+    这种情况由上传接口在收到内容后去重
+
+    响应：
+    - exists: 是否已存在
+    - image_url: 图片URL（存在时）
+    """
+    try:
+        sha256 = sha256.lower()
+        if not SHA256_HEX.match(sha256):
+            return jsonify({'error': '无效的哈希值'}), 400
+
+        image = image_store.find(sha256, user_id=get_jwt_identity())
+        if image is None:
+            return jsonify({'exists': False}), 200
+
+        return jsonify({'exists': True, **image_response(image)}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
+def session_error(e):
+    """分块上传异常 -> 错误响应"""
+    if isinstance(e, UploadSessionNotFound):
+        return jsonify({'error': str(e)}), 404
+    if isinstance(e, UploadOffsetMismatch):
+        return jsonify({'error': str(e), 'offset': e.offset}), 409
+    if isinstance(e, UploadTooLarge):
+        return jsonify({'error': str(e)}), 413
+    return jsonify({'error': str(e)}), 400
+
+@bp.route('/upload/sessions', methods=['POST'])
+@jwt_required()
+def create_upload_session():
+    """
+    创建可续传的分块上传会话
+
+    请求：
+    - filename: 文件名
+    - size: 文件总字节数
+    - sha256: 整个文件的哈希（可选，complete 时校验；当前用户日记已引用相同图片时直接返回）
+
+    响应：
+    - upload_id、chunk_size、offset
+    """
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        filename = data.get('filename') or ''
+        sha256 = (data.get('sha256') or '').lower() or None
+
+        if not filename:
+            return jsonify({'error': '文件名为空'}), 400
+        if not allowed_file(filename):
             return jsonify({'error': f'不支持的文件类型，仅支持: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
 
-        # 检查文件大小
-        file_size = get_file_size(file)
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({'error': f'文件过大，最大支持 {MAX_FILE_SIZE // (1024 * 1024)}MB'}), 400
+        # 自己的日记已引用相同内容，不需要再传
+        if sha256 and SHA256_HEX.match(sha256):
+            image = image_store.find(sha256, user_id=user_id)
+            if image is not None:
+                return jsonify({'message': '上传成功', **image_response(image, deduplicated=True)}), 200
+
+        try:
+            session = upload_sessions.create(
+                user_id, filename, data.get('size'), max_upload_size(), sha256
+            )
+        except UploadError as e:
+            return session_error(e)
+
+        return jsonify(session), 201
+
+    except Exception as e:
+        return jsonify({'error': f'创建上传失败: {str(e)}'}), 500
+
+@bp.route('/upload/sessions/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(upload_id):
+    """查询分块上传进度，断线后从返回的 offset 继续上传"""
+    try:
+        try:
+            _, meta = upload_sessions.get(get_jwt_identity(), upload_id)
+        except UploadError as e:
+            return session_error(e)
+        return jsonify(upload_sessions.describe(upload_id, meta)), 200
+
+    except Exception as e:
+        return jsonify({'error': f'查询上传失败: {str(e)}'}), 500
+
+@bp.route('/upload/sessions/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    """
+    上传一个分块
+
+    请求：
+    - 请求体为分块原始内容，不超过 chunk_size
+    - Upload-Offset 头（或 ?offset=）: 分块在文件中的起始位置，必须等于当前 offset
+    - X-Chunk-SHA256 头: 分块的 SHA-256
 
-        # 生成安全的文件名
-        original_filename = secure_filename(file.filename)
-        file_ext = original_filename.rsplit('.', 1)[1].lower()
+    响应：
+    - offset: 已确认接收的字节数；偏移量不一致时返回 409 和服务器端的 offset
+    """
+    try:
+        offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            return jsonify({'error': '缺少分块偏移量 Upload-Offset'}), 400
 
-        # 使用UUID和时间戳生成唯一文件名
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        new_filename = f"{timestamp}_{unique_id}.{file_ext}"
+        try:
+            session = upload_sessions.write_chunk(
+                get_jwt_identity(), upload_id, offset, request.stream,
+                request.headers.get('X-Chunk-SHA256'), request.content_length
+            )
+        except UploadError as e:
+            return session_error(e)
 
-        # 确保上传目录存在
-        upload_path = os.path.join(os.getcwd(), UPLOAD_FOLDER)
-        os.makedirs(upload_path, exist_ok=True)
+        return jsonify(session), 200
 
-        # 保存文件
-        file_path = os.path.join(upload_path, new_filename)
-        file.save(file_path)
+    except Exception as e:
+        return jsonify({'error': f'上传分块失败: {str(e)}'}), 500
 
-        # 生成URL
-        image_url = url_for('static', filename=f'uploads/{new_filename}', _external=False)
+@bp.route('/upload/sessions/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload_session(upload_id):
+    """全部分块上传完成后校验并保存图片，响应与 /upload/image 相同"""
+    try:
+        try:
+            result = upload_sessions.complete(get_jwt_identity(), upload_id, save_upload)
+        except UploadError as e:
+            return session_error(e)
 
-        return jsonify({
-            'message': '上传成功',
-            'image_url': image_url,
-            'filename': new_filename,
-            'size': file_size
-        }), 200
+        return jsonify({'message': '上传成功', **result}), 200
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': f'上传失败: {str(e)}'}), 500
 
+@bp.route('/upload/sessions/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload_session(upload_id):
+    """放弃分块上传，删除已接收的数据"""
+    try:
+        try:
+            upload_sessions.abort(get_jwt_identity(), upload_id)
+        except UploadError as e:
+            return session_error(e)
+        return jsonify({'message': '已取消上传'}), 200
+
+    except Exception as e:
+        return jsonify({'error': f'取消上传失败: {str(e)}'}), 500
+
 @bp.route('/upload/delete', methods=['POST'])
 @jwt_required()
 def delete_image():
     """
     删除图片
 
+    相同内容的图片只存一份，可能被其他用户刚刚上传命中（尚未保存到日记），
+    因此接口不直接删除文件：未被引用的图片由 flask uploads-gc 在保留期过后统一清理。
+
     请求：
     - filename: 文件名
 
     响应：
-    - message: 删除结果
+    - message: 处理结果
     """
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         filename = data.get('filename')
+        if not filename and data.get('image_url'):
+            filename = image_path(data['image_url'])
 
         if not filename:
             return jsonify({'error': '文件名不能为空'}), 400
 
-        # 安全检查：确保文件名不包含路径遍历
-        filename = secure_filename(filename)
+        # 安全检查：确保文件名不包含路径遍历（按内容寻址的路径为 ab/<sha256>.<ext>）
+        if not CONTENT_PATH.match(filename):
+            filename = secure_filename(filename)
+            if not filename:
+                return jsonify({'error': '文件名不能为空'}), 400
 
-        # 构建完整路径
-        file_path = os.path.join(os.getcwd(), UPLOAD_FOLDER, filename)
-
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
+        if not os.path.isfile(image_store.absolute_path(filename)):
             return jsonify({'error': '文件不存在'}), 404
+        if image_store.ref_count(filename) > 0:
+            return jsonify({'error': '图片仍被日记引用，无法删除'}), 409
 
-        # 删除文件
-        os.remove(file_path)
-
-        return jsonify({'message': '删除成功'}), 200
+        return jsonify({'message': '图片未被日记引用，将在保留期过后自动清理'}), 202
 
     except Exception as e:
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
@@ -0,0 +1,2 @@
+# 服务模块初始化
+# 后台任务、缓存等与具体路由无关的基础设施
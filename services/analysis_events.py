@@ -0,0 +1,58 @@
+"""
+分析状态事件广播
+工作线程在状态变化时发布事件，SSE 连接订阅对应日记的事件，
+同一进程内无需轮询数据库即可推送到浏览器。
+"""
+import json
+import queue
+import threading
+
+
+def format_sse(event, data):
+    """格式化为一条 text/event-stream 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class AnalysisEventBroker:
+    """进程内的按日记ID订阅/发布"""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, diary_id):
+        subscription = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers.setdefault(diary_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, diary_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(diary_id)
+            if not subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[diary_id]
+
+    def publish(self, diary_id, status, **data):
+        event = {'diary_id': diary_id, 'status': status, **data}
+        with self._lock:
+            subscribers = list(self._subscribers.get(diary_id, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # 消费过慢的连接只丢弃事件，客户端会在探测时补齐最终状态
+                pass
+
+    def subscriber_count(self, diary_id=None):
+        with self._lock:
+            if diary_id is not None:
+                return len(self._subscribers.get(diary_id, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+
+analysis_events = AnalysisEventBroker()
@@ -0,0 +1,281 @@
+"""
+AI分析任务队列
+任务持久化在 analysis_jobs 表中，每个进程内的工作线程池从表中认领并执行任务，
+请求线程只负责入队，不再等待大模型返回。
+"""
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from extensions import db
+from models import AnalysisJob, EmotionAnalysis, EmotionDiary
+from services.analysis_events import analysis_events
+from services.recent_feed import recent_feed
+from services.snapshot_cache import snapshot_cache
+
+
+class AnalysisWorkerPool:
+    """基于数据库表的分析任务工作线程池"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.num_workers = 0
+        self.poll_interval = 2.0
+        self.job_timeout = 600
+        self.max_attempts = 3
+        self._threads = []
+        self._pid = None
+        self._next_requeue = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.num_workers = int(os.getenv('ANALYSIS_WORKERS', 2))
+        self.poll_interval = float(os.getenv('ANALYSIS_POLL_INTERVAL', 2.0))
+        self.job_timeout = int(os.getenv('ANALYSIS_JOB_TIMEOUT', 600))
+        self.max_attempts = int(os.getenv('ANALYSIS_MAX_ATTEMPTS', 3))
+
+        # gunicorn 会在导入后 fork，线程必须在处理请求的进程内启动
+        app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        """确保当前进程的工作线程已启动（fork 之后会重新启动）"""
+        if self.num_workers <= 0 or self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = []
+            for index in range(self.num_workers):
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f'analysis-worker-{index}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def enqueue(self, diary, payload=None):
+        """创建分析任务并把日记状态置为 queued，由调用方负责提交事务"""
+        job = AnalysisJob(
+            diary_id=diary.id,
+            user_id=diary.user_id,
+            status='queued',
+            payload=payload or {},
+            attempts=0,
+            run_after=datetime.utcnow()
+        )
+        diary.analysis_status = 'queued'
+        db.session.add(job)
+        return job
+
+    def enqueue_many(self, connection, diaries):
+        """
+        批量创建分析任务，diaries 为 [(diary_id, user_id)]
+        日记的 analysis_status 由调用方写为 queued，并负责提交事务
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                'diary_id': diary_id,
+                'user_id': user_id,
+                'status': 'queued',
+                'payload': {},
+                'attempts': 0,
+                'run_after': now,
+                'created_at': now
+            }
+            for diary_id, user_id in diaries
+        ]
+        if rows:
+            connection.execute(AnalysisJob.__table__.insert(), rows)
+        return len(rows)
+
+    def notify(self):
+        """唤醒本进程空闲的工作线程"""
+        self.ensure_started()
+        self._wakeup.set()
+
+    def _run(self):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+
+        while not self._stopping.is_set():
+            processed = False
+            try:
+                with self.app.app_context():
+                    processed = self.run_once(worker_id)
+            except Exception as e:
+                self.app.logger.error(f'Analysis worker error: {e}')
+
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self, worker_id):
+        """认领并执行一个任务，队列为空时返回 False（需在应用上下文中调用）"""
+        try:
+            self._requeue_stale_jobs()
+            job = self._claim_job(worker_id)
+            if not job:
+                return False
+            self._execute(job)
+            return True
+        finally:
+            db.session.remove()
+
+    def _requeue_stale_jobs(self):
+        """
+        把超时仍处于 running 的任务重新放回队列（工作进程崩溃的情况）
+        每个进程每 job_timeout 秒最多检查一次，不在每次轮询时都执行 UPDATE
+        """
+        with self._lock:
+            if time.monotonic() < self._next_requeue:
+                return
+            self._next_requeue = time.monotonic() + self.job_timeout
+
+        deadline = datetime.utcnow() - timedelta(seconds=self.job_timeout)
+        stale = db.session.execute(
+            select(AnalysisJob.id, AnalysisJob.diary_id, AnalysisJob.user_id)
+            .where(AnalysisJob.status == 'running', AnalysisJob.started_at < deadline)
+        ).all()
+
+        requeued = []
+        for job_id, diary_id, user_id in stale:
+            # 条件更新：其他进程可能已经处理了同一任务
+            if db.session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, AnalysisJob.status == 'running')
+                .values(status='queued', worker_id=None)
+            ).rowcount:
+                requeued.append((job_id, diary_id, user_id))
+
+        # 与失败重试相同，日记回到 queued，页面不再一直显示 running
+        if requeued:
+            db.session.execute(
+                update(EmotionDiary)
+                .where(
+                    EmotionDiary.id.in_([diary_id for _, diary_id, _ in requeued]),
+                    EmotionDiary.analysis_status == 'running'
+                )
+                .values(analysis_status='queued')
+            )
+        db.session.commit()
+
+        # Core UPDATE 不触发 ORM 事件，与批量导入一样手动让快照缓存和日记流失效
+        if requeued:
+            for user_id in {user_id for _, _, user_id in requeued}:
+                snapshot_cache.invalidate(user_id)
+            recent_feed.invalidate()
+        for job_id, diary_id, _ in requeued:
+            analysis_events.publish(diary_id, 'queued', job_id=job_id)
+
+    def _claim_job(self, worker_id):
+        now = datetime.utcnow()
+        candidates = db.session.execute(
+            select(AnalysisJob.id)
+            .where(AnalysisJob.status == 'queued', AnalysisJob.run_after <= now)
+            .order_by(AnalysisJob.id)
+            .limit(5)
+        ).scalars().all()
+
+        for job_id in candidates:
+            # 条件更新保证多个进程之间只有一个能认领成功
+            claimed = db.session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, AnalysisJob.status == 'queued')
+                .values(
+                    status='running',
+                    worker_id=worker_id,
+                    started_at=now,
+                    attempts=AnalysisJob.attempts + 1
+                )
+            ).rowcount
+            db.session.commit()
+
+            if claimed:
+                job = db.session.get(AnalysisJob, job_id)
+                diary = db.session.get(EmotionDiary, job.diary_id)
+                if diary:
+                    diary.analysis_status = 'running'
+                    db.session.commit()
+                    analysis_events.publish(diary.id, 'running', job_id=job.id)
+                return job
+
+        return None
+
+    def _execute(self, job):
+        from routes.analysis import emotion_service
+
+        diary = db.session.get(EmotionDiary, job.diary_id)
+        if not diary:
+            job.status = 'failed'
+            job.error = 'Diary not found'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            analysis_events.publish(job.diary_id, 'failed', job_id=job.id, error=job.error)
+            return
+
+        payload = job.payload or {}
+        try:
+            analysis_result = emotion_service.analyze_cbt_content(
+                diary_id=diary.id,
+                content=diary.content,
+                emotions=payload.get('emotions', diary.emotion_tags),
+                trigger_event=payload.get('trigger_event', diary.trigger_event),
+                intensity=payload.get('intensity', diary.emotion_score.get('intensity') if diary.emotion_score else 5)
+            )
+
+            job.status = 'completed'
+            job.result = analysis_result
+            job.error = None
+            job.finished_at = datetime.utcnow()
+            diary.analysis_status = 'completed'
+            db.session.commit()
+
+            analysis = EmotionAnalysis.query.filter_by(diary_id=diary.id).first()
+            analysis_events.publish(
+                diary.id,
+                'completed',
+                job_id=job.id,
+                analysis=analysis.to_dict() if analysis else None
+            )
+
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f'Analysis job {job.id} failed: {e}')
+
+            job = db.session.get(AnalysisJob, job.id)
+            diary = db.session.get(EmotionDiary, job.diary_id)
+            job.error = str(e)
+            if job.attempts < self.max_attempts:
+                # 指数退避后重试
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=2 ** job.attempts * 5)
+                if diary:
+                    diary.analysis_status = 'queued'
+            else:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+                if diary:
+                    diary.analysis_status = 'failed'
+            db.session.commit()
+            analysis_events.publish(job.diary_id, job.status, job_id=job.id, error=job.error)
+
+
+analysis_queue = AnalysisWorkerPool()
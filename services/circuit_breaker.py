@@ -0,0 +1,274 @@
+"""
+大模型服务商熔断与对冲调用
+每个服务商一个熔断器，按最近 N 次调用的错误率和慢调用比例判断是否熔断；
+熔断期间直接跳过该服务商，冷却后放行一次试探调用。
+ProviderChain 按顺序尝试服务商，整条链有总时限；开启对冲模式时，
+当前服务商超过其 p95 延迟仍未返回，就提前启动下一个服务商，取先成功的结果。
+服务商并发名额用满、在剩余时限内等不到名额时记为 saturated，不计入熔断的失败率。
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flask import current_app, has_app_context
+
+
+class CircuitBreaker:
+    """滑动窗口熔断器：closed -> open -> half_open -> closed"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window_size=20, min_calls=5, failure_rate=0.5,
+                 slow_call_seconds=10.0, slow_call_rate=0.8, open_seconds=30.0):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls  # 窗口内至少有这么多次调用才评估
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+
+        self.state = self.CLOSED
+        self._calls = deque(maxlen=window_size)  # (是否成功, 耗时秒)
+        self._opened_at = None
+        self._probe_in_flight = False
+        self.saturated = 0  # 等不到并发名额而未发起的调用次数
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许发起调用；熔断冷却结束后只放行一次试探"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self, elapsed):
+        self._record(True, elapsed)
+
+    def record_failure(self, elapsed):
+        self._record(False, elapsed)
+
+    def record_saturated(self):
+        """没有真正调用服务商：不计入窗口，半开状态下归还试探名额"""
+        with self._lock:
+            self.saturated += 1
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def _record(self, ok, elapsed):
+        with self._lock:
+            self._calls.append((ok, elapsed))
+
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and elapsed < self.slow_call_seconds:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                    self._calls.append((ok, elapsed))
+                else:
+                    self._open()
+                return
+
+            if self.state == self.CLOSED and len(self._calls) >= self.min_calls:
+                total = len(self._calls)
+                failures = sum(1 for success, _ in self._calls if not success)
+                slow = sum(1 for _, seconds in self._calls if seconds >= self.slow_call_seconds)
+                if failures / total >= self.failure_rate or slow / total >= self.slow_call_rate:
+                    self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        print(f"[警告] 服务商 {self.name} 已熔断 {self.open_seconds}s", file=sys.stderr)
+
+    def latency_percentile(self, percentile=0.95):
+        """最近成功调用的延迟分位数，没有样本时返回 None"""
+        with self._lock:
+            latencies = sorted(seconds for ok, seconds in self._calls if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile))
+        return latencies[index]
+
+    def stats(self):
+        with self._lock:
+            total = len(self._calls)
+            failures = sum(1 for ok, _ in self._calls if not ok)
+            state = self.state
+            saturated = self.saturated
+        return {
+            'state': state,
+            'calls': total,
+            'saturated': saturated,
+            'failure_rate': round(failures / total, 3) if total else None,
+            'p95_seconds': self.latency_percentile(0.95)
+        }
+
+
+class ProviderChain:
+    """按顺序（可对冲）调用多个服务商，整条链耗时有上限"""
+
+    def __init__(self, deadline=20.0, hedge=False, hedge_delay=3.0, max_workers=8,
+                 max_concurrency=4, breaker_options=None):
+        self.deadline = deadline  # 远程调用的总时限（秒），超时后交给本地降级
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay  # 服务商还没有延迟样本时使用的对冲等待时间
+        self.max_concurrency = max_concurrency  # 每个服务商同时进行的调用数上限
+        self.breaker_options = breaker_options or {}
+        self.breakers = {}
+        self._semaphores = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='provider-chain')
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            deadline=float(os.getenv('PROVIDER_CHAIN_DEADLINE', 20)),
+            hedge=os.getenv('PROVIDER_HEDGE', 'false').lower() == 'true',
+            hedge_delay=float(os.getenv('PROVIDER_HEDGE_DELAY', 3)),
+            max_workers=int(os.getenv('PROVIDER_CHAIN_WORKERS', 8)),
+            max_concurrency=int(os.getenv('PROVIDER_MAX_CONCURRENCY', 4)),
+            breaker_options={
+                'window_size': int(os.getenv('BREAKER_WINDOW_SIZE', 20)),
+                'min_calls': int(os.getenv('BREAKER_MIN_CALLS', 5)),
+                'failure_rate': float(os.getenv('BREAKER_FAILURE_RATE', 0.5)),
+                'slow_call_seconds': float(os.getenv('BREAKER_SLOW_CALL_SECONDS', 10)),
+                'open_seconds': float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+            }
+        )
+
+    def breaker(self, name):
+        with self._lock:
+            if name not in self.breakers:
+                self.breakers[name] = CircuitBreaker(name, **self.breaker_options)
+            return self.breakers[name]
+
+    def call(self, providers, fallback=None):
+        """
+        providers: [(名称, 无参可调用对象)]，返回 None 或抛异常都视为失败
+        fallback: (名称, 无参可调用对象)，远程全部失败或超时后在当前线程执行
+        返回 (结果, 服务商名称)
+        """
+        started_at = time.monotonic()
+        pending = {}  # future -> (名称, 开始时间)
+        queue = list(providers)
+
+        try:
+            while queue or pending:
+                remaining = self.deadline - (time.monotonic() - started_at)
+                if remaining <= 0:
+                    break
+
+                if queue and (not pending or self.hedge):
+                    name, func = queue.pop(0)
+                    # 熔断中的服务商直接跳过（在真正调用前判断，避免占用半开试探名额）
+                    if not self.breaker(name).allow():
+                        continue
+                    # 后面还有服务商时不排队等名额，直接换下一个；最后一个最多等到整条链的截止时间
+                    slot_deadline = time.monotonic() if queue else started_at + self.deadline
+                    future = self._executor.submit(self._guarded(name, func, slot_deadline))
+                    pending[future] = (name, time.monotonic())
+
+                # 非对冲模式等到当前调用结束；对冲模式最多等到当前服务商的 p95
+                timeout = remaining
+                if self.hedge and queue:
+                    timeout = min(remaining, self._hedge_delay_for(pending))
+
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, _ = pending.pop(future)
+                    result, elapsed = future.result()
+                    self._record(name, result, elapsed)
+                    if result:
+                        return result, name
+        finally:
+            # 超时或已拿到结果时不等待剩余调用，它们在后台结束后记录到熔断器
+            for future, (name, _) in pending.items():
+                future.add_done_callback(self._late_recorder(name))
+
+        if fallback is None:
+            return None, None
+        name, func = fallback
+        return func(), name
+
+    def _hedge_delay_for(self, pending):
+        # 以最近启动的那个服务商为准
+        name, call_started = max(pending.values(), key=lambda item: item[1])
+        delay = self.breaker(name).latency_percentile(0.95) or self.hedge_delay
+        return max(0.0, delay - (time.monotonic() - call_started))
+
+    def _record(self, name, result, elapsed):
+        breaker = self.breaker(name)
+        if elapsed is None:
+            print(f"[警告] 服务商 {name} 并发已满，未在时限内发起调用", file=sys.stderr)
+            breaker.record_saturated()
+        elif result:
+            breaker.record_success(elapsed)
+        else:
+            breaker.record_failure(elapsed)
+
+    def _late_recorder(self, name):
+        def record(future):
+            self._record(name, *future.result())
+        return record
+
+    def _semaphore(self, name):
+        with self._lock:
+            if name not in self._semaphores:
+                self._semaphores[name] = threading.BoundedSemaphore(self.max_concurrency)
+            return self._semaphores[name]
+
+    def _guarded(self, name, func, deadline_at):
+        """
+        包装服务商调用：限制并发、补上应用上下文，返回 (结果, 实际调用耗时)
+        耗时从拿到并发名额开始计算，排队时间不计入熔断统计；
+        到 deadline_at 仍等不到名额时返回 (None, None)，即 saturated
+        """
+        # 工作线程里没有应用上下文，缓存等组件需要访问数据库时补上
+        app = current_app._get_current_object() if has_app_context() else None
+        semaphore = self._semaphore(name)
+
+        def run():
+            if not semaphore.acquire(timeout=max(0.0, deadline_at - time.monotonic())):
+                return None, None
+            try:
+                started_at = time.monotonic()
+                try:
+                    if app is None:
+                        result = func()
+                    else:
+                        with app.app_context():
+                            result = func()
+                except Exception as e:
+                    print(f"[警告] 服务商 {name} 调用异常: {e}", file=sys.stderr)
+                    result = None
+                return result, time.monotonic() - started_at
+            finally:
+                semaphore.release()
+        return run
+
+    def stats(self):
+        with self._lock:
+            breakers = dict(self.breakers)
+        return {
+            'deadline': self.deadline,
+            'hedge': self.hedge,
+            'max_concurrency': self.max_concurrency,
+            'providers': {name: breaker.stats() for name, breaker in breakers.items()}
+        }
+
+
+provider_chain = ProviderChain.from_env()
@@ -0,0 +1,119 @@
+"""
+日记导出
+按 created_at 正序流式读取用户的全部日记，并在同一条查询中 LEFT JOIN 分析结果；
+使用服务端游标（yield_per）分批取行，边读边写，内存占用与日记数量无关。
+支持 ndjson（每行一篇）、csv（分析字段展开为列）、json（{"diaries": [...]}）。
+"""
+import csv
+import io
+import json
+import os
+
+from flask import current_app
+from sqlalchemy import select
+
+from extensions import db
+from models import EmotionAnalysis, EmotionDiary
+from services.serializers import (
+    ANALYSIS_PREFIX, DIARY_COLUMNS, PREFIXED_ANALYSIS_COLUMNS,
+    analysis_row_to_dict, diary_row_to_dict
+)
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'json': ('application/json', 'json')
+}
+
+CSV_DIARY_FIELDS = [
+    'id', 'created_at', 'updated_at', 'content', 'emotion_tags', 'emotion_score',
+    'trigger_event', 'images', 'analysis_status'
+]
+CSV_ANALYSIS_FIELDS = [
+    'overall_emotion', 'emotion_intensity', 'emotion_dimensions', 'key_words',
+    'confidence_score', 'analyzed_at', 'ai_model_version'
+]
+
+
+class DiaryExporter:
+    """按格式生成导出内容的分块"""
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+
+    def _rows(self, user_id):
+        statement = select(*DIARY_COLUMNS, *PREFIXED_ANALYSIS_COLUMNS).outerjoin(
+            EmotionAnalysis, EmotionAnalysis.diary_id == EmotionDiary.id
+        ).where(
+            EmotionDiary.user_id == user_id
+        ).order_by(
+            EmotionDiary.created_at, EmotionDiary.id
+        ).execution_options(yield_per=self.batch_size)
+
+        for row in db.session.execute(statement):
+            diary = diary_row_to_dict(row)
+            diary.pop('user_id')
+            if row._mapping[ANALYSIS_PREFIX + 'id'] is not None:
+                diary['analysis'] = analysis_row_to_dict(row, ANALYSIS_PREFIX)
+            else:
+                diary['analysis'] = None
+            yield diary
+
+    def _batched(self, chunks):
+        """把逐行生成的小块合并成每批一次写出"""
+        buffer = []
+        for chunk in chunks:
+            buffer.append(chunk)
+            if len(buffer) >= self.batch_size:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+
+    def ndjson(self, user_id):
+        dumps = current_app.json.dumps
+        return self._batched(dumps(diary) + '\n' for diary in self._rows(user_id))
+
+    def json(self, user_id):
+        dumps = current_app.json.dumps
+
+        def chunks():
+            yield '{"diaries":['
+            separator = ''
+            for diary in self._rows(user_id):
+                yield separator + dumps(diary)
+                separator = ','
+            yield ']}\n'
+
+        return self._batched(chunks())
+
+    def csv(self, user_id):
+        def cell(value):
+            if isinstance(value, (dict, list)):
+                return json.dumps(value, ensure_ascii=False)
+            return value
+
+        def chunks():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # BOM 让 Excel 按 UTF-8 打开中文
+            writer.writerow(CSV_DIARY_FIELDS + ['analysis_' + name for name in CSV_ANALYSIS_FIELDS])
+            yield '\ufeff' + buffer.getvalue()
+
+            for diary in self._rows(user_id):
+                buffer.seek(0)
+                buffer.truncate()
+                analysis = diary['analysis'] or {}
+                writer.writerow(
+                    [cell(diary[name]) for name in CSV_DIARY_FIELDS]
+                    + [cell(analysis.get(name)) for name in CSV_ANALYSIS_FIELDS]
+                )
+                yield buffer.getvalue()
+
+        return self._batched(chunks())
+
+    def export(self, user_id, export_format):
+        return getattr(self, export_format)(user_id)
+
+
+diary_exporter = DiaryExporter(batch_size=int(os.getenv('EXPORT_BATCH_SIZE', 500)))
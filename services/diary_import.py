@@ -0,0 +1,224 @@
+"""
+日记批量导入
+逐行读取 NDJSON（或导出功能生成的 CSV），边读边校验，
+每 batch_size 条用一条批量 INSERT 写入并提交，内存中只保留当前批次。
+批量写入绕过了 ORM 事件，因此检索索引、每日汇总、图片引用计数、接口缓存、首页日记流在这里显式更新。
+"""
+import codecs
+import csv
+import json
+import os
+import secrets
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from extensions import db
+from models import EmotionDiary
+from services.analysis_queue import analysis_queue
+from services.image_store import image_store
+from services.recent_feed import recent_feed
+from services.search_index import search_index
+from services.snapshot_cache import snapshot_cache
+from services.stats_rollup import stats_rollup
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+MAX_REPORTED_ERRORS = 50
+
+
+def _json_field(value, expected_type, name):
+    """列表/对象字段：CSV 中是 JSON 字符串，需要先解析"""
+    if value in (None, ''):
+        return expected_type()
+    if isinstance(value, str) and value.lstrip()[:1] in ('[', '{'):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError(f'{name} must be valid JSON')
+    if not isinstance(value, expected_type):
+        raise ValueError(f'{name} must be a {expected_type.__name__}')
+    return value
+
+
+def _parse_datetime(value, name):
+    """ISO 8601 时间，带时区的转换为 UTC 后去掉时区（与库中存储一致）"""
+    if value in (None, ''):
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'{name} must be an ISO 8601 string')
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 string')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def validate_entry(entry, user_id, now):
+    """把一条导入记录转换为 emotion_diaries 行，不合法时抛出 ValueError"""
+    if not isinstance(entry, dict):
+        raise ValueError('Entry must be an object')
+
+    content = entry.get('content')
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError('Content is required')
+
+    trigger_event = entry.get('trigger_event')
+    if trigger_event is not None and not isinstance(trigger_event, str):
+        raise ValueError('trigger_event must be a string')
+
+    emotion_tags = _json_field(entry.get('emotion_tags'), list, 'emotion_tags')
+    images = _json_field(entry.get('images'), list, 'images')
+    if not all(isinstance(tag, str) for tag in emotion_tags):
+        raise ValueError('emotion_tags must be a list of strings')
+    if not all(isinstance(image, str) for image in images):
+        raise ValueError('images must be a list of strings')
+
+    created_at = _parse_datetime(entry.get('created_at'), 'created_at') or now
+    updated_at = _parse_datetime(entry.get('updated_at'), 'updated_at') or created_at
+
+    return {
+        'user_id': user_id,
+        'content': content.strip(),
+        'emotion_tags': emotion_tags,
+        'emotion_score': _json_field(entry.get('emotion_score'), dict, 'emotion_score'),
+        'trigger_event': (trigger_event.strip() or None) if trigger_event else None,
+        'images': images,
+        'created_at': created_at,
+        'updated_at': updated_at,
+        'analysis_status': 'pending'
+    }
+
+
+class DiaryImporter:
+    """流式批量导入"""
+
+    def __init__(self, batch_size=500, max_rows=50000):
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+
+    @staticmethod
+    def read_entries(stream, import_format):
+        """逐条产生 (行号, 记录或 ValueError)"""
+        lines = codecs.iterdecode(stream, 'utf-8-sig')
+
+        if import_format == 'csv':
+            reader = csv.DictReader(lines)
+            for entry in reader:
+                yield reader.line_num, entry
+            return
+
+        for line_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, ValueError('Invalid JSON')
+
+    @staticmethod
+    def _insert_batch(connection, user_id, rows):
+        """批量插入并按顺序返回新日记的 ID"""
+        table = EmotionDiary.__table__
+
+        if connection.dialect.insert_executemany_returning_sort_by_parameter_order:
+            # SQLite / PostgreSQL / MariaDB：executemany + RETURNING
+            result = connection.execute(
+                table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                rows
+            )
+            return [row.id for row in result]
+
+        # MySQL 不支持 RETURNING：仍用一条多行 INSERT，每行带上随机批次号 + 序号作为 import_key，
+        # 再按 import_key 取回 ID（多行 INSERT 的自增值在 innodb_autoinc_lock_mode=2
+        # 或同一用户并发写入时不一定连续，不能按起始 ID 推算）
+        token = secrets.token_hex(8)
+        keys = [f'{token}:{index}' for index in range(len(rows))]
+        connection.execute(table.insert().values([
+            {**row, 'import_key': key} for row, key in zip(rows, keys)
+        ]))
+        ids = dict(connection.execute(
+            select(table.c.import_key, table.c.id)
+            .where(table.c.user_id == user_id, table.c.import_key.in_(keys))
+        ).all())
+        return [ids[key] for key in keys]
+
+    def _write_batch(self, user_id, rows, analyze):
+        if analyze:
+            for row in rows:
+                row['analysis_status'] = 'queued'
+
+        connection = db.session.connection()
+        ids = self._insert_batch(connection, user_id, rows)
+
+        search_index.index(connection, [
+            (diary_id, user_id, row['content']) for diary_id, row in zip(ids, rows)
+        ])
+        stats_rollup.record_diaries(connection, [
+            (user_id, row['created_at'], row['emotion_tags']) for row in rows
+        ])
+        image_store.record_images(connection, [row['images'] for row in rows])
+        jobs = analysis_queue.enqueue_many(connection, [(diary_id, user_id) for diary_id in ids]) if analyze else 0
+
+        db.session.commit()
+        return len(ids), jobs
+
+    def run(self, user_id, entries, analyze=False):
+        """
+        执行导入，返回汇总；每批单独提交
+        写入失败时回滚当前批次并停止，已提交的批次保留，失败原因记在 summary['error']
+        """
+        user_id = int(user_id)
+        now = datetime.utcnow()
+        summary = {
+            'imported': 0, 'skipped': 0, 'batches': 0, 'analysis_jobs': 0,
+            'errors': [], 'truncated': False, 'error': None
+        }
+        batch = []
+
+        def flush():
+            imported, jobs = self._write_batch(user_id, batch, analyze)
+            summary['imported'] += imported
+            summary['analysis_jobs'] += jobs
+            summary['batches'] += 1
+            batch.clear()
+
+        try:
+            for line_number, entry in entries:
+                if summary['imported'] + len(batch) >= self.max_rows:
+                    summary['truncated'] = True
+                    break
+                try:
+                    if isinstance(entry, ValueError):
+                        raise entry
+                    batch.append(validate_entry(entry, user_id, now))
+                except ValueError as e:
+                    summary['skipped'] += 1
+                    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                        summary['errors'].append({'line': line_number, 'error': str(e)})
+                    continue
+
+                if len(batch) >= self.batch_size:
+                    flush()
+
+            if batch:
+                flush()
+        except Exception as e:
+            db.session.rollback()
+            summary['error'] = str(e)
+        finally:
+            if summary['imported']:
+                snapshot_cache.invalidate(user_id)
+                recent_feed.invalidate()
+            if summary['analysis_jobs']:
+                analysis_queue.notify()
+
+        return summary
+
+
+diary_importer = DiaryImporter(
+    batch_size=int(os.getenv('IMPORT_BATCH_SIZE', 500)),
+    max_rows=int(os.getenv('IMPORT_MAX_ROWS', 50000))
+)
@@ -0,0 +1,153 @@
+"""
+大模型服务商 HTTP 客户端
+每个进程共享一个带连接池的 requests.Session，复用 TCP/TLS 连接（keep-alive），
+连接超时与读取超时分开配置，并提供连接池使用情况统计。
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ProviderHTTPClient:
+    """进程级共享的连接池客户端"""
+
+    def __init__(self, pool_connections=4, pool_maxsize=10, pool_block=False,
+                 connect_timeout=5.0, read_timeout=30.0, max_retries=0):
+        self.pool_connections = pool_connections  # 缓存连接池的主机数
+        self.pool_maxsize = pool_maxsize  # 每个主机保持的最大连接数
+        self.pool_block = pool_block  # 达到上限时等待空闲连接，而不是新建临时连接
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+
+        self._session = None
+        self._adapter = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            pool_connections=int(os.getenv('PROVIDER_POOL_CONNECTIONS', 4)),
+            pool_maxsize=int(os.getenv('PROVIDER_POOL_MAXSIZE', 10)),
+            pool_block=os.getenv('PROVIDER_POOL_BLOCK', 'false').lower() == 'true',
+            connect_timeout=float(os.getenv('PROVIDER_CONNECT_TIMEOUT', 5)),
+            read_timeout=float(os.getenv('PROVIDER_READ_TIMEOUT', 30)),
+            max_retries=int(os.getenv('PROVIDER_MAX_RETRIES', 0))
+        )
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def session(self):
+        # fork 出的子进程不能复用父进程的套接字，按 pid 重建
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session, self._adapter = self._build_session()
+                    self._pid = os.getpid()
+                    self._counters = {}
+        return self._session
+
+    def _build_session(self):
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_retries=self.max_retries
+        )
+        session = requests.Session()
+        session.headers.update({'Connection': 'keep-alive'})
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session, adapter
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        session = self.session
+
+        self._count(host, 'in_flight', 1)
+        started_at = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+        except Exception:
+            self._count(host, 'errors', 1)
+            raise
+        finally:
+            self._count(host, 'in_flight', -1)
+            self._count(host, 'requests', 1)
+            self._count(host, 'total_seconds', time.monotonic() - started_at)
+
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def _count(self, host, name, value):
+        with self._lock:
+            counters = self._counters.setdefault(host, {
+                'requests': 0,
+                'errors': 0,
+                'in_flight': 0,
+                'total_seconds': 0.0
+            })
+            counters[name] += value
+
+    def stats(self):
+        """返回每个主机的请求数、新建连接数、空闲连接数等统计"""
+        pools = {}
+        if self._adapter is not None and self._pid == os.getpid():
+            pool_manager = self._adapter.poolmanager
+            for key in list(pool_manager.pools.keys()):
+                pool = pool_manager.pools.get(key)
+                if pool is None:
+                    continue
+                host = f'{pool.host}:{pool.port}' if pool.port else pool.host
+                new_connections = pool.num_connections
+                pool_requests = pool.num_requests
+                pools[host] = {
+                    'scheme': pool.scheme,
+                    'new_connections': new_connections,
+                    'requests': pool_requests,
+                    # 队列中 None 是尚未建立连接的占位
+                    'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                    'max_connections': self.pool_maxsize,
+                    'reuse_ratio': round(1 - new_connections / pool_requests, 3) if pool_requests else None
+                }
+
+        with self._lock:
+            hosts = {
+                host: {
+                    **counters,
+                    'avg_seconds': round(counters['total_seconds'] / counters['requests'], 3) if counters['requests'] else None,
+                    'total_seconds': round(counters['total_seconds'], 3)
+                }
+                for host, counters in self._counters.items()
+            }
+
+        return {
+            'pid': os.getpid(),
+            'config': {
+                'pool_connections': self.pool_connections,
+                'pool_maxsize': self.pool_maxsize,
+                'pool_block': self.pool_block,
+                'connect_timeout': self.connect_timeout,
+                'read_timeout': self.read_timeout
+            },
+            'pools': pools,
+            'hosts': hosts
+        }
+
+
+provider_http = ProviderHTTPClient.from_env()
@@ -0,0 +1,244 @@
+"""
+按内容寻址的图片存储
+上传的图片按 SHA-256 存放在 static/uploads/<前两位>/<sha256>.<ext>，相同内容只存一份，
+重复上传直接返回已有的 URL。
+
+stored_images 记录每个文件被多少篇日记的 images 引用：
+- before_flush：将被修改/删除的日记，从数据库读出旧的 images，记为负增量
+- after_flush：新增/修改后的日记记正增量，在同一事务中累加到 ref_count
+批量导入绕过 ORM 事件，由导入流程调用 record_images。
+文件可能被多个用户共用，不通过接口删除，未被引用的图片由 services.upload_gc 清理。
+"""
+import os
+import re
+from collections import Counter
+
+from flask import url_for
+from sqlalchemy import Text, cast, event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import EmotionDiary, StoredImage
+
+UPLOAD_URL_PREFIX = '/static/uploads/'
+CONTENT_PATH = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{64})\.([a-z0-9]+)$')
+SHA256_HEX = re.compile(r'^[0-9a-f]{64}$')
+
+
+def image_path(url):
+    """图片 URL -> 相对 static/uploads 的路径，不是本站上传的图片返回 None"""
+    if not isinstance(url, str):
+        return None
+    _, found, rest = url.partition(UPLOAD_URL_PREFIX)
+    if not found:
+        return None
+    rest = rest.split('?', 1)[0].split('#', 1)[0]
+    if not rest or any(part in ('', '.', '..') for part in rest.split('/')):
+        return None
+    return rest
+
+
+def content_path(sha256, ext):
+    return f'{sha256[:2]}/{sha256}.{ext}'
+
+
+class ImageStore:
+    """图片文件存储与引用计数"""
+
+    def __init__(self, upload_folder='static/uploads'):
+        self.upload_folder = upload_folder
+        self._listening = False
+        self._ready_engines = set()
+
+    def is_ready(self, connection):
+        """stored_images 表已存在时才维护引用计数（只缓存肯定的结果）"""
+        engine = connection.engine
+        if engine.url not in self._ready_engines:
+            if not inspect(connection).has_table(StoredImage.__tablename__):
+                return False
+            self._ready_engines.add(engine.url)
+        return True
+
+    def init_app(self, app):
+        if not self._listening:
+            event.listen(Session, 'before_flush', self._before_flush)
+            event.listen(Session, 'after_flush', self._after_flush)
+            self._listening = True
+
+    def absolute_path(self, path):
+        return os.path.join(os.getcwd(), self.upload_folder, path)
+
+    @staticmethod
+    def url(path):
+        return url_for('static', filename=f'uploads/{path}', _external=False)
+
+    # ---- 存储 ----
+
+    def find(self, sha256, user_id=None):
+        """
+        按内容哈希查找文件仍然存在的图片
+        传入 user_id 时只返回该用户日记已引用的图片，不能借哈希探测其他用户上传过哪些图片
+        命中时更新原图和缩略图的修改时间：即将被新日记引用，垃圾回收的保留期重新计算
+        """
+        for image in StoredImage.query.filter_by(sha256=sha256):
+            if user_id is not None and not self.referenced_by(image.path, user_id):
+                continue
+            try:
+                os.utime(self.absolute_path(image.path))
+            except FileNotFoundError:
+                continue
+            for variant in self.variant_paths(image.variants):
+                try:
+                    os.utime(self.absolute_path(variant))
+                except FileNotFoundError:
+                    pass
+            return image
+        return None
+
+    @staticmethod
+    def referenced_by(path, user_id):
+        """用户是否有日记的 images 包含该图片（路径只含十六进制、/ 和扩展名，不需要转义）"""
+        return db.session.query(EmotionDiary.id).filter(
+            EmotionDiary.user_id == user_id,
+            cast(EmotionDiary.images, Text).contains(path)
+        ).first() is not None
+
+    @staticmethod
+    def variant_paths(variants):
+        """stored_images.variants -> 全部缩略图路径"""
+        return [path for formats in (variants or {}).values() for path in formats.values()]
+
+    def store(self, upload, ext):
+        """
+        保存流式接收的上传（services.upload_stream.SpooledUpload）
+        返回 (StoredImage, 是否命中已有内容)；命中时丢弃临时文件，不占用额外磁盘
+        """
+        existing = self.find(upload.sha256)
+        if existing is not None:
+            upload.discard()
+            return existing, True
+
+        path = content_path(upload.sha256, ext)
+        destination = self.absolute_path(path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # 并发上传同一内容时后完成的覆盖先完成的，内容相同，不影响读取
+        upload.move_to(destination)
+
+        image = StoredImage.query.filter_by(path=path).first()
+        if image is None:
+            db.session.add(StoredImage(path=path, sha256=upload.sha256, size=upload.size, ref_count=0))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+            image = StoredImage.query.filter_by(path=path).first()
+        return image, False
+
+    def ref_count(self, path):
+        """图片当前被多少篇日记引用（没有记录时为 0）"""
+        table = StoredImage.__table__
+        count = db.session.execute(select(table.c.ref_count).where(table.c.path == path)).scalar()
+        return count or 0
+
+    # ---- 引用计数 ----
+
+    @staticmethod
+    def _paths(images):
+        """一篇日记引用的本站图片路径（同一图片只计一次）"""
+        if not isinstance(images, list):
+            return set()
+        return {path for path in map(image_path, images) if path}
+
+    @staticmethod
+    def _images_changed(obj):
+        return attributes.get_history(obj, 'images').has_changes()
+
+    def _before_flush(self, session, flush_context, instances):
+        """从数据库读出将被修改/删除日记的旧图片，记为负增量"""
+        session.info.pop('image_ref_deltas', None)
+        old_ids = {
+            obj.id for obj in session.deleted
+            if isinstance(obj, EmotionDiary) and obj.id is not None
+        }
+        old_ids.update(
+            obj.id for obj in session.dirty
+            if isinstance(obj, EmotionDiary) and obj.id is not None and self._images_changed(obj)
+        )
+        if not old_ids:
+            return
+
+        connection = session.connection()
+        if not self.is_ready(connection):
+            return
+
+        deltas = Counter()
+        for (images,) in connection.execute(
+            select(EmotionDiary.images).where(EmotionDiary.id.in_(old_ids))
+        ):
+            deltas.subtract(self._paths(images))
+        session.info['image_ref_deltas'] = deltas
+
+    def _after_flush(self, session, flush_context):
+        """记入新增/修改后的图片，与负增量合并后写入 ref_count"""
+        deltas = session.info.pop('image_ref_deltas', Counter())
+        for obj in session.new:
+            if isinstance(obj, EmotionDiary):
+                deltas.update(self._paths(obj.images))
+        for obj in session.dirty:
+            if isinstance(obj, EmotionDiary) and self._images_changed(obj):
+                deltas.update(self._paths(obj.images))
+
+        if not any(deltas.values()):
+            return
+        connection = session.connection()
+        if self.is_ready(connection):
+            self.apply(connection, deltas)
+
+    def record_images(self, connection, image_lists):
+        """计入绕过 ORM 写入的新日记（批量导入）的图片，需在同一事务中调用"""
+        if not self.is_ready(connection):
+            return
+        deltas = Counter()
+        for images in image_lists:
+            deltas.update(self._paths(images))
+        self.apply(connection, deltas)
+
+    def apply(self, connection, deltas):
+        """把增量原子地累加到 ref_count；没有记录的图片（旧文件名）补建记录"""
+        table = StoredImage.__table__
+        for path, delta in deltas.items():
+            if not delta:
+                continue
+            result = connection.execute(
+                table.update().where(table.c.path == path).values(ref_count=table.c.ref_count + delta)
+            )
+            if result.rowcount == 0 and delta > 0:
+                match = CONTENT_PATH.match(path)
+                file_path = self.absolute_path(path)
+                connection.execute(table.insert().values(
+                    path=path,
+                    sha256=match.group(2) if match else None,
+                    size=os.path.getsize(file_path) if os.path.isfile(file_path) else None,
+                    ref_count=delta
+                ))
+
+    # ---- 回填 ----
+
+    def rebuild(self):
+        """按日记的 images 重新计算全部引用计数，返回被引用的图片数"""
+        counts = Counter()
+        with db.engine.connect() as connection:
+            for (images,) in connection.execute(
+                select(EmotionDiary.images).execution_options(yield_per=1000)
+            ):
+                counts.update(self._paths(images))
+
+        table = StoredImage.__table__
+        with db.engine.begin() as connection:
+            connection.execute(table.update().values(ref_count=0))
+            self.apply(connection, counts)
+        return len(counts)
+
+
+image_store = ImageStore()
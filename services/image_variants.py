@@ -0,0 +1,191 @@
+"""
+图片变体生成
+上传成功后在进程池中生成缩略图（thumb）和中等尺寸（medium）两种变体，
+每种各输出 WebP 和与原图同类的格式（jpg / png），不阻塞请求线程，也不占用 Web 进程的 GIL。
+变体与原图放在同一目录，文件名为 <原文件名>_<尺寸>.<格式>，前端据此拼出 URL；
+生成结果记录在 stored_images.variants。未安装 Pillow 时不生成，页面继续使用原图。
+"""
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from extensions import db
+from models import StoredImage
+from services.image_store import image_store
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 名称 -> 最长边像素；列表页缩略图显示为 80px，240 可覆盖 3 倍屏
+VARIANT_SIZES = {'thumb': 240, 'medium': 1280}
+# 原图扩展名 -> 非 WebP 变体的格式（GIF 取第一帧存为 PNG）
+FALLBACK_FORMATS = {'jpg': 'jpg', 'jpeg': 'jpg', 'png': 'png', 'gif': 'png', 'webp': 'webp'}
+PIL_FORMATS = {'jpg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+SAVE_OPTIONS = {
+    'jpg': {'quality': 82, 'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+    'webp': {'quality': 80, 'method': 4}
+}
+
+
+def variant_path(path, name, fmt):
+    """ab/<sha256>.png -> ab/<sha256>_thumb.webp"""
+    return f"{path.rsplit('.', 1)[0]}_{name}.{fmt}"
+
+
+def variant_formats(path):
+    """原图对应的变体格式，不支持的类型返回空列表"""
+    fallback = FALLBACK_FORMATS.get(path.rsplit('.', 1)[-1].lower())
+    if fallback is None:
+        return []
+    return ['webp'] if fallback == 'webp' else ['webp', fallback]
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def render_variants(source, path):
+    """
+    在子进程中执行：读取 source 并写出全部变体，返回 {名称: {格式: 相对路径}}
+    每个文件先写临时文件再重命名，不会出现写了一半的变体
+    """
+    directory = os.path.dirname(source)
+    formats = variant_formats(path)
+    source_format = path.rsplit('.', 1)[-1].lower().replace('jpeg', 'jpg')
+    source_size = os.path.getsize(source)
+    result = {}
+
+    with Image.open(source) as original:
+        original.seek(0)
+        image = ImageOps.exif_transpose(original)
+        if 'A' in image.mode or 'transparency' in image.info:
+            image = image.convert('RGBA')
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        for name, size in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            result[name] = {}
+            for fmt in formats:
+                output = resized.convert('RGB') if fmt == 'jpg' else resized
+                relative = variant_path(path, name, fmt)
+                target = os.path.join(directory, os.path.basename(relative))
+                partial = f'{target}.part'
+                output.save(partial, PIL_FORMATS[fmt], **SAVE_OPTIONS[fmt])
+                if fmt == source_format and os.path.getsize(partial) >= source_size:
+                    # 原图本身已足够小：直接链接原图，不保存更大的重新编码结果
+                    os.remove(partial)
+                    _link_or_copy(source, partial)
+                os.replace(partial, target)
+                result[name][fmt] = relative
+
+    return result
+
+
+class ImageVariantPool:
+    """在进程池中生成变体，完成后写回 stored_images"""
+
+    def __init__(self):
+        self.app = None
+        self.num_workers = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def init_app(self, app):
+        self.app = app
+        self.num_workers = int(os.getenv('IMAGE_WORKERS', 2))
+        if not self.available:
+            app.logger.info('Pillow 未安装，不生成图片缩略图')
+
+    def _get_executor(self):
+        """
+        每个进程单独创建进程池（gunicorn fork 之后重新创建）
+        子进程用 forkserver/spawn 启动：Web 进程中已有队列、清理等线程，直接 fork 可能继承被占用的锁
+        """
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=context)
+                self._pid = os.getpid()
+                self._pending = set()
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """子进程异常退出（如解码大图时被 OOM 结束）后进程池不可再用，下次提交时重新创建"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def submit(self, path):
+        """提交生成任务（相对 static/uploads 的路径），立即返回；同一图片不重复提交"""
+        if not self.available or self.num_workers <= 0 or not variant_formats(path):
+            return False
+
+        executor = self._get_executor()
+        with self._lock:
+            if path in self._pending:
+                return False
+            self._pending.add(path)
+
+        try:
+            future = executor.submit(render_variants, image_store.absolute_path(path), path)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            with self._lock:
+                self._pending.add(path)
+            future = executor.submit(render_variants, image_store.absolute_path(path), path)
+        future.add_done_callback(lambda done: self._finished(executor, path, done))
+        return True
+
+    def _finished(self, executor, path, future):
+        with self._lock:
+            self._pending.discard(path)
+        try:
+            variants = future.result()
+        except BrokenProcessPool as e:
+            self._discard_executor(executor)
+            self.app.logger.warning(f'生成图片变体的进程异常退出 {path}: {e}')
+            return
+        except Exception as e:
+            self.app.logger.warning(f'生成图片变体失败 {path}: {e}')
+            return
+        self.record(path, variants)
+
+    def record(self, path, variants):
+        """把生成结果写入 stored_images（在进程池的回调线程中执行，需要单独的应用上下文）"""
+        with self.app.app_context():
+            try:
+                table = StoredImage.__table__
+                db.session.execute(table.update().where(table.c.path == path).values(variants=variants))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f'记录图片变体失败 {path}: {e}')
+
+    def generate(self, path):
+        """在当前进程同步生成并记录（命令行回填用）"""
+        variants = render_variants(image_store.absolute_path(path), path)
+        self.record(path, variants)
+        return variants
+
+
+image_variants = ImageVariantPool()
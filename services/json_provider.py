@@ -0,0 +1,93 @@
+"""
+Flask JSON 序列化
+安装了 orjson / ujson 时用它们编码响应，否则使用标准库（Flask 默认实现）。
+通过 JSON_PROVIDER 选择：auto（默认，orjson > ujson > stdlib）/ orjson / ujson / stdlib。
+输出与默认实现保持一致：键排序，datetime 等类型仍交给 Flask 的 default 处理；
+加速库无法编码的对象（超大整数、非字符串键等）回退到标准库。
+数据库 JSON 列的反序列化同样可以使用 orjson（见 engine_json_options）。
+"""
+import json
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """优先使用 orjson / ujson 的 JSON provider"""
+
+    def __init__(self, app, backend=None):
+        super().__init__(app)
+        self.backend = self._resolve_backend(backend or os.getenv('JSON_PROVIDER', 'auto').lower())
+
+    @staticmethod
+    def _resolve_backend(name):
+        if name in ('auto', 'orjson') and orjson is not None:
+            return 'orjson'
+        if name in ('auto', 'ujson') and ujson is not None:
+            return 'ujson'
+        return 'stdlib'
+
+    def _orjson_options(self):
+        # datetime / dataclass 交给 Flask 的 default，保持与标准库一致的格式
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps_bytes(self, obj, **kwargs):
+        """编码为 UTF-8 字节，供响应和缓存直接使用"""
+        if not kwargs:
+            if self.backend == 'orjson':
+                try:
+                    return orjson.dumps(obj, default=self.default, option=self._orjson_options())
+                except TypeError:
+                    pass
+            elif self.backend == 'ujson':
+                try:
+                    return ujson.dumps(
+                        obj, ensure_ascii=False, sort_keys=self.sort_keys, default=self.default
+                    ).encode('utf-8')
+                except (TypeError, OverflowError):
+                    pass
+        return super().dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, **kwargs).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if self.backend == 'orjson' and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            # 调试模式保持缩进输出
+            return super().response(*args, **kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def _loads_json_column(value):
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError:
+        # 标准库写入的 NaN / Infinity 等 orjson 不接受
+        return json.loads(value)
+
+
+def engine_json_options():
+    """SQLAlchemy 引擎参数：安装了 orjson 时用它解析 JSON 列"""
+    if orjson is None or os.getenv('JSON_PROVIDER', 'auto').lower() not in ('auto', 'orjson'):
+        return {}
+    return {'json_deserializer': _loads_json_column}
+
@@ -0,0 +1,233 @@
+"""
+大模型响应缓存
+以 (model, system prompt, prompt, temperature, max_tokens) 的哈希为键，
+相同的请求直接返回上一次的结果，不再重复计费和等待。
+
+后端通过 LLM_CACHE_BACKEND 选择：
+- memory: 进程内 LRU + TTL（默认）
+- db: llm_response_cache 表，多进程共享
+- redis: 使用 REDIS_URL
+- none: 关闭缓存
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from extensions import db
+from models import LLMCacheEntry
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def make_cache_key(model, system_prompt, prompt, temperature=None, max_tokens=None):
+    """根据请求参数生成内容寻址的缓存键"""
+    raw = json.dumps(
+        [model, system_prompt, prompt, temperature, max_tokens],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryCacheBackend:
+    """进程内 LRU 缓存，带过期时间（保存序列化后的副本，调用方修改结果不会污染缓存）"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        value = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DatabaseCacheBackend:
+    """
+    数据库表缓存，使用独立连接，不影响调用方的会话事务
+    init_app 时绑定引擎：双调用在线程池中执行，没有应用上下文，不能再通过 db.engine 取得连接
+    过期的记录在写入时顺带清理（每个进程每 purge_interval 秒最多一次）
+    """
+
+    def __init__(self, purge_interval=3600):
+        self.engine = None
+        self.purge_interval = purge_interval
+        self._next_purge = 0
+        self._purge_lock = threading.Lock()
+
+    def init_app(self, app):
+        with app.app_context():
+            self.engine = db.engine
+
+    def get(self, key):
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(LLMCacheEntry.value, LLMCacheEntry.expires_at)
+                .where(LLMCacheEntry.cache_key == key)
+            ).first()
+
+        if row is None:
+            return None
+        if row.expires_at is not None and row.expires_at < datetime.utcnow():
+            return None
+        return json.loads(row.value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+        table = LLMCacheEntry.__table__
+        with self.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.cache_key == key))
+            connection.execute(table.insert().values(
+                cache_key=key,
+                value=json.dumps(value, ensure_ascii=False),
+                created_at=datetime.utcnow(),
+                expires_at=expires_at
+            ))
+        self._maybe_purge()
+
+    def _maybe_purge(self):
+        with self._purge_lock:
+            if time.monotonic() < self._next_purge:
+                return
+            self._next_purge = time.monotonic() + self.purge_interval
+        self.purge_expired()
+
+    def purge_expired(self):
+        """删除已过期的记录（按 expires_at 索引），返回删除的条数"""
+        table = LLMCacheEntry.__table__
+        with self.engine.begin() as connection:
+            result = connection.execute(delete(table).where(table.c.expires_at < datetime.utcnow()))
+        return result.rowcount
+
+    def clear(self):
+        with self.engine.begin() as connection:
+            connection.execute(delete(LLMCacheEntry.__table__))
+
+
+class RedisCacheBackend:
+    """Redis 缓存，多个 gunicorn 进程共享"""
+
+    def __init__(self, url, prefix='llm:'):
+        if redis is None:
+            raise RuntimeError('redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+class LLMResponseCache:
+    """大模型响应缓存门面，后端异常时直接回源，不影响分析流程"""
+
+    def __init__(self, backend=None, ttl=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def init_app(self, app):
+        if hasattr(self.backend, 'init_app'):
+            self.backend.init_app(app)
+
+    def purge_expired(self):
+        """清理过期记录（只有数据库后端需要，其他后端返回 0）"""
+        if not hasattr(self.backend, 'purge_expired'):
+            return 0
+        return self.backend.purge_expired()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"[警告] 读取LLM缓存失败: {e}", file=sys.stderr)
+            return None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if not self.enabled or value is None:
+            return
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            print(f"[警告] 写入LLM缓存失败: {e}", file=sys.stderr)
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def create_llm_cache():
+    """根据环境变量创建缓存实例"""
+    backend_name = os.getenv('LLM_CACHE_BACKEND', 'memory').lower()
+    ttl = int(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600)) or None
+
+    backend = None
+    try:
+        if backend_name == 'memory':
+            backend = MemoryCacheBackend(int(os.getenv('LLM_CACHE_MAX_ENTRIES', 512)))
+        elif backend_name == 'db':
+            backend = DatabaseCacheBackend(int(os.getenv('LLM_CACHE_PURGE_INTERVAL', 3600)))
+        elif backend_name == 'redis':
+            backend = RedisCacheBackend(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    except Exception as e:
+        print(f"[警告] LLM缓存初始化失败，已禁用: {e}", file=sys.stderr)
+        backend = None
+
+    return LLMResponseCache(backend, ttl)
+
+
+llm_cache = create_llm_cache()
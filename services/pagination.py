@@ -0,0 +1,62 @@
+"""
+游标（keyset）分页
+以 (时间, id) 作为排序键，下一页从上一页最后一条之后继续查，
+不使用 OFFSET，深页与第一页代价相同；总数按需单独统计。
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+MAX_PAGE_SIZE = 100  # 每页条数上限
+
+
+def encode_cursor(timestamp, row_id):
+    """把排序键编码为不透明的游标字符串"""
+    raw = json.dumps([timestamp.isoformat() if timestamp else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式不正确时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (datetime.fromisoformat(timestamp) if timestamp else None), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def clamp_limit(limit):
+    """每页条数限制在 1..MAX_PAGE_SIZE（SQLite 的负数 LIMIT 表示不限条数）"""
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_paginate(query, time_column, id_column, cursor=None, limit=20, key=None):
+    """
+    按 (time_column, id_column) 倒序取一页
+    key: 从结果行取出 (时间, id) 的函数，默认取行的 time_column/id_column 同名属性
+    返回 (本页数据, 下一页游标或 None)
+    """
+    limit = clamp_limit(limit)
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            time_column < timestamp,
+            and_(time_column == timestamp, id_column < row_id)
+        ))
+
+    rows = query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_next and rows:
+        if key is None:
+            last = rows[-1]
+            next_cursor = encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+        else:
+            next_cursor = encode_cursor(*key(rows[-1]))
+
+    return rows, next_cursor
@@ -0,0 +1,154 @@
+"""
+首页公开的最新日记流
+预先生成匿名化后的 JSON（不含 user_id，内容截断为 100 字）存放在 extensions.cache 中，
+日记新增、删除提交后立即重建；修改（含分析状态变化）只在日记位于当前日记流中时重建，
+另有 RECENT_FEED_TTL 过期兜底；匿名请求直接返回缓存的字节，不访问数据库。
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, attributes
+
+from extensions import cache, db
+from models import EmotionDiary
+
+PREVIEW_LENGTH = 100
+FEED_COLUMNS = (
+    'content', 'emotion_tags', 'emotion_score', 'trigger_event', 'images',
+    'created_at', 'updated_at', 'analysis_status'
+)
+
+
+class RecentDiaryFeed:
+    """最新日记流"""
+
+    NAMESPACE = 'feed'
+    KEY = 'recent'
+
+    def __init__(self, limit=10, ttl=60, max_age=30):
+        self.limit = limit
+        self.ttl = ttl
+        self.max_age = max_age  # 浏览器/CDN 缓存时间
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def init_app(self, app):
+        if not self._listening:
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+            self._listening = True
+
+    @staticmethod
+    def make_etag(body):
+        return hashlib.sha256(body).hexdigest()[:32]
+
+    def build(self):
+        """查询最新的日记并序列化为 JSON 字节"""
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(
+                    EmotionDiary.id,
+                    func.substr(EmotionDiary.content, 1, PREVIEW_LENGTH + 1).label('content'),
+                    EmotionDiary.emotion_tags,
+                    EmotionDiary.emotion_score,
+                    EmotionDiary.trigger_event,
+                    EmotionDiary.images,
+                    EmotionDiary.created_at,
+                    EmotionDiary.updated_at,
+                    EmotionDiary.analysis_status
+                )
+                .order_by(EmotionDiary.created_at.desc())
+                .limit(self.limit)
+            ).all()
+
+        diaries = []
+        for row in rows:
+            content = row.content or ''
+            if len(content) > PREVIEW_LENGTH:
+                content = content[:PREVIEW_LENGTH] + '...'
+            diaries.append({
+                'id': row.id,
+                'content': content,
+                'emotion_tags': row.emotion_tags,
+                'emotion_score': row.emotion_score,
+                'trigger_event': row.trigger_event,
+                'images': row.images if row.images else [],
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+                'analysis_status': row.analysis_status
+            })
+
+        return current_app.json.dumps({'diaries': diaries}).encode('utf-8')
+
+    def refresh(self):
+        body = self.build()
+        cache.set(self.NAMESPACE, self.KEY, body, self.ttl)
+        return body
+
+    def get(self):
+        """返回 (etag, body)；缓存缺失时同一进程内只有一个请求去重建"""
+        body = cache.get(self.NAMESPACE, self.KEY)
+        if body is None:
+            with self._lock:
+                body = cache.get(self.NAMESPACE, self.KEY)
+                if body is None:
+                    body = self.refresh()
+        return self.make_etag(body), body
+
+    # ---- 写入时重建 ----
+
+    def cached_ids(self):
+        """当前缓存的日记流中的日记 ID，缓存缺失时为空（下一个请求会重建）"""
+        body = cache.get(self.NAMESPACE, self.KEY)
+        if body is None:
+            return set()
+        try:
+            return {diary['id'] for diary in json.loads(body)['diaries']}
+        except (ValueError, KeyError, TypeError):
+            return set()
+
+    def _after_flush(self, session, flush_context):
+        if session.info.get('recent_feed_dirty'):
+            return
+        for obj in list(session.new) + list(session.deleted):
+            if isinstance(obj, EmotionDiary):
+                session.info['recent_feed_dirty'] = True
+                return
+
+        changed = [
+            obj.id for obj in session.dirty
+            if isinstance(obj, EmotionDiary) and any(
+                attributes.get_history(obj, name).has_changes() for name in FEED_COLUMNS
+            )
+        ]
+        # 修改不在日记流中的旧日记（编辑、分析任务状态流转）不需要重建
+        if changed and not self.cached_ids().isdisjoint(changed):
+            session.info['recent_feed_dirty'] = True
+
+    def invalidate(self):
+        """重建日记流，失败时删除缓存，由下一个请求重建"""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[警告] 重建最新日记流失败: {e}", file=sys.stderr)
+            cache.delete(self.NAMESPACE, self.KEY)
+
+    def _after_commit(self, session):
+        if session.info.pop('recent_feed_dirty', False):
+            self.invalidate()
+
+    def _after_rollback(self, session):
+        session.info.pop('recent_feed_dirty', None)
+
+
+recent_feed = RecentDiaryFeed(
+    limit=int(os.getenv('RECENT_FEED_LIMIT', 10)),
+    ttl=int(os.getenv('RECENT_FEED_TTL', 60)),
+    max_age=int(os.getenv('RECENT_FEED_MAX_AGE', 30))
+)
@@ -0,0 +1,319 @@
+"""
+日记全文检索
+默认使用自建倒排索引：中文连续汉字和英文/数字单词都切成 2 字符和 3 字符的 n-gram，
+日记新增、修改、删除时在同一事务里增量更新（SQLAlchemy after_flush 事件）。
+查询要求命中全部词项，按 tf * idf 排序并分页。
+
+SEARCH_BACKEND=native 时优先使用数据库自带的全文索引：
+- SQLite: FTS5 trigram 虚表 + 触发器
+- MySQL: ngram 解析器的 FULLTEXT 索引
+不可用时回退到自建倒排索引；单个汉字等无法切分的关键词回退到 LIKE。
+"""
+import math
+import os
+import re
+import sys
+from collections import Counter
+
+from sqlalchemy import Float, Integer, case, column, delete, event, func, select, text
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import DiarySearchTerm, EmotionDiary
+
+CJK_RUN = re.compile(r'[\u4e00-\u9fff]+')
+WORD = re.compile(r'[a-z0-9]+')
+MAX_TERM_LENGTH = 32
+MAX_PER_PAGE = 50
+
+
+def _runs(text_value):
+    """连续汉字串和英文/数字单词（单词转小写并截断到 MAX_TERM_LENGTH）"""
+    return CJK_RUN.findall(text_value) + [
+        word[:MAX_TERM_LENGTH] for word in WORD.findall(CJK_RUN.sub(' ', text_value.lower()))
+    ]
+
+
+def tokenize(text_value):
+    """切分日记内容，返回 {词项: 出现次数}"""
+    terms = Counter()
+    if not text_value:
+        return terms
+
+    # 英文单词和汉字一样切成 n-gram，搜 "hap" 也能命中 "happy"
+    for run in _runs(text_value):
+        for size in (2, 3):
+            for start in range(len(run) - size + 1):
+                terms[run[start:start + size]] += 1
+
+    return terms
+
+
+def query_terms(keyword):
+    """
+    把搜索词切成查询词项：2 个字符的汉字串/单词直接查，更长的用 3 字符 n-gram
+    含有无法切分的部分（单个汉字、单个字母）时返回 None
+    """
+    terms = []
+
+    for run in _runs(keyword):
+        if len(run) == 1:
+            return None
+        if len(run) == 2:
+            terms.append(run)
+        else:
+            terms.extend(run[start:start + 3] for start in range(len(run) - 2))
+
+    if re.sub(r'[\sa-z0-9]', '', CJK_RUN.sub(' ', keyword.lower())):
+        # 还有标点等其他字符，交给 LIKE 精确匹配
+        return None
+
+    return list(dict.fromkeys(terms)) or None
+
+
+class DiarySearchIndex:
+    """日记检索服务"""
+
+    FTS_TABLE = 'emotion_diaries_fts'
+    FULLTEXT_INDEX = 'ft_emotion_diaries_content'
+
+    def __init__(self):
+        self.backend = os.getenv('SEARCH_BACKEND', 'ngram').lower()
+        self.native_available = False
+        self._listening = False
+
+    def init_app(self, app):
+        if not self._listening:
+            event.listen(Session, 'after_flush', self._after_flush)
+            self._listening = True
+
+    # ---- 增量维护 ----
+
+    def _after_flush(self, session, flush_context):
+        changed = []
+        removed = []
+
+        for obj in session.new:
+            if isinstance(obj, EmotionDiary):
+                changed.append(obj)
+        for obj in session.dirty:
+            if isinstance(obj, EmotionDiary) and attributes.get_history(obj, 'content').has_changes():
+                changed.append(obj)
+        for obj in session.deleted:
+            if isinstance(obj, EmotionDiary):
+                removed.append(obj.id)
+
+        if not changed and not removed:
+            return
+
+        connection = session.connection()
+        if removed:
+            self.remove(connection, removed)
+        if changed:
+            self.index(connection, [(diary.id, diary.user_id, diary.content) for diary in changed])
+
+    def index(self, connection, diaries):
+        """重建指定日记的词项，diaries 为 [(diary_id, user_id, content)]"""
+        table = DiarySearchTerm.__table__
+        diaries = list(diaries)
+        if not diaries:
+            return
+
+        connection.execute(delete(table).where(table.c.diary_id.in_([diary_id for diary_id, _, _ in diaries])))
+
+        rows = [
+            {'diary_id': diary_id, 'user_id': user_id, 'term': term, 'tf': count}
+            for diary_id, user_id, content in diaries
+            for term, count in tokenize(content).items()
+        ]
+        if rows:
+            connection.execute(table.insert(), rows)
+
+    def remove(self, connection, diary_ids):
+        table = DiarySearchTerm.__table__
+        connection.execute(delete(table).where(table.c.diary_id.in_(list(diary_ids))))
+
+    def rebuild(self, batch_size=500):
+        """全量重建倒排索引（以及已启用的数据库全文索引），返回处理的日记数"""
+        table = DiarySearchTerm.__table__
+        total = 0
+
+        with db.engine.begin() as connection:
+            connection.execute(delete(table))
+
+        last_id = 0
+        while True:
+            with db.engine.begin() as connection:
+                batch = connection.execute(
+                    select(EmotionDiary.id, EmotionDiary.user_id, EmotionDiary.content)
+                    .where(EmotionDiary.id > last_id)
+                    .order_by(EmotionDiary.id)
+                    .limit(batch_size)
+                ).all()
+                if not batch:
+                    break
+                self.index(connection, [tuple(row) for row in batch])
+            total += len(batch)
+            last_id = batch[-1].id
+
+        if self.native_available and db.engine.url.get_backend_name() == 'sqlite':
+            with db.engine.begin() as connection:
+                connection.execute(text(f"INSERT INTO {self.FTS_TABLE}({self.FTS_TABLE}) VALUES ('rebuild')"))
+
+        return total
+
+    # ---- 数据库自带全文索引 ----
+
+    def ensure_native_index(self):
+        """SEARCH_BACKEND=native 时创建数据库全文索引，失败则回退到倒排索引"""
+        if self.backend != 'native':
+            return
+
+        engine_name = db.engine.url.get_backend_name()
+        try:
+            if engine_name == 'sqlite':
+                self._ensure_sqlite_fts()
+            elif engine_name == 'mysql':
+                self._ensure_mysql_fulltext()
+            else:
+                return
+            self.native_available = True
+        except Exception as e:
+            print(f"[警告] 数据库全文索引不可用，使用内置倒排索引: {e}", file=sys.stderr)
+            self.native_available = False
+
+    def _ensure_sqlite_fts(self):
+        fts = self.FTS_TABLE
+        with db.engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': fts}
+            ).first()
+            if exists:
+                return
+
+            # trigram 分词器需要 SQLite 3.34+
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5("
+                f"content, content='emotion_diaries', content_rowid='id', tokenize='trigram')"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON emotion_diaries BEGIN "
+                f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON emotion_diaries BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); END"
+            ))
+            connection.execute(text(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF content ON emotion_diaries BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); "
+                f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END"
+            ))
+            connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    def _ensure_mysql_fulltext(self):
+        with db.engine.begin() as connection:
+            exists = connection.execute(
+                text("SHOW INDEX FROM emotion_diaries WHERE Key_name = :name"),
+                {'name': self.FULLTEXT_INDEX}
+            ).first()
+            if not exists:
+                connection.execute(text(
+                    f"ALTER TABLE emotion_diaries ADD FULLTEXT INDEX {self.FULLTEXT_INDEX} (content) WITH PARSER ngram"
+                ))
+
+    def _native_scores(self, keyword):
+        """数据库全文索引的 (diary_id, score) 子查询，不适用时返回 None"""
+        if not self.native_available:
+            return None
+
+        phrase = '"' + keyword.replace('"', '""') + '"'
+        engine_name = db.engine.url.get_backend_name()
+
+        if engine_name == 'sqlite':
+            # trigram 至少需要 3 个字符
+            if len(keyword) < 3:
+                return None
+            statement = text(
+                f"SELECT rowid AS diary_id, -bm25({self.FTS_TABLE}) AS score "
+                f"FROM {self.FTS_TABLE} WHERE {self.FTS_TABLE} MATCH :phrase"
+            )
+        elif engine_name == 'mysql':
+            statement = text(
+                "SELECT id AS diary_id, MATCH(content) AGAINST (:phrase IN BOOLEAN MODE) AS score "
+                "FROM emotion_diaries WHERE MATCH(content) AGAINST (:phrase IN BOOLEAN MODE)"
+            )
+        else:
+            return None
+
+        return statement.bindparams(phrase=phrase).columns(
+            column('diary_id', Integer),
+            column('score', Float)
+        ).subquery('search_scores')
+
+    # ---- 查询 ----
+
+    def _ngram_scores(self, user_id, terms):
+        """倒排索引的 (diary_id, score) 子查询；某个词项完全不存在时返回 False"""
+        document_frequency = dict(
+            db.session.query(DiarySearchTerm.term, func.count())
+            .filter(DiarySearchTerm.user_id == user_id, DiarySearchTerm.term.in_(terms))
+            .group_by(DiarySearchTerm.term)
+            .all()
+        )
+        if len(document_frequency) < len(terms):
+            return False
+
+        total_docs = db.session.query(func.count(EmotionDiary.id)).filter(
+            EmotionDiary.user_id == user_id
+        ).scalar() or 1
+        idf = {
+            term: math.log(1 + total_docs / document_frequency[term])
+            for term in terms
+        }
+        weight = case(idf, value=DiarySearchTerm.term, else_=0.0)
+
+        return (
+            select(
+                DiarySearchTerm.diary_id.label('diary_id'),
+                func.sum(DiarySearchTerm.tf * weight).label('score')
+            )
+            .where(DiarySearchTerm.user_id == user_id, DiarySearchTerm.term.in_(terms))
+            .group_by(DiarySearchTerm.diary_id)
+            .having(func.count() == len(terms))
+            .subquery('search_scores')
+        )
+
+    def search(self, query, user_id, keyword, page=1, per_page=20):
+        """
+        在已按用户/标签/日期过滤的 EmotionDiary 查询上做关键词检索
+        返回 (本页日记, 命中总数)
+        """
+        # 页码小于 1 会得到负的 OFFSET（MySQL 直接报错）
+        page = max(page, 1)
+        per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+        scores = self._native_scores(keyword)
+        if scores is None:
+            terms = query_terms(keyword)
+            if terms is None:
+                # 无法切分的关键词退回 LIKE
+                query = query.filter(EmotionDiary.content.contains(keyword))
+                total = query.count()
+                diaries = query.order_by(EmotionDiary.created_at.desc()) \
+                    .offset((page - 1) * per_page).limit(per_page).all()
+                return diaries, total
+
+            scores = self._ngram_scores(user_id, terms)
+            if scores is False:
+                return [], 0
+
+        query = query.join(scores, EmotionDiary.id == scores.c.diary_id)
+        total = query.count()
+        diaries = query.order_by(scores.c.score.desc(), EmotionDiary.created_at.desc()) \
+            .offset((page - 1) * per_page).limit(per_page).all()
+        return diaries, total
+
+
+search_index = DiarySearchIndex()
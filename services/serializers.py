@@ -0,0 +1,79 @@
+"""
+只读列表接口的列投影序列化
+直接 SELECT 需要的列，把结果行转成与 to_dict() 相同结构的字典，
+不构造 ORM 对象、不进入 identity map；需要修改或访问关联时仍使用模型。
+"""
+from models import EmotionAnalysis, EmotionDiary
+
+DIARY_COLUMNS = (
+    EmotionDiary.id,
+    EmotionDiary.user_id,
+    EmotionDiary.content,
+    EmotionDiary.emotion_tags,
+    EmotionDiary.emotion_score,
+    EmotionDiary.trigger_event,
+    EmotionDiary.images,
+    EmotionDiary.created_at,
+    EmotionDiary.updated_at,
+    EmotionDiary.analysis_status
+)
+
+ANALYSIS_COLUMNS = (
+    EmotionAnalysis.id,
+    EmotionAnalysis.diary_id,
+    EmotionAnalysis.overall_emotion,
+    EmotionAnalysis.emotion_intensity,
+    EmotionAnalysis.emotion_dimensions,
+    EmotionAnalysis.key_words,
+    EmotionAnalysis.confidence_score,
+    EmotionAnalysis.analyzed_at,
+    EmotionAnalysis.ai_model_version,
+    EmotionAnalysis.analysis_payload
+)
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def diary_row_to_dict(row):
+    """DIARY_COLUMNS 查询结果行 -> 与 EmotionDiary.to_dict() 相同的字典"""
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'content': row.content,
+        'emotion_tags': row.emotion_tags,
+        'emotion_score': row.emotion_score,
+        'trigger_event': row.trigger_event,
+        'images': row.images if row.images else [],
+        'created_at': _isoformat(row.created_at),
+        'updated_at': _isoformat(row.updated_at),
+        'analysis_status': row.analysis_status
+    }
+
+
+# 与日记列一起查询时使用的带前缀分析列（analysis_id、analysis_overall_emotion ...）
+ANALYSIS_PREFIX = 'analysis_'
+PREFIXED_ANALYSIS_COLUMNS = tuple(
+    column.label(ANALYSIS_PREFIX + column.key) for column in ANALYSIS_COLUMNS
+)
+
+
+def analysis_row_to_dict(row, prefix=''):
+    """
+    ANALYSIS_COLUMNS 查询结果行 -> 与 EmotionAnalysis.to_dict() 相同的字典
+    prefix 为 ANALYSIS_PREFIX 时读取 PREFIXED_ANALYSIS_COLUMNS
+    """
+    values = row._mapping
+    return {
+        'id': values[prefix + 'id'],
+        'diary_id': values[prefix + 'diary_id'],
+        'overall_emotion': values[prefix + 'overall_emotion'],
+        'emotion_intensity': values[prefix + 'emotion_intensity'],
+        'emotion_dimensions': values[prefix + 'emotion_dimensions'],
+        'key_words': values[prefix + 'key_words'],
+        'confidence_score': values[prefix + 'confidence_score'],
+        'analyzed_at': _isoformat(values[prefix + 'analyzed_at']),
+        'ai_model_version': values[prefix + 'ai_model_version'],
+        'analysis_payload': values[prefix + 'analysis_payload'] or {}
+    }
@@ -0,0 +1,205 @@
+"""
+多进程共享的接口缓存
+键按 {前缀}:{命名空间}:{键} 组织，每条缓存有独立的过期时间，并可挂在若干标签下，
+按标签一次失效（例如 user:3 下的所有统计和详情）。
+
+后端通过 CACHE_BACKEND 选择：
+- auto: 配置了 REDIS_URL 且能连上时使用 Redis，否则回退到进程内缓存（默认）
+- redis: 强制使用 Redis
+- memory: 进程内缓存（单进程开发、测试）
+- none: 关闭缓存
+读写失败只打印警告并当作未命中，不影响接口。
+"""
+import os
+import sys
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class MemoryStore:
+    """进程内存储，接口与 RedisStore 一致"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+        return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {
+                    k: v for k, v in self._entries.items()
+                    if v[1] is None or v[1] >= now
+                }
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                    self._tags.clear()
+            self._entries[key] = (value, now + ttl if ttl else None)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_tags(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._entries.pop(key, None)
+
+    def clear(self, prefix):
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if not k.startswith(prefix)}
+            self._tags = {k: v for k, v in self._tags.items() if not k.startswith(prefix)}
+
+
+class RedisStore:
+    """Redis 存储；标签用集合记录其下的键，集合至少保留 tag_ttl 秒"""
+
+    def __init__(self, url, tag_ttl=24 * 3600):
+        self.tag_ttl = tag_ttl
+        if redis is None:
+            raise RuntimeError('redis package is not installed')
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.client.ping()
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None, tags=()):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(key, value, ex=ttl)
+        for tag in tags:
+            pipe.sadd(tag, key)
+            if ttl:
+                pipe.expire(tag, max(ttl, self.tag_ttl))
+            else:
+                pipe.persist(tag)
+        pipe.execute()
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*keys)
+
+    def invalidate_tags(self, *tags):
+        for tag in tags:
+            keys = self.client.smembers(tag)
+            pipe = self.client.pipeline(transaction=False)
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(tag)
+            pipe.execute()
+
+    def clear(self, prefix):
+        keys = list(self.client.scan_iter(f'{prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class SharedCache:
+    """缓存门面，在 init_extensions 中初始化"""
+
+    def __init__(self):
+        self.store = None
+        self.prefix = 'diary'
+        self.default_ttl = 300
+
+    def init_app(self, app):
+        self.prefix = app.config.get('CACHE_KEY_PREFIX') or os.getenv('CACHE_KEY_PREFIX', 'diary')
+        self.default_ttl = int(os.getenv('CACHE_DEFAULT_TTL', 300))
+        backend = os.getenv('CACHE_BACKEND', 'auto').lower()
+        url = app.config.get('REDIS_URL') or os.getenv('REDIS_URL')
+
+        self.store = None
+        if backend in ('auto', 'redis') and (url or backend == 'redis'):
+            try:
+                self.store = RedisStore(url or 'redis://localhost:6379/0')
+            except Exception as e:
+                print(f"[警告] Redis缓存不可用，使用进程内缓存: {e}", file=sys.stderr)
+        if self.store is None and backend != 'none':
+            self.store = MemoryStore(int(os.getenv('CACHE_MAX_ENTRIES', 4096)))
+
+        app.extensions['shared_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    @property
+    def shared(self):
+        """是否多进程共享（Redis）；进程内缓存的失效只作用于当前进程"""
+        return isinstance(self.store, RedisStore)
+
+    @property
+    def backend_name(self):
+        return type(self.store).__name__ if self.store else None
+
+    def make_key(self, namespace, key):
+        return f'{self.prefix}:{namespace}:{key}'
+
+    def make_tag(self, tag):
+        return f'{self.prefix}:tag:{tag}'
+
+    def get(self, namespace, key):
+        """返回缓存的 bytes，未命中返回 None"""
+        if not self.enabled:
+            return None
+        try:
+            return self.store.get(self.make_key(namespace, key))
+        except Exception as e:
+            print(f"[警告] 读取缓存失败: {e}", file=sys.stderr)
+            return None
+
+    def set(self, namespace, key, value, ttl=None, tags=()):
+        """写入 bytes；ttl 为 None 时使用 CACHE_DEFAULT_TTL"""
+        if not self.enabled:
+            return
+        try:
+            self.store.set(
+                self.make_key(namespace, key),
+                value,
+                ttl or self.default_ttl,
+                [self.make_tag(tag) for tag in tags]
+            )
+        except Exception as e:
+            print(f"[警告] 写入缓存失败: {e}", file=sys.stderr)
+
+    def delete(self, namespace, key):
+        if not self.enabled:
+            return
+        try:
+            self.store.delete(self.make_key(namespace, key))
+        except Exception as e:
+            print(f"[警告] 删除缓存失败: {e}", file=sys.stderr)
+
+    def invalidate_tags(self, *tags):
+        if not self.enabled or not tags:
+            return
+        try:
+            self.store.invalidate_tags(*[self.make_tag(tag) for tag in tags])
+        except Exception as e:
+            print(f"[警告] 按标签失效缓存失败: {e}", file=sys.stderr)
+
+    def clear(self):
+        if self.enabled:
+            self.store.clear(f'{self.prefix}:')
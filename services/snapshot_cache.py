@@ -0,0 +1,137 @@
+"""
+按用户缓存的接口快照
+缓存序列化后的 JSON 响应（存放在 extensions.cache，多进程共享），返回 ETag；
+日记、分析结果、游戏状态等写入并提交后，按 user:<id> 标签清除该用户的全部快照。
+If-None-Match 命中时直接返回 304，不访问数据库。
+失效必须到达所有 Web 进程，因此只在缓存为 Redis 时启用；进程内缓存只适用于单进程部署
+（SNAPSHOT_CACHE_LOCAL=true），否则不缓存，直接执行视图。
+"""
+import hashlib
+import os
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from extensions import cache
+from models import EmotionAnalysis, EmotionDiary, GameProgress, GameState, User
+
+
+def snapshot_response(etag, body):
+    """返回缓存快照；If-None-Match 与 ETag 一致时返回 304"""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+class UserSnapshotCache:
+    """按 (名称, 用户ID, 参数) 缓存接口响应"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.enabled = False
+        self._listening = False
+
+    def init_app(self, app):
+        local = os.getenv('SNAPSHOT_CACHE_LOCAL', 'false').lower() == 'true'
+        self.enabled = cache.enabled and (cache.shared or local)
+        if cache.enabled and not self.enabled:
+            app.logger.warning(
+                '接口快照缓存已关闭：进程内缓存无法在多个 Web 进程间失效，'
+                '请配置 REDIS_URL，单进程部署可设置 SNAPSHOT_CACHE_LOCAL=true'
+            )
+
+        if not self._listening:
+            event.listen(Session, 'after_flush', self._collect_users)
+            event.listen(Session, 'after_commit', self._invalidate_collected)
+            event.listen(Session, 'after_rollback', self._discard_collected)
+            self._listening = True
+
+    @staticmethod
+    def make_etag(body):
+        return hashlib.sha256(body).hexdigest()[:32]
+
+    @staticmethod
+    def user_tag(user_id):
+        return f'user:{user_id}'
+
+    def get(self, name, user_id, params=''):
+        """返回 (etag, body)，未命中返回 None"""
+        if not self.enabled:
+            return None
+        body = cache.get(name, f'{user_id}:{params}')
+        if body is None:
+            return None
+        return self.make_etag(body), body
+
+    def set(self, name, user_id, body, params=''):
+        if not self.enabled:
+            return self.make_etag(body)
+        cache.set(name, f'{user_id}:{params}', body, self.ttl, tags=[self.user_tag(user_id)])
+        return self.make_etag(body)
+
+    def invalidate(self, user_id):
+        cache.invalidate_tags(self.user_tag(user_id))
+
+    def cached(self, name, vary=()):
+        """
+        缓存当前登录用户的 200 JSON 响应，需放在 jwt_required 之后
+        缓存键包含路由参数和 vary 中列出的查询参数
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                user_id = get_jwt_identity()
+                params = urlencode(sorted(kwargs.items()) + [
+                    (arg, request.args[arg]) for arg in vary if arg in request.args
+                ])
+
+                hit = self.get(name, user_id, params)
+                if hit is not None:
+                    return snapshot_response(*hit)
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or not response.is_json:
+                    return response
+                etag = self.set(name, user_id, response.get_data(), params)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    # ---- 写入时失效 ----
+
+    def _collect_users(self, session, flush_context):
+        users = session.info.setdefault('snapshot_cache_users', set())
+        diary_ids = set()
+
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (EmotionDiary, GameState, GameProgress)):
+                users.add(obj.user_id)
+            elif isinstance(obj, EmotionAnalysis):
+                diary_ids.add(obj.diary_id)
+            elif isinstance(obj, User):
+                users.add(obj.id)
+
+        if diary_ids:
+            users.update(session.connection().execute(
+                select(EmotionDiary.user_id).where(EmotionDiary.id.in_(diary_ids))
+            ).scalars())
+
+    def _invalidate_collected(self, session):
+        for user_id in session.info.pop('snapshot_cache_users', set()):
+            if user_id is not None:
+                self.invalidate(user_id)
+
+    def _discard_collected(self, session):
+        session.info.pop('snapshot_cache_users', None)
+
+
+snapshot_cache = UserSnapshotCache(ttl=int(os.getenv('SNAPSHOT_CACHE_TTL', 60)))
@@ -0,0 +1,346 @@
+"""
+用户每日统计汇总（user_daily_stats）
+日记按 created_at 的 UTC 日期计数，情绪标签按日记日期计数，
+分析结果按 analyzed_at 的 UTC 日期累计数量和强度。
+
+维护方式：
+- before_flush：对将被修改/删除的日记和分析，从数据库读出旧值，记为负增量
+- after_flush：对新增/修改后的对象记正增量，并在同一事务中原子累加到汇总表
+统计接口只需读取 O(天数) 行汇总数据。
+"""
+import os
+from datetime import date, datetime
+
+from sqlalchemy import case, delete, event, func, inspect, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import EmotionAnalysis, EmotionDiary, UserDailyStat
+
+DIARY_FIELDS = ('user_id', 'created_at', 'emotion_tags')
+ANALYSIS_FIELDS = ('diary_id', 'overall_emotion', 'emotion_intensity', 'analyzed_at')
+COUNTERS = ('diary_count', 'tag_count', 'analysis_count', 'intensity_sum', 'intensity_count')
+MAX_EMOTION_LENGTH = 50
+# 分析结果没有情绪时使用的标签（统计接口的 SQL 查询路径使用同一个值）
+DEFAULT_EMOTION = 'neutral'
+
+
+def _day(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    # SQLite 的 date() 返回字符串
+    return date.fromisoformat(str(value)[:10])
+
+
+class StatsRollup:
+    """每日统计汇总维护与查询"""
+
+    def __init__(self):
+        self.enabled = os.getenv('STATS_ROLLUP', 'true').lower() == 'true'
+        self._listening = False
+        self._ready_engines = set()
+
+    def is_ready(self, connection):
+        """汇总表已存在时才维护和读取（只缓存肯定的结果）"""
+        engine = connection.engine
+        if engine.url not in self._ready_engines:
+            if not inspect(connection).has_table(UserDailyStat.__tablename__):
+                return False
+            self._ready_engines.add(engine.url)
+        return True
+
+    def init_app(self, app):
+        if self.enabled and not self._listening:
+            event.listen(Session, 'before_flush', self._before_flush)
+            event.listen(Session, 'after_flush', self._after_flush)
+            self._listening = True
+
+    # ---- 增量计算 ----
+
+    @staticmethod
+    def _add(deltas, user_id, day, emotion, sign=1, **counters):
+        if user_id is None or day is None:
+            return
+        key = (int(user_id), day, (emotion or '')[:MAX_EMOTION_LENGTH])
+        current = deltas.setdefault(key, dict.fromkeys(COUNTERS, 0))
+        for name, value in counters.items():
+            current[name] += sign * value
+
+    def _add_diary(self, deltas, user_id, created_at, tags, sign):
+        day = _day(created_at)
+        self._add(deltas, user_id, day, '', sign, diary_count=1)
+        for tag in set(tags or []):
+            if isinstance(tag, str) and tag:
+                self._add(deltas, user_id, day, tag, sign, tag_count=1)
+
+    def _add_analysis(self, deltas, user_id, emotion, intensity, analyzed_at, sign):
+        counters = {'analysis_count': 1}
+        if intensity is not None:
+            counters['intensity_sum'] = float(intensity)
+            counters['intensity_count'] = 1
+        self._add(deltas, user_id, _day(analyzed_at), emotion or DEFAULT_EMOTION, sign, **counters)
+
+    @staticmethod
+    def _changed(session, obj, fields):
+        if not session.is_modified(obj, include_collections=False):
+            return False
+        state = inspect(obj)
+        return any(state.attrs[name].history.has_changes() for name in fields)
+
+    def _before_flush(self, session, flush_context, instances):
+        """从数据库读出将被修改/删除记录的旧值，记为负增量"""
+        session.info.pop('stats_rollup_deltas', None)
+        old_diary_ids = set()
+        old_analysis_ids = set()
+
+        for obj in session.deleted:
+            if isinstance(obj, EmotionDiary):
+                old_diary_ids.add(obj.id)
+            elif isinstance(obj, EmotionAnalysis):
+                old_analysis_ids.add(obj.id)
+        for obj in session.dirty:
+            if isinstance(obj, EmotionDiary) and self._changed(session, obj, DIARY_FIELDS):
+                old_diary_ids.add(obj.id)
+            elif isinstance(obj, EmotionAnalysis) and self._changed(session, obj, ANALYSIS_FIELDS):
+                old_analysis_ids.add(obj.id)
+
+        if not old_diary_ids and not old_analysis_ids:
+            return
+
+        connection = session.connection()
+        if not self.is_ready(connection):
+            return
+
+        deltas = {}
+
+        if old_diary_ids:
+            rows = connection.execute(
+                select(EmotionDiary.user_id, EmotionDiary.created_at, EmotionDiary.emotion_tags)
+                .where(EmotionDiary.id.in_(old_diary_ids))
+            )
+            for user_id, created_at, tags in rows:
+                self._add_diary(deltas, user_id, created_at, tags, -1)
+
+        # 被删除日记的分析结果会级联删除，一并扣除
+        deleted_diary_ids = {obj.id for obj in session.deleted if isinstance(obj, EmotionDiary)}
+        condition = EmotionAnalysis.id.in_(old_analysis_ids)
+        if deleted_diary_ids:
+            condition = condition | EmotionAnalysis.diary_id.in_(deleted_diary_ids)
+        rows = connection.execute(
+            select(
+                EmotionDiary.user_id,
+                EmotionAnalysis.overall_emotion,
+                EmotionAnalysis.emotion_intensity,
+                EmotionAnalysis.analyzed_at
+            )
+            .join(EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id)
+            .where(condition)
+        )
+        for user_id, emotion, intensity, analyzed_at in rows:
+            self._add_analysis(deltas, user_id, emotion, intensity, analyzed_at, -1)
+
+        session.info['stats_rollup_deltas'] = deltas
+
+    def _after_flush(self, session, flush_context):
+        """记入新增/修改后的值，与负增量合并后写入汇总表"""
+        deltas = session.info.pop('stats_rollup_deltas', {})
+
+        connection = session.connection()
+        if not self.is_ready(connection):
+            return
+
+        analyses = []
+        for obj in session.new:
+            if isinstance(obj, EmotionDiary):
+                self._add_diary(deltas, obj.user_id, obj.created_at, obj.emotion_tags, 1)
+            elif isinstance(obj, EmotionAnalysis):
+                analyses.append(obj)
+        for obj in session.dirty:
+            if isinstance(obj, EmotionDiary) and self._changed(session, obj, DIARY_FIELDS):
+                self._add_diary(deltas, obj.user_id, obj.created_at, obj.emotion_tags, 1)
+            elif isinstance(obj, EmotionAnalysis) and self._changed(session, obj, ANALYSIS_FIELDS):
+                analyses.append(obj)
+
+        # 同一次 flush 中被删除的日记，其分析结果不再计入
+        deleted_diary_ids = {obj.id for obj in session.deleted if isinstance(obj, EmotionDiary)}
+        analyses = [obj for obj in analyses if obj.diary_id not in deleted_diary_ids]
+
+        if analyses:
+            owners = dict(connection.execute(
+                select(EmotionDiary.id, EmotionDiary.user_id)
+                .where(EmotionDiary.id.in_({obj.diary_id for obj in analyses}))
+            ).all())
+            for obj in analyses:
+                self._add_analysis(
+                    deltas, owners.get(obj.diary_id), obj.overall_emotion,
+                    obj.emotion_intensity, obj.analyzed_at, 1
+                )
+
+        self.apply(connection, deltas)
+
+    def record_diaries(self, connection, diaries):
+        """
+        计入绕过 ORM 写入的新日记（批量导入），diaries 为 [(user_id, created_at, emotion_tags)]
+        需在写入日记的同一事务中调用
+        """
+        if not self.enabled or not self.is_ready(connection):
+            return
+        deltas = {}
+        for user_id, created_at, tags in diaries:
+            self._add_diary(deltas, user_id, created_at, tags, 1)
+        self.apply(connection, deltas)
+
+    def apply(self, connection, deltas):
+        """把增量原子地累加到汇总表"""
+        rows = [
+            {'user_id': user_id, 'day': day, 'emotion': emotion, **counters}
+            for (user_id, day, emotion), counters in deltas.items()
+            if any(counters.values())
+        ]
+        if not rows:
+            return
+
+        table = UserDailyStat.__table__
+        engine_name = connection.engine.url.get_backend_name()
+
+        if engine_name == 'sqlite':
+            statement = sqlite_insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id', 'day', 'emotion'],
+                set_={name: table.c[name] + statement.excluded[name] for name in COUNTERS}
+            )
+            connection.execute(statement, rows)
+        elif engine_name == 'mysql':
+            statement = mysql_insert(table)
+            statement = statement.on_duplicate_key_update(
+                {name: table.c[name] + statement.inserted[name] for name in COUNTERS}
+            )
+            connection.execute(statement, rows)
+        else:
+            for row in rows:
+                key = (table.c.user_id == row['user_id']) & (table.c.day == row['day']) & \
+                      (table.c.emotion == row['emotion'])
+                result = connection.execute(
+                    table.update().where(key).values({name: table.c[name] + row[name] for name in COUNTERS})
+                )
+                if result.rowcount == 0:
+                    connection.execute(table.insert().values(**row))
+
+    # ---- 回填 ----
+
+    def rebuild(self, user_id=None):
+        """从原始数据重建汇总表（可只重建一个用户），返回写入的行数"""
+        table = UserDailyStat.__table__
+        deltas = {}
+
+        diary_filter = [EmotionDiary.user_id == user_id] if user_id is not None else []
+        with db.engine.connect() as connection:
+            for diary_user, created_at, tags in connection.execute(
+                select(EmotionDiary.user_id, EmotionDiary.created_at, EmotionDiary.emotion_tags)
+                .where(*diary_filter)
+                .execution_options(yield_per=1000)
+            ):
+                self._add_diary(deltas, diary_user, created_at, tags, 1)
+
+            day = func.date(EmotionAnalysis.analyzed_at)
+            for analysis_user, analysis_day, emotion, count, intensity_sum, intensity_count in connection.execute(
+                select(
+                    EmotionDiary.user_id,
+                    day,
+                    EmotionAnalysis.overall_emotion,
+                    func.count(),
+                    func.coalesce(func.sum(EmotionAnalysis.emotion_intensity), 0.0),
+                    func.count(EmotionAnalysis.emotion_intensity)
+                )
+                .join(EmotionDiary, EmotionAnalysis.diary_id == EmotionDiary.id)
+                .where(*diary_filter)
+                .group_by(EmotionDiary.user_id, day, EmotionAnalysis.overall_emotion)
+            ):
+                self._add(
+                    deltas, analysis_user, _day(analysis_day), emotion or DEFAULT_EMOTION,
+                    analysis_count=count,
+                    intensity_sum=float(intensity_sum or 0),
+                    intensity_count=intensity_count
+                )
+
+        with db.engine.begin() as connection:
+            if user_id is not None:
+                connection.execute(delete(table).where(table.c.user_id == user_id))
+            else:
+                connection.execute(delete(table))
+            self.apply(connection, deltas)
+
+        return len(deltas)
+
+    # ---- 查询 ----
+
+    def available(self):
+        """统计接口是否可以读取汇总表"""
+        return self.enabled and self.is_ready(db.session.connection())
+
+    def totals(self, user_id, since_day):
+        """
+        一次查询返回用户的汇总：
+        日记总数、since_day 以来的日记数、分析总数、{情绪标签: 日记数}
+        """
+        rows = db.session.query(
+            UserDailyStat.emotion,
+            func.sum(UserDailyStat.diary_count),
+            func.sum(case((UserDailyStat.day >= since_day, UserDailyStat.diary_count), else_=0)),
+            func.sum(UserDailyStat.tag_count),
+            func.sum(UserDailyStat.analysis_count)
+        ).filter(
+            UserDailyStat.user_id == user_id
+        ).group_by(UserDailyStat.emotion).all()
+
+        result = {'total_diaries': 0, 'recent_diaries': 0, 'total_analyses': 0, 'tags': {}}
+        for emotion, diaries, recent, tags, analyses in rows:
+            result['total_analyses'] += int(analyses or 0)
+            if emotion == '':
+                result['total_diaries'] = int(diaries or 0)
+                result['recent_diaries'] = int(recent or 0)
+            elif tags:
+                result['tags'][emotion] = int(tags)
+        return result
+
+    def daily_trend(self, user_id, start_day):
+        """start_day 以来每天的分析数、平均强度和出现最多的情绪"""
+        rows = db.session.query(
+            UserDailyStat.day,
+            UserDailyStat.emotion,
+            UserDailyStat.analysis_count,
+            UserDailyStat.intensity_sum,
+            UserDailyStat.intensity_count
+        ).filter(
+            UserDailyStat.user_id == user_id,
+            UserDailyStat.day >= start_day,
+            UserDailyStat.analysis_count > 0
+        ).order_by(UserDailyStat.day, UserDailyStat.emotion).all()
+
+        days = {}
+        for day, emotion, count, intensity_sum, intensity_count in rows:
+            bucket = days.setdefault(day, {'count': 0, 'sum': 0.0, 'n': 0, 'emotions': {}})
+            bucket['count'] += count
+            bucket['sum'] += intensity_sum
+            bucket['n'] += intensity_count
+            bucket['emotions'][emotion] = bucket['emotions'].get(emotion, 0) + count
+
+        return [
+            {
+                'date': day.isoformat(),
+                # 次数相同时取情绪名较小的，与 SQL 统计的 ORDER BY count DESC, emotion 一致
+                'emotion': min(bucket['emotions'].items(), key=lambda item: (-item[1], item[0]))[0],
+                'intensity': round(bucket['sum'] / bucket['n'], 2) if bucket['n'] else 0,
+                'count': bucket['count']
+            }
+            for day, bucket in days.items()
+        ]
+
+
+stats_rollup = StatsRollup()
@@ -0,0 +1,228 @@
+"""
+上传目录垃圾回收
+删除 static/uploads 中没有任何日记引用、且超过保留期的图片（上传后未保存的、日记删除后遗留的）。
+
+- 用一条流式查询（yield_per）读取全部日记的 images，得到被引用图片的集合；
+  集合中只保存路径去掉扩展名后的 64 位哈希，缩略图（<原文件名>_thumb.webp 等）随原图一起判断
+- 用 os.scandir 逐个遍历目录，不一次性列出全部文件；待删除的文件按批处理
+- 原图和缩略图按组判断保留期（取组内最新的修改时间），删除前重新读取修改时间
+内存占用只与被引用的图片数有关，与目录中的文件数无关。
+删除前再按 stored_images.ref_count 复查一次，避免删掉扫描期间刚被日记引用的图片。
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import select
+
+from extensions import db
+from models import EmotionDiary, StoredImage
+from services.image_store import image_path, image_store
+from services.image_variants import VARIANT_SIZES
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境没有 fcntl，不做跨进程互斥
+    fcntl = None
+
+BATCH_SIZE = 500
+# 按内容寻址的原图和缩略图：ab/<sha256>.png、ab/<sha256>_thumb.webp
+CONTENT_NAME = re.compile(r'^[0-9a-f]{2}/([0-9a-f]{64})[._]')
+
+
+def _key(path):
+    """路径（去掉扩展名和缩略图后缀）-> 64 位整数"""
+    base = path.rsplit('.', 1)[0]
+    prefix, _, suffix = base.rpartition('_')
+    if prefix and suffix in VARIANT_SIZES:
+        base = prefix
+    return int.from_bytes(hashlib.blake2b(base.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class UploadGarbageCollector:
+    """清理未被引用的上传图片"""
+
+    def __init__(self):
+        self.app = None
+        self.interval = 0
+        self.grace_seconds = 24 * 3600
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = int(os.getenv('UPLOAD_GC_INTERVAL', 0))
+        self.grace_seconds = int(float(os.getenv('UPLOAD_GC_GRACE_HOURS', 24)) * 3600)
+
+        # 定时清理默认关闭；开启后在处理请求的进程内启动线程
+        app.before_request(self.ensure_started)
+
+    def referenced_keys(self):
+        """一条流式查询得到所有被日记引用的图片"""
+        keys = set()
+        with db.engine.connect() as connection:
+            for (images,) in connection.execute(
+                select(EmotionDiary.images).execution_options(yield_per=1000)
+            ):
+                if isinstance(images, list):
+                    keys.update(_key(path) for path in map(image_path, images) if path)
+        return keys
+
+    def _scan(self, root):
+        """逐个目录产生上传目录（含子目录）中的文件：[(相对路径, 大小, 修改时间)]"""
+        pending = ['']
+        while pending:
+            relative_dir = pending.pop()
+            try:
+                entries = os.scandir(os.path.join(root, relative_dir))
+            except FileNotFoundError:
+                continue
+            files = []
+            with entries:
+                for entry in entries:
+                    relative = f'{relative_dir}/{entry.name}' if relative_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(relative)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files.append((relative, stat.st_size, stat.st_mtime))
+            yield files
+
+    def collect(self, grace_seconds=None, dry_run=False, now=None):
+        """执行一次回收，返回统计信息"""
+        grace_seconds = self.grace_seconds if grace_seconds is None else grace_seconds
+        cutoff = (now or time.time()) - grace_seconds
+        root = os.path.join(os.getcwd(), image_store.upload_folder)
+        report = {
+            'scanned': 0, 'deleted': 0, 'reclaimed_bytes': 0,
+            'referenced': 0, 'recent': 0, 'errors': 0, 'dry_run': dry_run
+        }
+
+        referenced = self.referenced_keys()
+        batch = []
+        for files in self._scan(root):
+            # 原图和缩略图在同一目录，按原图分组，组内最新的修改时间决定是否过了保留期
+            groups = {}
+            for path, size, mtime in files:
+                report['scanned'] += 1
+                key = _key(path)
+                if key in referenced:
+                    report['referenced'] += 1
+                else:
+                    groups.setdefault(key, []).append((path, size, mtime))
+
+            for group in groups.values():
+                if max(mtime for _, _, mtime in group) > cutoff:
+                    report['recent'] += len(group)
+                    continue
+                batch.append(group)
+                if len(batch) >= BATCH_SIZE:
+                    self._delete_batch(root, batch, report, dry_run, cutoff)
+                    batch = []
+        if batch:
+            self._delete_batch(root, batch, report, dry_run, cutoff)
+
+        return report
+
+    @staticmethod
+    def _is_recent(root, group, cutoff):
+        """删除前重新读取修改时间：扫描之后可能刚被重复上传命中（image_store.find 会更新）"""
+        for path, _, _ in group:
+            try:
+                if os.stat(os.path.join(root, path)).st_mtime > cutoff:
+                    return True
+            except FileNotFoundError:
+                pass
+        return False
+
+    def _delete_batch(self, root, batch, report, dry_run, cutoff):
+        # 扫描期间新保存的日记会同时增加 ref_count，这些图片不删除
+        # （缩略图没有自己的记录，按文件名中的 sha256 找到原图）
+        table = StoredImage.__table__
+        paths = [path for group in batch for path, _, _ in group]
+        hashes = {match.group(1) for match in map(CONTENT_NAME.match, paths) if match}
+        in_use = {
+            _key(path) for (path,) in db.session.execute(
+                select(table.c.path).where(
+                    table.c.path.in_(paths) | table.c.sha256.in_(hashes),
+                    table.c.ref_count > 0
+                )
+            )
+        }
+
+        removed = []
+        for group in batch:
+            if _key(group[0][0]) in in_use:
+                report['referenced'] += len(group)
+                continue
+            if self._is_recent(root, group, cutoff):
+                report['recent'] += len(group)
+                continue
+            for path, size, _ in group:
+                if not dry_run:
+                    try:
+                        os.remove(os.path.join(root, path))
+                    except FileNotFoundError:
+                        continue
+                    except OSError:
+                        report['errors'] += 1
+                        continue
+                removed.append(path)
+                report['deleted'] += 1
+                report['reclaimed_bytes'] += size
+
+        if removed and not dry_run:
+            db.session.execute(
+                table.delete().where(table.c.path.in_(removed), table.c.ref_count <= 0)
+            )
+            # 原图记录仍在（删除失败或正被引用）而缩略图已删除时，清空 variants，下次上传命中时重新生成
+            removed_hashes = {match.group(1) for match in map(CONTENT_NAME.match, removed) if match}
+            if removed_hashes:
+                db.session.execute(
+                    table.update().where(table.c.sha256.in_(removed_hashes)).values(variants=None)
+                )
+            db.session.commit()
+
+    # ---- 定时执行 ----
+
+    def run_exclusive(self, **kwargs):
+        """多个进程都开启定时清理时，同一时间只有一个进程执行；未拿到锁时返回 None"""
+        if fcntl is None:
+            return self.collect(**kwargs)
+
+        lock_path = os.path.join(os.getcwd(), self.app.config.get('UPLOAD_TMP_FOLDER', 'tmp/uploads'), 'gc.lock')
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            return self.collect(**kwargs)
+
+    def ensure_started(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='upload-gc', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    report = self.run_exclusive()
+                    if report and report['deleted']:
+                        self.app.logger.info(
+                            f"清理未引用的上传图片 {report['deleted']} 个，释放 {report['reclaimed_bytes']} 字节"
+                        )
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.warning(f'清理上传图片失败: {e}')
+
+
+upload_gc = UploadGarbageCollector()
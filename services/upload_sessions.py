@@ -0,0 +1,321 @@
+"""
+可续传的分块上传
+init 创建上传会话，客户端按顺序 PUT 分块（带偏移量和分块 SHA-256），断线后查询已接收的偏移量继续上传，
+complete 时在会话锁内校验整体哈希并交给 image_store 保存，重复的 complete 返回同一结果。
+
+会话状态全部保存在磁盘上（UPLOAD_TMP_FOLDER/sessions/<upload_id>/），多个 Web 进程共享：
+- data：目标文件，分块直接写到对应偏移处，complete 时原子重命名为最终文件，不做拼接和复制
+- meta.json：用户、文件名、总大小、已确认的偏移量、过期时间
+分块校验失败时偏移量不前进，之后的数据会被下一次上传覆盖。
+超过 UPLOAD_SESSION_TTL 没有活动的会话由后台清理线程删除。
+"""
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from services.upload_stream import CHUNK_SIZE, SpooledUpload, UploadError, UploadTooLarge, format_size
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境没有 fcntl，只在进程内加锁
+    fcntl = None
+
+UPLOAD_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+SHA256_HEX = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadSessionNotFound(UploadError):
+    """会话不存在、已过期或不属于当前用户"""
+
+
+class UploadOffsetMismatch(UploadError):
+    """分块偏移量与已接收的数据不一致，offset 为服务器端的当前偏移量"""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadSessionStore:
+    """分块上传会话"""
+
+    def __init__(self):
+        self.app = None
+        self.tmp_folder = 'tmp/uploads'
+        self.chunk_size = 1024 * 1024
+        self.ttl = 24 * 3600
+        self.sweep_interval = 600
+        self._thread_lock = threading.Lock()
+        self._session_lock = threading.Lock()
+        self._sweeper_pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.tmp_folder = app.config.get('UPLOAD_TMP_FOLDER', self.tmp_folder)
+        self.chunk_size = int(os.getenv('UPLOAD_CHUNK_SIZE', self.chunk_size))
+        self.ttl = int(os.getenv('UPLOAD_SESSION_TTL', self.ttl))
+        self.sweep_interval = int(os.getenv('UPLOAD_SWEEP_INTERVAL', self.sweep_interval))
+
+        # 与分析队列相同：gunicorn 导入后才 fork，清理线程在处理请求的进程内启动
+        app.before_request(self.ensure_sweeper)
+
+    @property
+    def sessions_path(self):
+        return os.path.join(os.getcwd(), self.tmp_folder, 'sessions')
+
+    def _directory(self, upload_id):
+        if not isinstance(upload_id, str) or not UPLOAD_ID.match(upload_id):
+            raise UploadSessionNotFound('上传会话不存在')
+        return os.path.join(self.sessions_path, upload_id)
+
+    # ---- 会话元数据 ----
+
+    @staticmethod
+    def _read_meta(directory):
+        try:
+            with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_meta(directory, meta):
+        path = os.path.join(directory, 'meta.json')
+        with open(f'{path}.part', 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(f'{path}.part', path)
+
+    @contextmanager
+    def _locked(self, directory):
+        """同一会话的写操作串行执行（跨进程用 flock）"""
+        if fcntl is None:
+            with self._session_lock:
+                yield
+            return
+        with open(os.path.join(directory, 'lock'), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def _locked_meta(self, directory):
+        """加锁后重新读取元数据（会话可能已被其他请求完成或清理）"""
+        meta = self._read_meta(directory)
+        if meta is None:
+            raise UploadSessionNotFound('上传会话不存在')
+        return meta
+
+    def _touch(self, meta):
+        meta['expires_at'] = time.time() + self.ttl
+
+    @staticmethod
+    def describe(upload_id, meta):
+        return {
+            'upload_id': upload_id,
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': meta['offset'],
+            'chunk_size': meta['chunk_size'],
+            'completed': 'result' in meta,
+            'expires_at': datetime.fromtimestamp(meta['expires_at'], timezone.utc).isoformat()
+        }
+
+    # ---- 协议 ----
+
+    def create(self, user_id, filename, size, max_size, sha256=None):
+        """创建会话并预分配目标文件，返回会话描述"""
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError('文件大小无效')
+        if size > max_size:
+            raise UploadTooLarge(f'文件过大，最大支持 {format_size(max_size)}')
+        if sha256 is not None and not SHA256_HEX.match(sha256):
+            raise UploadError('无效的哈希值')
+
+        upload_id = secrets.token_urlsafe(18)
+        directory = os.path.join(self.sessions_path, upload_id)
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'data'), 'wb') as data_file:
+            data_file.truncate(size)
+
+        meta = {
+            'user_id': str(user_id),
+            'filename': filename,
+            'size': size,
+            'sha256': sha256,
+            'offset': 0,
+            'chunk_size': self.chunk_size,
+            'created_at': time.time()
+        }
+        self._touch(meta)
+        self._write_meta(directory, meta)
+        return self.describe(upload_id, meta)
+
+    def get(self, user_id, upload_id):
+        directory = self._directory(upload_id)
+        meta = self._read_meta(directory)
+        if meta is None or meta['user_id'] != str(user_id) or meta['expires_at'] < time.time():
+            raise UploadSessionNotFound('上传会话不存在')
+        return directory, meta
+
+    def write_chunk(self, user_id, upload_id, offset, stream, checksum, content_length=None):
+        """
+        把一个分块写到 offset 处，边写边计算 SHA-256，与 checksum 一致时才确认
+        offset 必须等于已确认的偏移量，否则抛出 UploadOffsetMismatch，客户端从其中的 offset 继续
+        """
+        if not isinstance(checksum, str) or not SHA256_HEX.match(checksum.lower()):
+            raise UploadError('缺少分块校验值 X-Chunk-SHA256')
+
+        directory, meta = self.get(user_id, upload_id)
+        with self._locked(directory):
+            meta = self._locked_meta(directory)
+            if 'result' in meta:
+                raise UploadError('上传已完成')
+            if offset != meta['offset']:
+                raise UploadOffsetMismatch('分块偏移量不一致', meta['offset'])
+
+            limit = min(meta['chunk_size'], meta['size'] - offset)
+            if content_length is not None and content_length > limit:
+                raise UploadTooLarge(f'分块过大，最多 {limit} 字节')
+
+            hasher = hashlib.sha256()
+            received = 0
+            with open(os.path.join(directory, 'data'), 'r+b') as data_file:
+                data_file.seek(offset)
+                while True:
+                    block = stream.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    received += len(block)
+                    if received > limit:
+                        raise UploadTooLarge(f'分块过大，最多 {limit} 字节')
+                    hasher.update(block)
+                    data_file.write(block)
+
+            if received == 0:
+                raise UploadError('分块为空')
+            if content_length is not None and received != content_length:
+                raise UploadError('分块不完整')
+            if hasher.hexdigest() != checksum.lower():
+                raise UploadError('分块校验失败')
+
+            meta['offset'] = offset + received
+            self._touch(meta)
+            self._write_meta(directory, meta)
+            return self.describe(upload_id, meta)
+
+    def complete(self, user_id, upload_id, save):
+        """
+        全部数据接收完成后校验整体哈希，调用 save(SpooledUpload) 保存（data 文件本身，由 image_store 原子重命名）
+        校验、保存都在会话锁内完成，结果写入 meta.json：客户端超时重试时直接返回同一结果，
+        会话目录保留到过期后由清理线程删除
+        """
+        directory, meta = self.get(user_id, upload_id)
+        with self._locked(directory):
+            meta = self._locked_meta(directory)
+            if 'result' in meta:
+                return meta['result']
+            if meta['offset'] != meta['size']:
+                raise UploadOffsetMismatch('文件尚未上传完成', meta['offset'])
+
+            data_path = os.path.join(directory, 'data')
+            hasher = hashlib.sha256()
+            with open(data_path, 'rb') as data_file:
+                for block in iter(lambda: data_file.read(CHUNK_SIZE), b''):
+                    hasher.update(block)
+            sha256 = hasher.hexdigest()
+            if meta['sha256'] and meta['sha256'] != sha256:
+                raise UploadError('文件校验失败')
+
+            result = save(SpooledUpload(data_path, meta['filename'], meta['size'], sha256))
+            meta['result'] = result
+            self._touch(meta)
+            self._write_meta(directory, meta)
+            return result
+
+    def finish(self, upload_id):
+        """删除会话目录（客户端放弃上传时）"""
+        shutil.rmtree(self._directory(upload_id), ignore_errors=True)
+
+    def abort(self, user_id, upload_id):
+        self.get(user_id, upload_id)
+        self.finish(upload_id)
+
+    # ---- 清理 ----
+
+    def sweep(self, now=None):
+        """
+        删除过期的会话，以及超过 TTL 仍留在临时目录中的单次上传文件（进程中断时遗留）
+        返回 (删除的会话数, 释放的字节数)
+        """
+        now = now or time.time()
+        removed = 0
+        reclaimed = 0
+
+        if os.path.isdir(self.sessions_path):
+            with os.scandir(self.sessions_path) as entries:
+                for entry in entries:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                    meta = self._read_meta(entry.path)
+                    if meta is not None:
+                        expired = meta.get('expires_at', 0) < now
+                    else:
+                        expired = entry.stat().st_mtime + self.ttl < now
+                    if expired:
+                        reclaimed += _tree_size(entry.path)
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        removed += 1
+
+        tmp_path = os.path.join(os.getcwd(), self.tmp_folder)
+        if os.path.isdir(tmp_path):
+            with os.scandir(tmp_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.upload') and entry.is_file(follow_symlinks=False):
+                        stat = entry.stat()
+                        if stat.st_mtime + self.ttl < now:
+                            try:
+                                os.remove(entry.path)
+                                reclaimed += stat.st_size
+                            except FileNotFoundError:
+                                pass
+
+        return removed, reclaimed
+
+    def ensure_sweeper(self):
+        """确保当前进程的清理线程已启动"""
+        if self.sweep_interval <= 0 or self._sweeper_pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_loop, name='upload-session-sweeper', daemon=True).start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed, reclaimed = self.sweep()
+                if removed:
+                    self.app.logger.info(f'清理过期上传会话 {removed} 个，释放 {reclaimed} 字节')
+            except Exception as e:
+                self.app.logger.warning(f'清理上传会话失败: {e}')
+
+
+def _tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+upload_sessions = UploadSessionStore()
@@ -0,0 +1,180 @@
+"""
+流式接收上传文件
+按固定大小分块读取请求体，边读边写入临时文件并计算 SHA-256，
+超过大小限制的第一个分块到达时立即停止读取；完成后用原子重命名放到目标位置。
+每个上传占用的内存与文件大小无关（multipart 由 werkzeug 的增量解析器逐块解析）。
+"""
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+CHUNK_SIZE = 64 * 1024
+# multipart 边界和分段头的额外开销，用于在读取前按 Content-Length 拒绝
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def format_size(size):
+    if size >= 1024 * 1024:
+        return f'{size / (1024 * 1024):g}MB'
+    return f'{size / 1024:g}KB'
+
+
+class UploadError(ValueError):
+    """请求不合法（缺少文件、格式错误等）"""
+
+
+class UploadTooLarge(UploadError):
+    """文件超过大小限制"""
+
+
+class SpooledUpload:
+    """已完整写入临时文件的上传"""
+
+    def __init__(self, path, filename, size, sha256):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.moved = False
+
+    def move_to(self, destination):
+        """原子地移动到目标路径，目标目录需已存在"""
+        try:
+            os.replace(self.path, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # 临时目录与目标不在同一文件系统：先复制到目标目录，再在目录内重命名
+            partial = f'{destination}.part'
+            shutil.copyfile(self.path, partial)
+            os.replace(partial, destination)
+            os.remove(self.path)
+        self.path = destination
+        self.moved = True
+
+    def discard(self):
+        """删除临时文件，已移动到目标位置后不再处理"""
+        if self.moved:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _SpoolWriter:
+    """写入临时文件，同时计数和计算哈希"""
+
+    def __init__(self, tmp_folder, max_size):
+        os.makedirs(tmp_folder, exist_ok=True)
+        handle, self.path = tempfile.mkstemp(dir=tmp_folder, suffix='.upload')
+        self.file = os.fdopen(handle, 'wb')
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLarge(f'文件过大，最大支持 {format_size(self.max_size)}')
+        self.hasher.update(data)
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _read_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _check_filename(filename, allowed):
+    if not filename:
+        raise UploadError('文件名为空')
+    if allowed is not None and not allowed(filename):
+        raise UploadError('不支持的文件类型')
+
+
+def _receive_multipart(request, writer, field_name, allowed):
+    """增量解析 multipart，只把 field_name 对应的文件内容写入 writer，返回原始文件名"""
+    boundary = request.mimetype_params.get('boundary')
+    if not boundary:
+        raise UploadError('multipart 请求缺少 boundary')
+
+    # 每读入一块都会取完事件，解析器缓冲区不会超过几个分块
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=4 * CHUNK_SIZE)
+    filename = None
+    in_file = False
+
+    for chunk in _read_chunks(request.stream):
+        decoder.receive_data(chunk)
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                in_file = event.name == field_name and filename is None
+                if in_file:
+                    filename = event.filename or ''
+                    # 读到文件头就检查文件名，不合法时不再读取内容
+                    _check_filename(filename, allowed)
+            elif isinstance(event, Field):
+                in_file = False
+            elif isinstance(event, Data) and in_file:
+                writer.write(event.data)
+                if not event.more_data:
+                    # 目标文件已读完，剩余的请求体不再解析
+                    return filename
+            event = decoder.next_event()
+        if isinstance(event, Epilogue):
+            break
+
+    if filename is None:
+        raise UploadError('没有文件')
+    if in_file:
+        raise UploadError('文件内容不完整')
+    return filename
+
+
+def receive_upload(request, tmp_folder, max_size, field_name='file', allowed=None):
+    """
+    接收请求中的文件并写入 tmp_folder 下的临时文件
+    支持 multipart/form-data（field_name 字段）和原始请求体（文件名取 ?filename= 或 X-Filename 头）
+    allowed(filename) 返回 False 时在读取文件内容之前拒绝
+    超过 max_size 时抛出 UploadTooLarge，请求不合法时抛出 UploadError，两种情况临时文件都会删除
+    """
+    limit = max_size + (MULTIPART_OVERHEAD if request.mimetype == 'multipart/form-data' else 0)
+    if request.content_length is not None and request.content_length > limit:
+        # 不读取请求体，直接拒绝
+        raise UploadTooLarge(f'文件过大，最大支持 {format_size(max_size)}')
+
+    writer = _SpoolWriter(tmp_folder, max_size)
+    try:
+        if request.mimetype == 'multipart/form-data':
+            filename = _receive_multipart(request, writer, field_name, allowed)
+        elif request.mimetype == 'application/x-www-form-urlencoded':
+            raise UploadError('没有文件')
+        else:
+            filename = request.args.get('filename') or request.headers.get('X-Filename', '')
+            _check_filename(filename, allowed)
+            for chunk in _read_chunks(request.stream):
+                writer.write(chunk)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    return SpooledUpload(writer.path, filename, writer.size, writer.hasher.hexdigest())
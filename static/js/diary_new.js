@@ -239,11 +239,8 @@
                 continue;
             }
 
-            const formData = new FormData();
-            formData.append('image', file);
-
             try {
-                const response = await apiClient.post('/upload/image', formData);
+                const response = await apiClient.uploadImage(file);
                 const imageUrl = response?.data?.image_url || response?.data?.url;
 
                 if (imageUrl) {
@@ -328,16 +325,35 @@
         // 显示AI面板
         showAIPanel();
 
+        const analysisParams = {
+            emotions: state.selectedEmotions.map(e => e.name),
+            trigger_event: state.triggerEvent,
+            intensity: state.intensity,
+            content: state.diaryContent
+        };
+
         try {
-            const response = await apiClient.post(`/diary/${diaryId}/ai-analyze`, {
-                emotions: state.selectedEmotions.map(e => e.name),
-                trigger_event: state.triggerEvent,
-                intensity: state.intensity,
-                content: state.diaryContent
-            });
+            // 优先使用流式接口，首个token到达即开始显示
+            const analysis = await streamAIAnalysis(diaryId, analysisParams);
+            if (analysis) {
+                displayAIAnalysis(analysis);
+                return;
+            }
+        } catch (error) {
+            console.warn('流式分析不可用，改用后台任务:', error);
+        }
+
+        try {
+            const response = await apiClient.post(`/diary/${diaryId}/ai-analyze`, analysisParams);
 
-            if (response.data && response.data.analysis) {
-                displayAIAnalysis(response.data.analysis);
+            // 分析在后台队列中执行，接口返回任务ID
+            if (response.data && response.data.job_id) {
+                const job = await waitForAnalysisJob(response.data.job_id);
+                if (job.status === 'completed' && job.result) {
+                    displayAIAnalysis(job.result);
+                } else {
+                    displayAIError();
+                }
             }
         } catch (error) {
             console.error('AI分析失败:', error);
@@ -345,6 +361,93 @@
         }
     }
 
+    async function streamAIAnalysis(diaryId, analysisParams) {
+        const response = await fetch(`${window.location.origin}/api/diary/${diaryId}/ai-analyze/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${window.authManager.token}`
+            },
+            body: JSON.stringify(analysisParams)
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error(`Stream request failed: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let message = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const eventLine = frame.split('\n').find(line => line.startsWith('event: '));
+                const dataLine = frame.split('\n').find(line => line.startsWith('data: '));
+                if (!eventLine || !dataLine) continue;
+
+                const eventName = eventLine.slice(7);
+                const data = JSON.parse(dataLine.slice(6));
+
+                if (eventName === 'delta') {
+                    message += data.text;
+                    displayStreamingMessage(message);
+                } else if (eventName === 'result') {
+                    return data.analysis;
+                } else if (eventName === 'error') {
+                    displayAIError();
+                    return null;
+                }
+            }
+        }
+
+        return null;
+    }
+
+    function displayStreamingMessage(message) {
+        const box = document.createElement('p');
+        box.style.whiteSpace = 'pre-wrap';
+        box.style.lineHeight = '1.8';
+        box.textContent = message;
+
+        const html = `
+            <div class="ai-analysis-result">
+                <div class="analysis-section">
+                    <h5><i class="fas fa-comment-dots me-2"></i>AI情绪分析师的话</h5>
+                    <div class="user-message-box">${box.outerHTML}</div>
+                </div>
+            </div>
+        `;
+
+        if (elements.aiPanelContent) {
+            elements.aiPanelContent.innerHTML = html;
+        }
+        if (elements.drawerContent) {
+            elements.drawerContent.innerHTML = html;
+        }
+    }
+
+    async function waitForAnalysisJob(jobId, timeoutMs = 180000) {
+        const startedAt = Date.now();
+        while (Date.now() - startedAt < timeoutMs) {
+            const response = await apiClient.get(`/diary/jobs/${jobId}`);
+            const job = response.data && response.data.job;
+            if (job && (job.status === 'completed' || job.status === 'failed')) {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+        return { status: 'failed' };
+    }
+
     function showAIPanel() {
         // 桌面端
         if (elements.aiPanel) {
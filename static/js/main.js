@@ -360,6 +360,66 @@ class APIClient {
     async delete(endpoint, options = {}) {
         return this.request(endpoint, { method: 'DELETE', ...options });
     }
+
+    // 上传图片：先按 SHA-256 查询自己的日记是否已引用相同图片，命中时不再上传文件内容
+    async uploadImage(file) {
+        const sha256 = await this.sha256Hex(file);
+        if (sha256) {
+            try {
+                const existing = await this.get(`/upload/image/${sha256}`);
+                if (existing?.data?.exists) {
+                    return existing;
+                }
+            } catch (error) {
+                console.warn('图片查重失败，直接上传:', error);
+            }
+        }
+
+        const formData = new FormData();
+        formData.append('file', file);
+        return this.post('/upload/image', formData);
+    }
+
+    // crypto.subtle 仅在 HTTPS / localhost 下可用，不可用时返回 null
+    async sha256Hex(file) {
+        if (!window.crypto?.subtle || !file.arrayBuffer) {
+            return null;
+        }
+        const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest))
+            .map(byte => byte.toString(16).padStart(2, '0'))
+            .join('');
+    }
+}
+
+// 上传图片的缩略图（后台生成，与原图同目录，文件名为 <原文件名>_<尺寸>.<格式>）
+const IMAGE_VARIANT_WIDTHS = { thumb: 240, medium: 1280 };
+const IMAGE_FALLBACK_FORMATS = { jpg: 'jpg', jpeg: 'jpg', png: 'png', gif: 'png', webp: 'webp' };
+
+// 生成 <picture>：浏览器按 sizes 从缩略图中选择最小的合适尺寸，优先 WebP；
+// 缩略图尚未生成（404）时回退到原图
+function responsiveImageHtml(url, { sizes = '100vw', className = '', alt = '' } = {}) {
+    const match = /^(.*\/static\/uploads\/.+)\.([a-z0-9]+)$/i.exec(url || '');
+    const fallback = match && IMAGE_FALLBACK_FORMATS[match[2].toLowerCase()];
+    if (!fallback) {
+        return `<img src="${url}" alt="${alt}" class="${className}" loading="lazy">`;
+    }
+
+    const srcset = format => Object.entries(IMAGE_VARIANT_WIDTHS)
+        .map(([name, width]) => `${match[1]}_${name}.${format} ${width}w`)
+        .join(', ');
+    return `<picture>
+        <source type="image/webp" srcset="${srcset('webp')}" sizes="${sizes}">
+        <img src="${url}" srcset="${srcset(fallback)}" sizes="${sizes}" alt="${alt}" class="${className}"
+             loading="lazy" data-original="${url}" onerror="showOriginalImage(this)">
+    </picture>`;
+}
+
+function showOriginalImage(img) {
+    img.onerror = null;
+    img.parentNode.querySelectorAll('source').forEach(source => source.remove());
+    img.removeAttribute('srcset');
+    img.src = img.dataset.original;
 }
 
 // 表单验证工具
@@ -532,6 +592,8 @@ document.addEventListener('DOMContentLoaded', function() {
     window.showLoading = showLoading;
     window.formatDate = formatDate;
     window.FormValidator = FormValidator;
+    window.responsiveImageHtml = responsiveImageHtml;
+    window.showOriginalImage = showOriginalImage;
     window.Validators = Validators;
 
     console.log('CBT情绪日记游戏已加载完成');
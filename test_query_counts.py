@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+每个请求执行的 SQL 语句数回归测试：日记详情、分析结果只查一次，
+列表 include=analysis 时整页只多一条查询，不随条数增长
+运行: python -m pytest test_query_counts.py
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# 必须在导入 app 之前设置：独立的 SQLite 库、不启动后台分析线程、关闭接口缓存
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'query_counts.db')
+os.environ['SQLITE_PATH'] = DB_FILE
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+os.environ['ANALYSIS_WORKERS'] = '0'
+os.environ['CACHE_BACKEND'] = 'none'
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import app
+from models import EmotionAnalysis, EmotionDiary, GameProgress, User, db
+
+DIARY_COUNT = 8
+
+
+@pytest.fixture(scope='module')
+def client():
+    with app.app_context():
+        db.create_all()
+        user = User(username='counter', email='counter@example.com')
+        user.password_hash = 'x'
+        db.session.add(user)
+        db.session.flush()
+
+        for index in range(DIARY_COUNT):
+            diary = EmotionDiary(user_id=user.id, content=f'第{index}篇日记', analysis_status='completed')
+            db.session.add(diary)
+            db.session.flush()
+            db.session.add(EmotionAnalysis(diary_id=diary.id, overall_emotion='calm', emotion_intensity=0.5))
+            db.session.add(GameProgress(user_id=user.id, diary_id=diary.id, challenge_completed=True))
+        db.session.commit()
+
+        token = create_access_token(identity=str(user.id))
+        diary_id = diary.id
+
+    test_client = app.test_client()
+    test_client.headers = {'Authorization': f'Bearer {token}'}
+    test_client.diary_id = diary_id
+    yield test_client
+
+    with app.app_context():
+        db.drop_all()
+
+
+@contextmanager
+def count_statements():
+    """统计当前线程执行的 SQL 语句（忽略其他线程）"""
+    statements = []
+    thread_id = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread_id:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _get(client, url):
+    response = client.get(url, headers=client.headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def test_diary_detail_is_one_query(client):
+    with count_statements() as statements:
+        data = _get(client, f'/api/diary/{client.diary_id}')
+    assert data['diary']['analysis']['overall_emotion'] == 'calm'
+    assert len(statements) == 1, statements
+
+
+def test_analysis_detail_is_one_query(client):
+    with count_statements() as statements:
+        data = _get(client, f'/api/analysis/{client.diary_id}')
+    assert data['analysis']['overall_emotion'] == 'calm'
+    assert len(statements) == 1, statements
+
+
+def test_list_include_analysis_adds_one_query(client):
+    with count_statements() as plain:
+        _get(client, f'/api/diary/?limit={DIARY_COUNT}')
+    with count_statements() as included:
+        data = _get(client, f'/api/diary/?limit={DIARY_COUNT}&include=analysis,game_progress')
+
+    assert len(data['diaries']) == DIARY_COUNT
+    assert all(diary['analysis'] for diary in data['diaries'])
+    assert all(len(diary['game_progress']) == 1 for diary in data['diaries'])
+    # 两种关联数据各多一条 IN 查询
+    assert len(included) == len(plain) + 2, included
+
+
+def test_cursor_list_include_analysis_adds_one_query(client):
+    with count_statements() as plain:
+        _get(client, '/api/diary/?cursor=&limit=5')
+    with count_statements() as included:
+        data = _get(client, '/api/diary/?cursor=&limit=5&include=analysis')
+
+    assert all(diary['analysis'] for diary in data['diaries'])
+    assert len(included) == len(plain) + 1, included
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+查询计划回归测试：确认按用户的热点查询命中 models.py 中声明的索引
+SQLite 使用内存库；设置 TEST_MYSQL_URL（空的测试库）后同时检查 MySQL
+运行: python -m pytest test_query_plans.py
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from models import db
+
+TABLES = ['users', 'emotion_diaries', 'emotion_analysis', 'game_states', 'game_progress']
+
+# (说明, SQL, 期望命中的索引)
+HOT_QUERIES = [
+    (
+        '日记列表按时间倒序',
+        'SELECT id FROM emotion_diaries WHERE user_id = 3 ORDER BY created_at DESC LIMIT 20',
+        'ix_emotion_diaries_user_id_created_at'
+    ),
+    (
+        '日记按时间范围统计',
+        "SELECT COUNT(*) FROM emotion_diaries WHERE user_id = 3 AND created_at >= '2024-01-10'",
+        'ix_emotion_diaries_user_id_created_at'
+    ),
+    (
+        '首页最新日记流',
+        'SELECT id FROM emotion_diaries ORDER BY created_at DESC LIMIT 10',
+        'ix_emotion_diaries_created_at'
+    ),
+    (
+        '按日记取分析结果',
+        'SELECT id FROM emotion_analysis WHERE diary_id = 5',
+        'uq_emotion_analysis_diary_id'
+    ),
+    (
+        '分析结果按时间范围',
+        "SELECT id FROM emotion_analysis WHERE analyzed_at >= '2024-01-30'",
+        'ix_emotion_analysis_analyzed_at'
+    ),
+    (
+        '按用户取游戏状态',
+        'SELECT id FROM game_states WHERE user_id = 3',
+        'uq_game_states_user_id'
+    ),
+    (
+        '已完成挑战计数',
+        'SELECT COUNT(*) FROM game_progress WHERE user_id = 3 AND challenge_completed = 1',
+        'ix_game_progress_user_id_challenge_completed'
+    ),
+]
+
+
+def _create_schema(engine):
+    tables = [db.metadata.tables[name] for name in TABLES]
+    db.metadata.create_all(engine, tables=tables)
+
+    # 填充少量数据，避免优化器对空表给出特殊计划
+    base = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        for user_id in range(1, 21):
+            connection.execute(text(
+                "INSERT INTO users (id, username, email, password_hash) VALUES (:id, :name, :email, 'x')"
+            ), {'id': user_id, 'name': f'user{user_id}', 'email': f'user{user_id}@example.com'})
+            connection.execute(text(
+                'INSERT INTO game_states (user_id, current_level) VALUES (:user_id, 1)'
+            ), {'user_id': user_id})
+
+        diary_id = 0
+        for user_id in range(1, 21):
+            for day in range(30):
+                diary_id += 1
+                created_at = base + timedelta(days=day)
+                connection.execute(text(
+                    "INSERT INTO emotion_diaries (id, user_id, content, created_at, analysis_status) "
+                    "VALUES (:id, :user_id, 'content', :created_at, 'completed')"
+                ), {'id': diary_id, 'user_id': user_id, 'created_at': created_at})
+                connection.execute(text(
+                    "INSERT INTO emotion_analysis (diary_id, overall_emotion, analyzed_at) "
+                    "VALUES (:diary_id, 'calm', :analyzed_at)"
+                ), {'diary_id': diary_id, 'analyzed_at': created_at})
+                connection.execute(text(
+                    'INSERT INTO game_progress (user_id, diary_id, challenge_completed) '
+                    'VALUES (:user_id, :diary_id, :completed)'
+                ), {'user_id': user_id, 'diary_id': diary_id, 'completed': day % 2 == 0})
+
+
+def _sqlite_plan(connection, sql):
+    rows = connection.execute(text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+    return ' | '.join(str(row[-1]) for row in rows)
+
+
+def _mysql_plan(connection, sql):
+    rows = connection.execute(text(f'EXPLAIN {sql}')).mappings().fetchall()
+    return ' | '.join(str(row['key']) for row in rows)
+
+
+def _assert_plans(engine, explain):
+    with engine.connect() as connection:
+        for description, sql, index_name in HOT_QUERIES:
+            plan = explain(connection, sql)
+            assert index_name in plan, f'{description} 未使用索引 {index_name}: {plan}'
+
+
+def test_sqlite_hot_queries_use_indexes():
+    engine = create_engine('sqlite://')
+    _create_schema(engine)
+    with engine.begin() as connection:
+        connection.execute(text('ANALYZE'))
+    _assert_plans(engine, _sqlite_plan)
+
+
+def test_mysql_hot_queries_use_indexes():
+    url = os.getenv('TEST_MYSQL_URL')
+    if not url:
+        pytest.skip('未设置 TEST_MYSQL_URL')
+
+    engine = create_engine(url)
+    existing = set(inspect(engine).get_table_names())
+    if existing & set(TABLES):
+        pytest.skip('TEST_MYSQL_URL 必须指向空的测试库')
+
+    tables = [db.metadata.tables[name] for name in TABLES]
+    try:
+        _create_schema(engine)
+        with engine.begin() as connection:
+            connection.execute(text(f'ANALYZE TABLE {", ".join(TABLES)}'))
+        _assert_plans(engine, _mysql_plan)
+    finally:
+        db.metadata.drop_all(engine, tables=tables)
+
+
+if __name__ == '__main__':
+    test_sqlite_hot_queries_use_indexes()
+    print('SQLite 查询计划检查通过')